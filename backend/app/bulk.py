@@ -0,0 +1,198 @@
+import io
+import os
+import time
+from sqlalchemy import text
+
+from .metrics import db_query_seconds
+
+# Rows per multi-row INSERT / COPY round trip. Override per call or via env.
+BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', '1000'))
+# Below this many rows a COPY + merge costs more than multi-row INSERTs.
+COPY_THRESHOLD = int(os.getenv('BULK_COPY_THRESHOLD', '5000'))
+# Postgres caps bind parameters per statement at 65535.
+MAX_PARAMS = 65535
+
+
+def _chunks(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def _copy_value(value):
+    """Encode one value for COPY ... FROM STDIN text format."""
+    if value is None:
+        return '\\N'
+    s = str(value)
+    return s.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _upsert_copy(conn, table, columns, rows, key, update_columns, batch_size, casts=None):
+    """COPY rows into a temp staging table, then merge into `table` in one statement.
+
+    Like the VALUES path, only the last row for each key is kept, and `casts`
+    are applied as the staged rows are merged.
+    """
+    casts = casts or {}
+    stage = f'_stage_{table}'
+    cols = ', '.join(columns)
+    conn.execute(text(f"DROP TABLE IF EXISTS {stage}"))
+    conn.execute(text(f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {cols} FROM {table} WITH NO DATA"))
+
+    cursor = conn.connection.cursor()
+    try:
+        batches = 0
+        for chunk in _chunks(_last_per_key(rows, key), batch_size):
+            buf = io.StringIO()
+            for row in chunk:
+                buf.write('\t'.join(_copy_value(row.get(c)) for c in columns))
+                buf.write('\n')
+            buf.seek(0)
+            # a raw DBAPI call: the engine's statement timing never sees it
+            started = time.perf_counter()
+            cursor.copy_expert(f"COPY {stage} ({cols}) FROM STDIN", buf)
+            db_query_seconds.observe(time.perf_counter() - started, ('COPY',))
+            batches += 1
+    finally:
+        cursor.close()
+
+    selected = ', '.join(f"CAST({c} AS {casts[c]})" if c in casts else c for c in columns)
+    updates = ', '.join(f"{c}=EXCLUDED.{c}" for c in update_columns)
+    conn.execute(text(
+        f"INSERT INTO {table} ({cols}) SELECT {selected} FROM {stage} "
+        f"ON CONFLICT ({key}) DO UPDATE SET {updates}"
+    ))
+    return batches
+
+
+def _last_per_key(rows, key):
+    """Drop all but the last row for each key; one INSERT .. ON CONFLICT can't touch a row twice."""
+    names = [k.strip() for k in key.split(',')]
+    latest = {}
+    for row in rows:
+        latest[tuple(row.get(k) for k in names)] = row
+    return list(latest.values()) if len(latest) < len(rows) else rows
+
+
+def _upsert_values(conn, table, columns, rows, key, update_columns, batch_size, casts=None):
+    """One INSERT .. VALUES (..), (..) .. ON CONFLICT statement per batch, so a batch is one round trip."""
+    casts = casts or {}
+    cols = ', '.join(columns)
+    updates = ', '.join(f"{c}=EXCLUDED.{c}" for c in update_columns)
+    batch_size = max(1, min(batch_size, MAX_PARAMS // len(columns)))
+    statements = {}
+
+    def statement(n):
+        if n not in statements:
+            values = ', '.join(
+                '(' + ', '.join(f"CAST(:{c}_{i} AS {casts[c]})" if c in casts else f":{c}_{i}" for c in columns) + ')'
+                for i in range(n)
+            )
+            statements[n] = text(f"INSERT INTO {table} ({cols}) VALUES {values} ON CONFLICT ({key}) DO UPDATE SET {updates}")
+        return statements[n]
+
+    batches = 0
+    for chunk in _chunks(_last_per_key(rows, key), batch_size):
+        params = {f'{c}_{i}': row.get(c) for i, row in enumerate(chunk) for c in columns}
+        conn.execute(statement(len(chunk)), params)
+        batches += 1
+    return batches
+
+
+def _upsert_sqlite(conn, table, columns, rows, batch_size):
+    cols = ', '.join(columns)
+    values = ', '.join(f":{c}" for c in columns)
+    stmt = text(f"INSERT OR REPLACE INTO {table} ({cols}) VALUES ({values})")
+    batches = 0
+    for chunk in _chunks(rows, batch_size):
+        conn.execute(stmt, chunk)
+        batches += 1
+    return batches
+
+
+def bulk_upsert(conn, table, columns, rows, key, update_columns=None, batch_size=None, method=None, casts=None):
+    """Upsert a list of row dicts into `table`, keyed on the unique column `key`.
+
+    Postgres loads large sets through COPY into a staging table and merges with
+    ON CONFLICT; smaller sets (or method='values') send one multi-row
+    INSERT .. ON CONFLICT per batch. SQLite uses batched INSERT OR REPLACE.
+    `casts` maps column -> SQL type (e.g. {'data': 'jsonb'}). Both Postgres
+    paths keep only the last row for a repeated key.
+
+    Returns a stats dict with rows, batches, method, elapsed and rows_per_sec.
+    """
+    batch_size = batch_size or BATCH_SIZE
+    if update_columns is None:
+        update_columns = [c for c in columns if c != key]
+    dialect = conn.dialect.name
+    if method is None:
+        if dialect == 'postgresql':
+            method = 'copy' if len(rows) >= COPY_THRESHOLD else 'values'
+        else:
+            method = 'sqlite'
+
+    start = time.perf_counter()
+    if not rows:
+        batches = 0
+    elif method == 'copy':
+        batches = _upsert_copy(conn, table, columns, rows, key, update_columns, batch_size, casts)
+    elif method == 'values':
+        batches = _upsert_values(conn, table, columns, rows, key, update_columns, batch_size, casts)
+    else:
+        batches = _upsert_sqlite(conn, table, columns, rows, batch_size)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'rows': len(rows),
+        'batches': batches,
+        'method': method,
+        'elapsed': round(elapsed, 4),
+        'rows_per_sec': round(len(rows) / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+class BulkWriter:
+    """Accumulate rows from a stream (e.g. ESI pages) and bulk upsert them in chunks.
+
+    Rows are flushed once `flush_rows` are buffered, so writing overlaps with
+    fetching while Postgres still gets sets large enough to use COPY.
+    """
+
+    def __init__(self, conn, table, columns, key, update_columns=None, batch_size=None, casts=None, flush_rows=None):
+        self.conn = conn
+        self.table = table
+        self.columns = columns
+        self.key = key
+        self.update_columns = update_columns
+        self.batch_size = batch_size
+        self.casts = casts
+        if flush_rows is None:
+            flush_rows = COPY_THRESHOLD if conn.dialect.name == 'postgresql' else (batch_size or BATCH_SIZE)
+        self.flush_rows = flush_rows
+        self._buffer = []
+        self.stats = {'rows': 0, 'batches': 0, 'flushes': 0, 'methods': [], 'elapsed': 0.0}
+
+    def add(self, rows):
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        s = bulk_upsert(self.conn, self.table, self.columns, rows, self.key, self.update_columns,
+                        batch_size=self.batch_size, casts=self.casts)
+        self.stats['rows'] += s['rows']
+        self.stats['batches'] += s['batches']
+        self.stats['flushes'] += 1
+        self.stats['elapsed'] += s['elapsed']
+        if s['method'] not in self.stats['methods']:
+            self.stats['methods'].append(s['method'])
+
+    def close(self):
+        """Flush what is left and return the accumulated stats."""
+        self.flush()
+        elapsed = self.stats['elapsed']
+        self.stats['elapsed'] = round(elapsed, 4)
+        self.stats['rows_per_sec'] = round(self.stats['rows'] / elapsed, 1) if elapsed > 0 else None
+        return self.stats
@@ -2,11 +2,13 @@ import os
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
+from .metrics import instrument_engine
+
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///./test.db')
 
 connect_args = {}
 if DATABASE_URL.startswith('sqlite'):
     connect_args = {"check_same_thread": False}
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+engine = instrument_engine(create_engine(DATABASE_URL, connect_args=connect_args))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -0,0 +1,154 @@
+"""Resolved asset location hierarchy, materialized per character after each asset sync.
+
+An asset's location_id is either a station / structure / solar system, or the
+item_id of the container or ship it sits in. The sync resolves every item to
+its root location, depth (1 = directly in the root) and path, and stores:
+
+  esi_asset_locations  one row per item: root_location_id, parent_id, depth,
+                       path ('root/container/...'), type_id, quantity, value
+  esi_asset_closure    one row per (ancestor, item) pair, root included, with
+                       the distance between them
+
+so "everything under this station or container, at any depth" and per-root
+totals are each a single indexed query instead of a walk over esi_assets.
+"""
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..bulk import bulk_upsert
+from .valuation import PriceTable, unit_prices
+
+LOCATION_COLUMNS = ['character_id', 'item_id', 'type_id', 'quantity', 'value', 'parent_id', 'root_location_id',
+                    'depth', 'path', 'built_at']
+CLOSURE_COLUMNS = ['character_id', 'ancestor_id', 'item_id', 'distance']
+
+
+def _ensure_tree_tables(conn, dialect):
+    real = 'double precision' if dialect == 'postgresql' else 'REAL'
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS esi_asset_locations (item_id bigint PRIMARY KEY, character_id bigint NOT NULL, type_id integer, quantity integer, value {real}, parent_id bigint, root_location_id bigint, depth integer, path text, built_at timestamp);"))
+    conn.execute(text("CREATE TABLE IF NOT EXISTS esi_asset_closure (character_id bigint NOT NULL, ancestor_id bigint NOT NULL, item_id bigint NOT NULL, distance integer, PRIMARY KEY (character_id, ancestor_id, item_id));"))
+    # covering index for per-root totals
+    if dialect == 'postgresql':
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_esi_asset_locations_char_root ON esi_asset_locations (character_id, root_location_id) INCLUDE (quantity, value, depth);"))
+    else:
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_esi_asset_locations_char_root ON esi_asset_locations (character_id, root_location_id, quantity, value, depth);"))
+
+
+def resolve_locations(items) -> dict:
+    """Resolve (item_id, location_id) pairs to {item_id: (root_location_id, depth, path)}.
+
+    `path` is the tuple of ids from the root down to the item's direct parent.
+    Each item is walked at most once. A location that loops back on itself
+    (inconsistent ESI data) is treated as a root.
+    """
+    parent = dict(items)
+    resolved = {}
+    for item_id in parent:
+        chain, seen = [], set()
+        node = item_id
+        while node in parent and node not in resolved and node not in seen:
+            chain.append(node)
+            seen.add(node)
+            node = parent[node]
+        if node in resolved:
+            root, depth, path = resolved[node]
+            path = path + (node,)
+        else:
+            root, depth, path = node, 0, (node,)
+        for n in reversed(chain):
+            depth += 1
+            resolved[n] = (root, depth, path)
+            path = path + (n,)
+    return resolved
+
+
+def refresh_asset_tree(conn, character_id: int, prices: PriceTable = None) -> dict:
+    """Rebuild one character's rows in esi_asset_locations and esi_asset_closure from esi_assets."""
+    _ensure_tree_tables(conn, conn.dialect.name)
+    rows = conn.execute(
+        text("SELECT item_id, location_id, type_id, quantity FROM esi_assets WHERE character_id = :c"),
+        {'c': character_id},
+    ).fetchall()
+    conn.execute(text("DELETE FROM esi_asset_closure WHERE character_id = :c"), {'c': character_id})
+    conn.execute(text("DELETE FROM esi_asset_locations WHERE character_id = :c"), {'c': character_id})
+    if not rows:
+        return {'character_id': character_id, 'items': 0, 'roots': 0, 'max_depth': 0}
+
+    tree = resolve_locations((r[0], r[1]) for r in rows)
+    n = len(rows)
+    quantities = np.fromiter((1 if r[3] is None else r[3] for r in rows), dtype=np.float64, count=n)
+    unit = unit_prices(np.fromiter((r[2] or 0 for r in rows), dtype=np.int64, count=n), prices)
+    value = np.where(np.isnan(unit), np.nan, unit * quantities).tolist()
+
+    built_at = datetime.utcnow().isoformat()
+    locations, closure = [], []
+    for r, v in zip(rows, value):
+        root, depth, path = tree[r[0]]
+        locations.append({
+            'character_id': character_id, 'item_id': r[0], 'type_id': r[2], 'quantity': r[3],
+            'value': None if v != v else v, 'parent_id': r[1], 'root_location_id': root, 'depth': depth,
+            'path': '/'.join(map(str, path)), 'built_at': built_at,
+        })
+        closure.extend({'character_id': character_id, 'ancestor_id': a, 'item_id': r[0], 'distance': depth - i}
+                       for i, a in enumerate(path))
+    bulk_upsert(conn, 'esi_asset_locations', LOCATION_COLUMNS, locations, key='item_id')
+    bulk_upsert(conn, 'esi_asset_closure', CLOSURE_COLUMNS, closure, key='character_id, ancestor_id, item_id',
+                update_columns=['distance'])
+    return {'character_id': character_id, 'items': n, 'roots': len({t[0] for t in tree.values()}),
+            'max_depth': max(t[1] for t in tree.values())}
+
+
+def _totals(row) -> dict:
+    return {'items': row[0] or 0, 'quantity': row[1] or 0, 'value': float(row[2] or 0.0),
+            'unpriced': row[3] or 0, 'max_depth': row[4] or 0}
+
+
+def _query(conn, sql, params) -> list:
+    try:
+        return conn.execute(text(sql), params).fetchall()
+    except SQLAlchemyError:
+        # no asset sync has built the tree yet
+        return []
+
+
+def root_totals(conn, character_id: int) -> list:
+    """Item count, quantity, value and deepest nesting per root location, largest value first."""
+    rows = _query(conn,
+                  "SELECT root_location_id, COUNT(*), SUM(quantity), SUM(value), SUM(CASE WHEN value IS NULL THEN 1 ELSE 0 END), MAX(depth) "
+                  "FROM esi_asset_locations WHERE character_id = :c GROUP BY root_location_id",
+                  {'c': character_id})
+    out = [dict(location_id=r[0], **_totals(r[1:])) for r in rows]
+    out.sort(key=lambda t: (-t['value'], t['location_id']))
+    return out
+
+
+def location_totals(conn, character_id: int, location_id: int) -> dict:
+    """Totals for everything under `location_id` (a root or a container), at any depth."""
+    rows = _query(conn,
+                  "SELECT COUNT(*), SUM(l.quantity), SUM(l.value), SUM(CASE WHEN l.value IS NULL THEN 1 ELSE 0 END), MAX(c.distance) "
+                  "FROM esi_asset_closure c JOIN esi_asset_locations l ON l.item_id = c.item_id "
+                  "WHERE c.character_id = :c AND c.ancestor_id = :loc",
+                  {'c': character_id, 'loc': location_id})
+    return dict(location_id=location_id, **_totals(rows[0] if rows else (0,) * 5))
+
+
+def subtree(conn, character_id: int, location_id: int, limit: int = 100, after: int = None, max_depth: int = None) -> list:
+    """Items under `location_id` ordered by item_id; `after` continues from an item_id, `max_depth` limits nesting.
+
+    Rows are (item_id, type_id, quantity, value, parent_id, root_location_id, depth, path, distance).
+    """
+    sql = ("SELECT l.item_id, l.type_id, l.quantity, l.value, l.parent_id, l.root_location_id, l.depth, l.path, c.distance "
+           "FROM esi_asset_closure c JOIN esi_asset_locations l ON l.item_id = c.item_id "
+           "WHERE c.character_id = :c AND c.ancestor_id = :loc")
+    params = {'c': character_id, 'loc': location_id, 'lim': limit}
+    if after is not None:
+        sql += " AND c.item_id > :after"
+        params['after'] = after
+    if max_depth is not None:
+        sql += " AND c.distance <= :d"
+        params['d'] = max_depth
+    sql += " ORDER BY c.item_id LIMIT :lim"
+    return _query(conn, sql, params)
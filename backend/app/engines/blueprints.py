@@ -0,0 +1,187 @@
+"""Recipe graph over SDE blueprints, shared by the reaction planner and the BOM engine.
+
+Each blueprint activity that makes something (manufacturing, reaction) is a
+Recipe: product type and quantity per run, materials per run, and time per
+run. The graph indexes recipes by product and gives every type a level
+(raw materials are 0, a product is one above its deepest input), so a
+batch of demands can be expanded in one pass from the top level down and
+shared intermediates are only planned once.
+"""
+import json
+import math
+import heapq
+import time
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..db import engine
+from ..sde import sde_watch
+
+ACTIVITIES = ('manufacturing', 'reaction')
+# Don't hammer a missing sde_blueprints table: retry a failed load at most this often.
+RELOAD_BACKOFF = 60
+
+
+class Recipe:
+    def __init__(self, blueprint_id: int, activity: str, product_type: int, product_qty: int, materials: dict,
+                 time: int = 0, max_runs: int = None):
+        self.blueprint_id = blueprint_id
+        self.activity = activity
+        self.product_type = product_type
+        self.product_qty = product_qty
+        self.materials = materials
+        self.time = time
+        self.max_runs = max_runs
+
+
+def _type_id(m: dict) -> int:
+    return int(m.get('typeID', m.get('type_id', m.get('_key', 0))))
+
+
+def recipes_from_sde(obj: dict):
+    """Recipes for one blueprints.jsonl record (`activities` as dict or list of {_key, ...})."""
+    activities = obj.get('activities') or {}
+    if isinstance(activities, list):
+        activities = {a.get('_key'): a for a in activities}
+    blueprint_id = int(obj.get('blueprintTypeID', obj.get('_key', 0)))
+    out = []
+    for name in ACTIVITIES:
+        act = activities.get(name)
+        if not act or not act.get('products'):
+            continue
+        product = act['products'][0]
+        materials = {}
+        for m in act.get('materials') or ():
+            materials[_type_id(m)] = materials.get(_type_id(m), 0) + int(m['quantity'])
+        out.append(Recipe(blueprint_id, name, _type_id(product), int(product['quantity']), materials,
+                          int(act.get('time', 0)), obj.get('maxProductionLimit')))
+    return out
+
+
+class RecipeGraph:
+    """Recipes indexed by product, with per-type levels for top-down expansion."""
+
+    def __init__(self, recipes):
+        self.recipes = list(recipes)
+        self.by_product = {a: {} for a in ACTIVITIES}
+        for r in self.recipes:
+            self.by_product[r.activity].setdefault(r.product_type, r)
+        self.levels = {}
+        for r in self.recipes:
+            self._level(r.product_type, set())
+
+    def recipe(self, type_id: int, activities=ACTIVITIES):
+        """The recipe making `type_id` under the first of `activities` that has one, or None."""
+        for a in activities:
+            r = self.by_product[a].get(type_id)
+            if r is not None:
+                return r
+        return None
+
+    def _level(self, type_id, visiting):
+        if type_id in self.levels:
+            return self.levels[type_id]
+        recipes = [self.by_product[a][type_id] for a in ACTIVITIES if type_id in self.by_product[a]]
+        level = 0
+        if recipes:
+            if type_id in visiting:
+                raise ValueError(f'recipe cycle through type {type_id}')
+            visiting.add(type_id)
+            # above the inputs of every recipe for it, whichever activity a caller expands with
+            level = 1 + max((self._level(t, visiting) for r in recipes for t in r.materials), default=0)
+            visiting.discard(type_id)
+        self.levels[type_id] = level
+        return level
+
+    def level(self, type_id: int) -> int:
+        return self.levels.get(type_id, 0)
+
+
+def expand(graph: RecipeGraph, targets: dict, job, activities=ACTIVITIES, stop=None) -> dict:
+    """Expand {type_id: quantity} top-down into jobs and leaf materials.
+
+    Demand for every type is summed across all targets before its runs are
+    worked out, so an intermediate shared by several targets is planned once.
+    `job(recipe, runs)` returns {material: quantity} for that many runs (where
+    bonuses and rounding are applied). Types with no recipe under
+    `activities`, or for which `stop(type_id)` is true, are leaves.
+
+    Returns {'jobs': {type_id: {...}}, 'materials': {type_id: qty}} with jobs
+    ordered from the top level down.
+    """
+    demand = {}
+    for t, q in targets.items():
+        demand[int(t)] = demand.get(int(t), 0) + q
+    jobs, leaves = {}, {}
+    # deepest first: a type's inputs all sit on lower levels, so once it is
+    # popped nothing left can add demand for it
+    heap = [(-graph.level(t), t) for t in demand]
+    heapq.heapify(heap)
+    queued = set(demand)
+    while heap:
+        _, t = heapq.heappop(heap)
+        need = demand[t]
+        r = graph.recipe(t, activities)
+        if r is None or (stop is not None and stop(t)) or need <= 0:
+            if need > 0:
+                leaves[t] = leaves.get(t, 0) + need
+            continue
+        runs = math.ceil(need / r.product_qty)
+        materials = job(r, runs)
+        jobs[t] = {
+            'blueprint_id': r.blueprint_id,
+            'activity': r.activity,
+            'runs': runs,
+            'quantity': need,
+            'produced': runs * r.product_qty,
+            'surplus': runs * r.product_qty - need,
+            'materials': materials,
+        }
+        for m, q in materials.items():
+            demand[m] = demand.get(m, 0) + q
+            if m not in queued:
+                queued.add(m)
+                heapq.heappush(heap, (-graph.level(m), m))
+    return {'jobs': jobs, 'materials': leaves}
+
+
+def load_recipe_graph(bind=None) -> RecipeGraph:
+    """Read sde_blueprints (raw SDE import) into a RecipeGraph."""
+    with (bind if bind is not None else engine).connect() as conn:
+        rows = conn.execute(text("SELECT data FROM sde_blueprints")).fetchall()
+    recipes = []
+    for (data,) in rows:
+        recipes.extend(recipes_from_sde(json.loads(data) if isinstance(data, str) else data))
+    return RecipeGraph(recipes)
+
+
+class _GraphLoader:
+    """Process-wide recipe graph, loaded once and dropped when the SDE version changes."""
+
+    def __init__(self):
+        self._graph = None
+        self._failed_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        sde_watch.check()
+        if self._graph is None and time.monotonic() - self._failed_at >= RELOAD_BACKOFF:
+            with self._lock:
+                if self._graph is None:
+                    try:
+                        self._graph = load_recipe_graph()
+                    except SQLAlchemyError:
+                        # SDE not imported yet
+                        self._failed_at = time.monotonic()
+        return self._graph
+
+    def reset(self):
+        with self._lock:
+            self._graph = None
+            self._failed_at = 0.0
+
+
+recipe_graph = _GraphLoader()
+sde_watch.register(recipe_graph.reset)
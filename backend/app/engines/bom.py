@@ -0,0 +1,224 @@
+"""Manufacturing bill of materials over the shared SDE recipe graph.
+
+Two views of a build:
+
+- explode(): per-unit raw materials of one type at a given ME in a given
+  structure, memoized on (type, ME, structure profile). Component subtrees
+  are memoized the same way, so exploding many products that share
+  components (T2 parts, capital components) computes each subtree once.
+- build(): an exact plan for a batch of build lines, with whole runs and
+  per-job rounding. Demand for shared components is summed across every
+  line before their jobs are planned. Whole plans are cached on the lines,
+  the structure profile and the SDE version.
+
+The shared engine's memo is cleared when the SDE version changes.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+from ..sde import sde_watch
+from .blueprints import expand, recipe_graph
+
+# Engineering complex role bonuses (material, time) and ME/TE rig bonuses by tier.
+STRUCTURES = {
+    'station': (0.0, 0.0),
+    'raitaru': (0.01, 0.15),
+    'azbel': (0.01, 0.20),
+    'sotiyo': (0.01, 0.30),
+}
+RIG_MATERIAL_BONUS = {None: 0.0, 't1': 0.02, 't2': 0.024}
+RIG_TIME_BONUS = {None: 0.0, 't1': 0.20, 't2': 0.24}
+SECURITY_MULTIPLIER = {'high': 1.0, 'low': 1.9, 'null': 2.1}
+# ME/TE assumed for component blueprints that aren't given explicitly.
+COMPONENT_ME = 10
+COMPONENT_TE = 20
+CACHE_SIZE = 16384
+
+
+class StructureProfile:
+    """Material/time reduction (fractions) for manufacturing and reactions in one structure."""
+
+    def __init__(self, material_bonus: float = 0.0, time_bonus: float = 0.0, reaction_material_bonus: float = 0.0):
+        self.material_bonus = material_bonus
+        self.time_bonus = time_bonus
+        self.reaction_material_bonus = reaction_material_bonus
+        self.key = (round(material_bonus, 6), round(time_bonus, 6), round(reaction_material_bonus, 6))
+
+    @classmethod
+    def for_structure(cls, structure: str = 'station', rig: str = None, security: str = 'high',
+                      reaction_material_bonus: float = 0.0):
+        if structure not in STRUCTURES or rig not in RIG_MATERIAL_BONUS or security not in SECURITY_MULTIPLIER:
+            raise ValueError(f'unknown structure setup {structure}/{rig}/{security}')
+        role_me, role_te = STRUCTURES[structure]
+        mult = SECURITY_MULTIPLIER[security] if structure != 'station' else 0.0
+        material = 1 - (1 - role_me) * (1 - RIG_MATERIAL_BONUS[rig] * mult)
+        time_bonus = 1 - (1 - role_te) * (1 - RIG_TIME_BONUS[rig] * mult)
+        return cls(material, time_bonus, reaction_material_bonus)
+
+
+def material_factor(recipe, me: int, profile: StructureProfile) -> float:
+    if recipe.activity == 'reaction':
+        return 1.0 - profile.reaction_material_bonus
+    return (1.0 - me / 100.0) * (1.0 - profile.material_bonus)
+
+
+def job_materials(recipe, runs: int, me: int, profile: StructureProfile) -> dict:
+    """Materials for one job: each line reduced, rounded up, never below one per run."""
+    factor = material_factor(recipe, me, profile)
+    return {t: max(runs, math.ceil(round(runs * q * factor, 2))) for t, q in recipe.materials.items()}
+
+
+class BomEngine:
+    def __init__(self, graph=None, component_me: int = COMPONENT_ME, component_te: int = COMPONENT_TE,
+                 include_reactions: bool = True, cache_size: int = CACHE_SIZE):
+        self._graph = graph
+        self.component_me = component_me
+        self.component_te = component_te
+        self.activities = ('manufacturing', 'reaction') if include_reactions else ('manufacturing',)
+        self.cache_size = cache_size
+        self._memo = OrderedDict()
+        self._builds = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'build_hits': 0, 'build_misses': 0}
+
+    @property
+    def graph(self):
+        graph = self._graph if self._graph is not None else recipe_graph.get()
+        if graph is None:
+            raise ValueError('blueprints are not imported')
+        return graph
+
+    def explode(self, type_id: int, me: int = None, profile: StructureProfile = None) -> dict:
+        """Per-unit {'materials', 'components', 'depth'} for `type_id`, memoized on (type, ME, profile).
+
+        Quantities are fractional (no run rounding), which is what makes a
+        subtree reusable by every parent regardless of how much it builds.
+        """
+        sde_watch.check()
+        profile = profile or StructureProfile()
+        me = self.component_me if me is None else me
+        key = (type_id, me, profile.key)
+        with self._lock:
+            hit = self._memo.get(key)
+            if hit is not None:
+                self._memo.move_to_end(key)
+                self.stats['hits'] += 1
+                return hit
+            self.stats['misses'] += 1
+
+        recipe = self.graph.recipe(type_id, self.activities)
+        if recipe is None:
+            result = {'materials': {type_id: 1.0}, 'components': {}, 'depth': 0}
+        else:
+            factor = material_factor(recipe, me, profile) / recipe.product_qty
+            materials, components, depth = {}, {}, 0
+            for t, q in recipe.materials.items():
+                per_unit = q * factor
+                sub = self.explode(t, None, profile)
+                depth = max(depth, sub['depth'])
+                if sub['depth']:
+                    components[t] = components.get(t, 0.0) + per_unit
+                for c, n in sub['components'].items():
+                    components[c] = components.get(c, 0.0) + per_unit * n
+                for m, n in sub['materials'].items():
+                    materials[m] = materials.get(m, 0.0) + per_unit * n
+            result = {'materials': materials, 'components': components, 'depth': depth + 1}
+
+        with self._lock:
+            self._memo[key] = result
+            while len(self._memo) > self.cache_size:
+                self._memo.popitem(last=False)
+        return result
+
+    def estimate(self, lines, profile: StructureProfile = None) -> dict:
+        """Sum per-unit explosions over build lines ({type_id, quantity, me}); fast, unrounded."""
+        total = {}
+        for line in lines:
+            sub = self.explode(int(line['type_id']), line.get('me'), profile)
+            for m, n in sub['materials'].items():
+                total[m] = total.get(m, 0.0) + n * line['quantity']
+        return total
+
+    def build(self, lines, profile: StructureProfile = None) -> dict:
+        """Exact plan for build lines: whole runs per job, shared components planned once.
+
+        Each line is {type_id, quantity, me?, te?}. Top-level jobs use the
+        line's ME/TE; component jobs use the engine's component ME/TE.
+        """
+        version = sde_watch.check()
+        profile = profile or StructureProfile()
+        lines = tuple(
+            (int(line['type_id']), int(line['quantity']),
+             self.component_me if line.get('me') is None else line['me'],
+             self.component_te if line.get('te') is None else line['te'])
+            for line in lines
+        )
+        key = (lines, profile.key, version)
+        with self._lock:
+            hit = self._builds.get(key)
+            if hit is not None:
+                self._builds.move_to_end(key)
+                self.stats['build_hits'] += 1
+                return hit
+            self.stats['build_misses'] += 1
+
+        result = self._build(lines, profile)
+        with self._lock:
+            self._builds[key] = result
+            while len(self._builds) > self.cache_size:
+                self._builds.popitem(last=False)
+        return result
+
+    def _build(self, lines, profile):
+        graph = self.graph
+        top, demand = [], {}
+        for type_id, quantity, me, te in lines:
+            recipe = graph.recipe(type_id, self.activities)
+            if recipe is None:
+                raise ValueError(f'no blueprint makes type {type_id}')
+            runs = math.ceil(quantity / recipe.product_qty)
+            materials = job_materials(recipe, runs, me, profile)
+            top.append({
+                'type_id': type_id,
+                'blueprint_id': recipe.blueprint_id,
+                'activity': recipe.activity,
+                'runs': runs,
+                'quantity': quantity,
+                'me': me,
+                'materials': materials,
+                'time_seconds': self._time(recipe, runs, te, profile),
+            })
+            for m, q in materials.items():
+                demand[m] = demand.get(m, 0) + q
+
+        def job(recipe, runs):
+            return job_materials(recipe, runs, self.component_me, profile)
+
+        tree = expand(graph, demand, job, activities=self.activities)
+        components = []
+        for type_id, j in tree['jobs'].items():
+            recipe = graph.recipe(type_id, self.activities)
+            components.append(dict(j, type_id=type_id,
+                                   time_seconds=self._time(recipe, j['runs'], self.component_te, profile)))
+        return {
+            'lines': top,
+            'components': components,
+            'materials': tree['materials'],
+            'total_time_seconds': sum(j['time_seconds'] for j in top + components),
+        }
+
+    def _time(self, recipe, runs, te, profile):
+        if recipe.activity == 'reaction':
+            return math.ceil(recipe.time * runs * (1 - profile.time_bonus))
+        return math.ceil(recipe.time * runs * (1 - te / 100.0) * (1 - profile.time_bonus))
+
+    def clear(self):
+        with self._lock:
+            self._memo.clear()
+            self._builds.clear()
+
+
+# Shared by routes in this process.
+bom_engine = BomEngine()
+sde_watch.register(bom_engine.clear)
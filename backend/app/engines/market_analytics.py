@@ -0,0 +1,249 @@
+"""Vectorized analytics over ESI market history.
+
+History for many types is loaded into dense (types x days) NumPy arrays on a
+shared date axis, so every indicator is a handful of array operations over
+the whole batch rather than a Python loop per type. Missing days are NaN
+prices and zero volume. Results are cached per (region, type, day).
+"""
+import os
+import asyncio
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+from ..services.cache import LRUBackend, RedisBackend
+from ..services.http import run_sync
+from ..services.market import get_price_history
+
+# 'memory' keeps results per process; 'redis' shares them across API processes and workers.
+ANALYTICS_BACKEND = os.getenv('MARKET_ANALYTICS_BACKEND', 'memory')
+HISTORY_DAYS = int(os.getenv('MARKET_HISTORY_DAYS', '90'))
+FETCH_CONCURRENCY = int(os.getenv('MARKET_FETCH_CONCURRENCY', '16'))
+SHORT_WINDOW = 7
+LONG_WINDOW = 30
+# SMA spread (short vs long) needed before a type is called trending.
+TREND_THRESHOLD = 0.02
+RESULT_TTL = 2 * 86400
+
+FIELDS = ('average', 'highest', 'lowest', 'volume', 'order_count')
+
+
+class HistoryMatrix:
+    """Market history of many types aligned on one date axis.
+
+    `type_ids` is an int64 array of row labels, `dates` a datetime64[D] array
+    of column labels ending at `end`; every field in FIELDS is a float64
+    array of shape (len(type_ids), len(dates)).
+    """
+
+    def __init__(self, type_ids, dates, arrays):
+        self.type_ids = type_ids
+        self.dates = dates
+        self.arrays = arrays
+
+    def __getattr__(self, name):
+        if name in FIELDS:
+            return self.arrays[name]
+        raise AttributeError(name)
+
+    @classmethod
+    def from_histories(cls, histories: dict, end=None, days: int = HISTORY_DAYS):
+        """Build from {type_id: [ESI history rows]}, keeping the `days` days up to `end`."""
+        end = np.datetime64(end or _today(), 'D')
+        start = end - (days - 1)
+        type_ids = np.fromiter(histories.keys(), dtype=np.int64, count=len(histories))
+        rows = [r for h in histories.values() for r in (h or ())]
+        counts = np.fromiter((len(h or ()) for h in histories.values()), dtype=np.int64, count=len(histories))
+
+        arrays = {f: np.full((len(type_ids), days), np.nan) for f in FIELDS}
+        arrays['volume'][:] = 0.0
+        arrays['order_count'][:] = 0.0
+        if rows:
+            row_idx = np.repeat(np.arange(len(type_ids)), counts)
+            col_idx = (np.array([r['date'] for r in rows], dtype='datetime64[D]') - start).astype(np.int64)
+            keep = (col_idx >= 0) & (col_idx < days)
+            for f in FIELDS:
+                values = np.array([r.get(f, np.nan) for r in rows], dtype=np.float64)
+                arrays[f][row_idx[keep], col_idx[keep]] = values[keep]
+        dates = start + np.arange(days)
+        return cls(type_ids, dates, arrays)
+
+
+def _today():
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def rolling_mean(x, window: int):
+    """NaN-aware trailing mean over `window` columns for every row at once.
+
+    Column j is the mean of the non-NaN values in x[:, j-window+1 : j+1]
+    (NaN when there are none).
+    """
+    valid = ~np.isnan(x)
+    sums = np.cumsum(np.where(valid, x, 0.0), axis=1)
+    counts = np.cumsum(valid, axis=1)
+    sums[:, window:] = sums[:, window:] - sums[:, :-window]
+    counts[:, window:] = counts[:, window:] - counts[:, :-window]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def _masked_mean(x, mask, axis=1):
+    n = mask.sum(axis=axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 0, np.where(mask, x, 0.0).sum(axis=axis) / n, np.nan), n
+
+
+def compute_indicators(m: HistoryMatrix, short: int = SHORT_WINDOW, long: int = LONG_WINDOW) -> dict:
+    """Return {name: array over m.type_ids} for the last day of the matrix.
+
+    - last_price: most recent average price
+    - sma_short / sma_long: trailing means of the daily average price
+    - vwap: volume-weighted average price over the long window
+    - volatility: std dev of daily log returns over the long window
+    - trend: fitted daily % change of log price over the long window
+    - avg_volume: mean daily volume over the long window (missing days count as 0)
+    - signal: 1 up, -1 down, 0 flat (short/long SMA spread agreeing with the trend)
+    """
+    price = m.average
+    volume = m.volume
+    n, days = price.shape
+    long = min(long, days)
+    short = min(short, long)
+    valid = ~np.isnan(price)
+
+    has = valid.any(axis=1)
+    last_idx = days - 1 - np.argmax(valid[:, ::-1], axis=1)
+    last_price = np.where(has, price[np.arange(n), last_idx], np.nan)
+
+    sma_short = rolling_mean(price[:, -short:], short)[:, -1]
+    sma_long = rolling_mean(price[:, -long:], long)[:, -1]
+
+    p = price[:, -long:]
+    v = volume[:, -long:]
+    pv_mask = ~np.isnan(p)
+    vol_sum = np.where(pv_mask, v, 0.0).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vwap = np.where(vol_sum > 0, np.where(pv_mask, p * v, 0.0).sum(axis=1) / vol_sum, np.nan)
+        logp = np.log(np.where(p > 0, p, np.nan))
+    avg_volume = v.sum(axis=1) / long
+
+    returns = np.diff(logp, axis=1)
+    r_mask = ~np.isnan(returns)
+    r_mean, r_n = _masked_mean(returns, r_mask)
+    r_var, _ = _masked_mean((returns - r_mean[:, None]) ** 2, r_mask)
+    volatility = np.where(r_n > 1, np.sqrt(r_var), np.nan)
+
+    # least-squares slope of log price against day index, per row, ignoring gaps
+    l_mask = ~np.isnan(logp)
+    x = np.broadcast_to(np.arange(long, dtype=np.float64), logp.shape)
+    x_mean, l_n = _masked_mean(x, l_mask)
+    y_mean, _ = _masked_mean(logp, l_mask)
+    dx = np.where(l_mask, x - x_mean[:, None], 0.0)
+    dy = np.where(l_mask, logp - y_mean[:, None], 0.0)
+    sxx = (dx * dx).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = np.where((l_n > 1) & (sxx > 0), (dx * dy).sum(axis=1) / sxx, np.nan)
+        spread = sma_short / sma_long - 1.0
+    trend = np.expm1(slope)
+
+    signal = np.select(
+        [(spread > TREND_THRESHOLD) & (trend > 0), (spread < -TREND_THRESHOLD) & (trend < 0)],
+        [1, -1],
+        0,
+    )
+    return {
+        'last_price': last_price,
+        'sma_short': sma_short,
+        'sma_long': sma_long,
+        'vwap': vwap,
+        'volatility': volatility,
+        'trend': trend,
+        'avg_volume': avg_volume,
+        'signal': signal,
+    }
+
+
+def _records(type_ids, indicators: dict) -> dict:
+    """Turn per-type arrays into {type_id: {name: float | None}}."""
+    cols = {k: v.tolist() for k, v in indicators.items()}
+    out = {}
+    for i, tid in enumerate(type_ids.tolist()):
+        out[tid] = {k: (None if isinstance(c[i], float) and c[i] != c[i] else c[i]) for k, c in cols.items()}
+    return out
+
+
+async def fetch_histories_async(region_id: int, type_ids, concurrency: int = None) -> dict:
+    """Fetch history for many types concurrently; types ESI has no history for map to []."""
+    sem = asyncio.Semaphore(concurrency or FETCH_CONCURRENCY)
+
+    async def one(tid):
+        async with sem:
+            try:
+                return tid, await get_price_history(region_id, tid)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code in (400, 404):
+                    return tid, []
+                raise
+
+    return dict(await asyncio.gather(*(one(t) for t in type_ids)))
+
+
+class MarketAnalytics:
+    """Indicator results per (region, type, day), computed in batches for the misses."""
+
+    def __init__(self, backend=None, days: int = HISTORY_DAYS):
+        self.backend = backend if backend is not None else LRUBackend(maxsize=65536)
+        self.days = days
+        self.stats = {'hits': 0, 'computed': 0}
+
+    @staticmethod
+    def key(region_id, type_id, day):
+        return f'{region_id}:{type_id}:{day}'
+
+    def _cached(self, region_id, type_ids, day):
+        found, missing = {}, []
+        for tid in type_ids:
+            entry = self.backend.get(self.key(region_id, tid, day))
+            if entry is None:
+                missing.append(tid)
+            else:
+                found[tid] = entry
+        self.stats['hits'] += len(found)
+        return found, missing
+
+    def compute(self, region_id: int, histories: dict, day: str = None) -> dict:
+        """Compute and cache indicators for already-loaded {type_id: history rows}."""
+        day = day or _today()
+        if not histories:
+            return {}
+        m = HistoryMatrix.from_histories(histories, end=day, days=self.days)
+        results = _records(m.type_ids, compute_indicators(m))
+        for tid, entry in results.items():
+            self.backend.set(self.key(region_id, tid, day), entry, ttl=RESULT_TTL)
+        self.stats['computed'] += len(results)
+        return results
+
+    async def analyze_async(self, region_id: int, type_ids, day: str = None) -> dict:
+        """Return {type_id: indicators}, fetching and computing only types not cached for `day`."""
+        day = day or _today()
+        type_ids = list(dict.fromkeys(int(t) for t in type_ids))
+        found, missing = self._cached(region_id, type_ids, day)
+        if missing:
+            histories = await fetch_histories_async(region_id, missing)
+            found.update(self.compute(region_id, histories, day))
+        return {tid: found[tid] for tid in type_ids}
+
+    def analyze(self, region_id: int, type_ids, day: str = None) -> dict:
+        return run_sync(self.analyze_async(region_id, type_ids, day))
+
+
+def _make_analytics():
+    if ANALYTICS_BACKEND == 'redis':
+        return MarketAnalytics(RedisBackend(prefix='market:analytics:'))
+    return MarketAnalytics()
+
+
+# Shared by routes and tasks in this process.
+market_analytics = _make_analytics()
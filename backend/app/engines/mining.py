@@ -1,10 +1,16 @@
+import numpy as np
+
+SKILL_BONUS_PER_LEVEL = 0.02
+DEFAULT_BASE_YIELD = 100
+
+
 def compute_mining_yield(skills: dict, ship: dict, boosts: dict) -> dict:
     """Return an estimated mining yield summary (stub).
     skills, ship, and boosts are dictionaries describing character and equipment.
     """
     # Placeholder algorithm
-    base_yield = ship.get('base_yield', 100)
-    skill_bonus = 1.0 + (skills.get('mining', 0) * 0.02)
+    base_yield = ship.get('base_yield', DEFAULT_BASE_YIELD)
+    skill_bonus = 1.0 + (skills.get('mining', 0) * SKILL_BONUS_PER_LEVEL)
     boost_bonus = 1.0 + boosts.get('fleet_bonus', 0)
     result = {
         'yield_per_hour': base_yield * skill_bonus * boost_bonus,
@@ -15,3 +21,85 @@ def compute_mining_yield(skills: dict, ship: dict, boosts: dict) -> dict:
         }
     }
     return result
+
+
+class MiningYieldBatch:
+    """Array-backed result of compute_mining_yield_batch.
+
+    Every array broadcasts to `shape`: (skills, ships, boosts[, ores]) for a
+    cross product, or (n[, ores]) when the inputs are zipped row by row.
+    `units_per_hour` is only set when ore volumes are known.
+    """
+
+    def __init__(self, skill_bonus, boost_bonus, base_yield, yield_per_hour, units_per_hour=None, axes=()):
+        self.skill_bonus = skill_bonus
+        self.boost_bonus = boost_bonus
+        self.base_yield = base_yield
+        self.yield_per_hour = yield_per_hour
+        self.units_per_hour = units_per_hour
+        self.axes = axes
+
+    @property
+    def shape(self):
+        return self.yield_per_hour.shape
+
+    def __len__(self):
+        return self.yield_per_hour.size
+
+    def columns(self) -> dict:
+        """Flatten to equal-length lists (C order), one per field, for JSON."""
+        shape = self.shape
+        out = {
+            'base_yield': np.broadcast_to(self.base_yield, shape).ravel().tolist(),
+            'skill_bonus': np.broadcast_to(self.skill_bonus, shape).ravel().tolist(),
+            'boost_bonus': np.broadcast_to(self.boost_bonus, shape).ravel().tolist(),
+            'yield_per_hour': self.yield_per_hour.ravel().tolist(),
+        }
+        if self.units_per_hour is not None:
+            out['units_per_hour'] = np.nan_to_num(self.units_per_hour, nan=0.0).ravel().tolist()
+        return out
+
+    def summary(self) -> dict:
+        y = self.yield_per_hour
+        best = np.unravel_index(np.argmax(y), y.shape) if y.size else ()
+        return {
+            'count': int(y.size),
+            'min': float(y.min()) if y.size else 0.0,
+            'max': float(y.max()) if y.size else 0.0,
+            'mean': float(y.mean()) if y.size else 0.0,
+            'best_index': dict(zip(self.axes, (int(i) for i in best))),
+        }
+
+
+def compute_mining_yield_batch(mining_skills, base_yields, fleet_bonuses, ore_volumes=None,
+                               cross: bool = True) -> MiningYieldBatch:
+    """Vectorized compute_mining_yield over column arrays.
+
+    With `cross` (the default) every skill level is combined with every ship
+    and every boost, giving shape (skills, ships, boosts). Otherwise the three
+    columns are zipped into one row per pilot. `ore_volumes` (m3 per unit)
+    adds a trailing ore axis with units mined per hour.
+    """
+    skills = np.asarray(mining_skills, dtype=np.float64)
+    base = np.asarray(base_yields, dtype=np.float64)
+    boosts = np.asarray(fleet_bonuses, dtype=np.float64)
+    if cross:
+        skills, base, boosts = skills[:, None, None], base[None, :, None], boosts[None, None, :]
+        axes = ('skill', 'ship', 'boost')
+    else:
+        skills, base, boosts = np.broadcast_arrays(skills, base, boosts)
+        axes = ('pilot',)
+
+    skill_bonus = 1.0 + skills * SKILL_BONUS_PER_LEVEL
+    boost_bonus = 1.0 + boosts
+    yield_per_hour = base * skill_bonus * boost_bonus
+
+    units = None
+    if ore_volumes is not None:
+        volumes = np.asarray(ore_volumes, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            units = np.where(volumes > 0, yield_per_hour[..., None] / volumes, np.nan)
+        yield_per_hour = np.broadcast_to(yield_per_hour[..., None], units.shape)
+        skill_bonus, boost_bonus, base = skill_bonus[..., None], boost_bonus[..., None], base[..., None]
+        axes += ('ore',)
+    return MiningYieldBatch(skill_bonus, boost_bonus, base, yield_per_hour, units, axes)
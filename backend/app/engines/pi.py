@@ -1,6 +1,359 @@
-def compute_pi_output(planets: list, extractors: dict) -> dict:
-    """Return a summary of PI outputs per day (stub)."""
+"""Planetary interaction production chains.
+
+Schematics from the SDE form a DAG from raw P0 resources up to P4 products.
+A colony is a list of planets, each with extractors (P0 units/hour) and
+factories (schematic + count). Planets are evaluated in order of the
+highest tier they build: each one draws inputs from its own extractors
+first and then from the colony pool of surplus from earlier planets, and
+it puts its own surplus back into the pool.
+
+Planet results are memoized on (planet config, imports it drew from the
+pool), so after a one-planet change only that planet and the planets
+downstream of the products it changed are recomputed.
+"""
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..db import engine
+from ..sde import sde_watch
+
+SECONDS_PER_HOUR = 3600
+# Don't hammer a missing sde_planetSchematics table: retry a failed load at most this often.
+RELOAD_BACKOFF = 60
+MEMO_SIZE = 4096
+
+
+class Schematic:
+    def __init__(self, schematic_id: int, name: str, cycle_time: int, output_type: int, output_qty: int, inputs: dict):
+        self.schematic_id = schematic_id
+        self.name = name
+        self.cycle_time = cycle_time
+        self.output_type = output_type
+        self.output_qty = output_qty
+        self.inputs = inputs
+
+    @property
+    def cycles_per_hour(self) -> float:
+        return SECONDS_PER_HOUR / self.cycle_time
+
+    @classmethod
+    def from_sde(cls, obj: dict):
+        """Build from a planetSchematics record; `types` may be a dict or a list of {_key, ...}."""
+        types = obj.get('types') or {}
+        if isinstance(types, dict):
+            types = [dict(v, _key=k) for k, v in types.items()]
+        inputs, output = {}, None
+        for t in types:
+            type_id = int(t.get('_key', t.get('typeID', 0)))
+            if t.get('isInput'):
+                inputs[type_id] = int(t['quantity'])
+            else:
+                output = (type_id, int(t['quantity']))
+        if output is None:
+            return None
+        name = obj.get('name')
+        if isinstance(name, dict):
+            name = name.get('en')
+        schematic_id = int(obj.get('_key', obj.get('schematicID', 0)))
+        return cls(schematic_id, name, int(obj.get('cycleTime', SECONDS_PER_HOUR)), output[0], output[1], inputs)
+
+
+class SchematicGraph:
+    """Schematic DAG with per-type tiers (P0 = 0) and producer lookup."""
+
+    def __init__(self, schematics):
+        self.schematics = {s.schematic_id: s for s in schematics}
+        self.producers = {s.output_type: s for s in self.schematics.values()}
+        self.tiers = {}
+        for s in self.schematics.values():
+            self._tier(s.output_type, set())
+        self.order = sorted(self.schematics.values(), key=lambda s: (self.tiers[s.output_type], s.schematic_id))
+        self.fingerprint = _digest(sorted(
+            (s.schematic_id, s.cycle_time, s.output_type, s.output_qty, sorted(s.inputs.items()))
+            for s in self.schematics.values()
+        ))
+        self._requirements = {}
+
+    def _tier(self, type_id, visiting):
+        if type_id in self.tiers:
+            return self.tiers[type_id]
+        s = self.producers.get(type_id)
+        if s is None:
+            tier = 0
+        else:
+            if type_id in visiting:
+                raise ValueError(f'schematic cycle through type {type_id}')
+            visiting.add(type_id)
+            tier = 1 + max((self._tier(t, visiting) for t in s.inputs), default=0)
+            visiting.discard(type_id)
+        self.tiers[type_id] = tier
+        return tier
+
+    def tier(self, type_id) -> int:
+        return self.tiers.get(type_id, 0)
+
+    def requirements(self, type_id) -> dict:
+        """P0 units needed per unit of `type_id`, memoized per type across the whole chain."""
+        cached = self._requirements.get(type_id)
+        if cached is not None:
+            return cached
+        s = self.producers.get(type_id)
+        if s is None:
+            out = {type_id: 1.0}
+        else:
+            out = {}
+            for t, qty in s.inputs.items():
+                for p0, n in self.requirements(t).items():
+                    out[p0] = out.get(p0, 0.0) + n * qty / s.output_qty
+        self._requirements[type_id] = out
+        return out
+
+
+def _digest(obj) -> str:
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _extractor_rate(e: dict) -> float:
+    if 'units_per_hour' in e:
+        return float(e['units_per_hour'])
+    return float(e.get('qty_per_cycle', 0)) * SECONDS_PER_HOUR / float(e.get('cycle_time') or SECONDS_PER_HOUR)
+
+
+def _add(d, k, v):
+    if v:
+        d[k] = d.get(k, 0.0) + v
+
+
+def evaluate_planet(graph: SchematicGraph, planet: dict, imports: dict = None) -> dict:
+    """Throughput of one planet given optional per-hour `imports`.
+
+    Factories of the same tier share each input in proportion to their
+    demand at full speed. A factory's `bottleneck` is the input that limits
+    it, or None when it runs at capacity.
+    """
+    supply = {}
+    extracted = {}
+    for e in planet.get('extractors') or ():
+        rate = _extractor_rate(e)
+        _add(extracted, int(e['type_id']), rate)
+        _add(supply, int(e['type_id']), rate)
+    for t, qty in (imports or {}).items():
+        _add(supply, t, qty)
+
+    by_tier = {}
+    for f in planet.get('factories') or ():
+        s = graph.schematics.get(int(f['schematic_id']))
+        if s is None:
+            raise ValueError(f"unknown schematic {f['schematic_id']}")
+        by_tier.setdefault(graph.tier(s.output_type), []).append((s, int(f.get('count', 1))))
+
+    factories, produced, consumed = [], {}, {}
+    for tier in sorted(by_tier):
+        group = by_tier[tier]
+        demand = {}
+        for s, count in group:
+            for t, qty in s.inputs.items():
+                _add(demand, t, count * s.cycles_per_hour * qty)
+        share = {t: min(1.0, supply.get(t, 0.0) / d) for t, d in demand.items()}
+        for s, count in group:
+            capacity = count * s.cycles_per_hour
+            limit, bottleneck = 1.0, None
+            for t in s.inputs:
+                if share.get(t, 1.0) < limit:
+                    limit, bottleneck = share[t], t
+            cycles = capacity * limit
+            for t, qty in s.inputs.items():
+                _add(consumed, t, cycles * qty)
+                supply[t] = supply.get(t, 0.0) - cycles * qty
+            _add(produced, s.output_type, cycles * s.output_qty)
+            _add(supply, s.output_type, cycles * s.output_qty)
+            factories.append({
+                'schematic_id': s.schematic_id,
+                'output_type': s.output_type,
+                'count': count,
+                'cycles_per_hour': cycles,
+                'utilization': limit,
+                'bottleneck': bottleneck,
+            })
+
+    # own output is used before imports; whatever is still short was drawn from the pool
+    own = dict(extracted)
+    for t, v in produced.items():
+        _add(own, t, v)
+    drawn = {t: min(qty, max(0.0, consumed.get(t, 0.0) - own.get(t, 0.0))) for t, qty in (imports or {}).items()}
+    surplus = {t: v - consumed.get(t, 0.0) for t, v in own.items() if v - consumed.get(t, 0.0) > 1e-9}
+    return {
+        'planet_id': planet.get('planet_id'),
+        'extracted': extracted,
+        'produced': produced,
+        'consumed': consumed,
+        'imported': {t: v for t, v in drawn.items() if v > 1e-9},
+        'surplus': surplus,
+        'factories': factories,
+        'bottlenecks': sorted({f['bottleneck'] for f in factories if f['bottleneck'] is not None}),
+    }
+
+
+class PIMemo:
+    """LRU of planet results keyed on (graph, planet config, imports drawn from the pool)."""
+
+    def __init__(self, maxsize: int = MEMO_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is not None:
+                self._data.move_to_end(key)
+                self.stats['hits'] += 1
+                return hit
+            self.stats['misses'] += 1
+        result = compute()
+        with self._lock:
+            self._data[key] = result
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def _needs(graph, planet) -> set:
+    types = set()
+    for f in planet.get('factories') or ():
+        s = graph.schematics.get(int(f['schematic_id']))
+        if s is not None:
+            types.update(s.inputs)
+    return types
+
+
+def _stage(graph, planet) -> int:
+    return max((graph.tier(graph.schematics[int(f['schematic_id'])].output_type)
+                for f in planet.get('factories') or () if int(f['schematic_id']) in graph.schematics), default=0)
+
+
+def evaluate_colony(graph: SchematicGraph, planets: list, memo: PIMemo = None) -> dict:
+    """Evaluate every planet against the shared pool and sum the colony's throughput."""
+    memo = memo if memo is not None else pi_memo
+    ordered = sorted(enumerate(planets), key=lambda p: (_stage(graph, p[1]), p[0]))
+    pool, results = {}, [None] * len(planets)
+    for i, planet in ordered:
+        imports = {t: pool[t] for t in sorted(_needs(graph, planet)) if pool.get(t, 0.0) > 1e-9}
+        key = (graph.fingerprint, _digest(planet), _digest(sorted(imports.items())))
+        r = memo.get_or_compute(key, lambda: evaluate_planet(graph, planet, imports))
+        for t, v in r['imported'].items():
+            pool[t] -= v
+        for t, v in r['surplus'].items():
+            _add(pool, t, v)
+        results[i] = r
+
+    exports = {t: v for t, v in pool.items() if v > 1e-9}
+    top = max((graph.tier(t) for t in exports), default=0)
+    return {
+        'planets': results,
+        'exports_per_hour': exports,
+        'final_products': {t: v for t, v in exports.items() if graph.tier(t) == top and top > 0},
+        'bottlenecks': sorted({b for r in results for b in r['bottlenecks']}),
+    }
+
+
+def sweep(graph: SchematicGraph, planets: list, variants: list, memo: PIMemo = None) -> list:
+    """Evaluate what-if variants of a colony; each variant maps planet index -> replacement planet.
+
+    Unchanged planets and planets whose imports did not change come from the memo.
+    """
+    out = []
+    for variant in variants:
+        changed = list(planets)
+        for idx, planet in (variant or {}).items():
+            changed[int(idx)] = planet
+        out.append(evaluate_colony(graph, changed, memo))
+    return out
+
+
+def load_schematic_graph(bind=None) -> SchematicGraph:
+    """Read sde_planetSchematics (raw SDE import) into a SchematicGraph."""
+    with (bind if bind is not None else engine).connect() as conn:
+        rows = conn.execute(text('SELECT data FROM "sde_planetSchematics"')).fetchall()
+    schematics = []
+    for (data,) in rows:
+        s = Schematic.from_sde(json.loads(data) if isinstance(data, str) else data)
+        if s is not None:
+            schematics.append(s)
+    return SchematicGraph(schematics)
+
+
+class _GraphLoader:
+    """Process-wide schematic graph, loaded once and dropped when the SDE version changes."""
+
+    def __init__(self):
+        self._graph = None
+        self._failed_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        sde_watch.check()
+        if self._graph is None and time.monotonic() - self._failed_at >= RELOAD_BACKOFF:
+            with self._lock:
+                if self._graph is None:
+                    try:
+                        self._graph = load_schematic_graph()
+                    except SQLAlchemyError:
+                        # SDE not imported yet
+                        self._failed_at = time.monotonic()
+        return self._graph
+
+    def reset(self):
+        with self._lock:
+            self._graph = None
+            self._failed_at = 0.0
+
+
+schematic_graph = _GraphLoader()
+pi_memo = PIMemo()
+sde_watch.register(schematic_graph.reset)
+sde_watch.register(pi_memo.clear)
+
+
+def attach_extractors(planets: list, extractors: dict) -> list:
+    """Copy `planets` with extractors given separately ({planet_id: [extractor, ...]}) merged in."""
+    return [
+        dict(p, extractors=list(p.get('extractors') or ()) + list((extractors or {}).get(p.get('planet_id')) or ()))
+        for p in planets
+    ]
+
+
+def compute_pi_output(planets: list, extractors: dict, graph: SchematicGraph = None) -> dict:
+    """Return a summary of PI outputs per day.
+
+    `base_output` on a planet is still counted as-is. Planets with
+    extractors/factories (or entries in `extractors`, keyed by planet_id)
+    are run through the schematic graph and add their colony exports.
+    """
     total = 0
     for p in planets:
         total += p.get('base_output', 0)
-    return {'output_per_day': total, 'planet_count': len(planets)}
+    result = {'output_per_day': total, 'planet_count': len(planets)}
+
+    structured = attach_extractors(planets, extractors)
+    if not any(p['extractors'] or p.get('factories') for p in structured):
+        return result
+    graph = graph or schematic_graph.get()
+    if graph is None:
+        raise ValueError('planet schematics are not imported')
+    colony = evaluate_colony(graph, structured)
+    final = colony['final_products'] or colony['exports_per_hour']
+    result['output_per_day'] = total + 24 * sum(final.values())
+    result['colony'] = colony
+    return result
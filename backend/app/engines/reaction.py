@@ -1,6 +1,145 @@
+import math
+import threading
+from collections import OrderedDict
+
+from ..sde import sde_watch
+from .blueprints import expand, recipe_graph
+
+# Fuel blocks (Nitrogen, Hydrogen, Helium, Oxygen) are reaction inputs but are reported on their own.
+FUEL_BLOCK_TYPES = frozenset({4051, 4246, 4247, 4312})
+
+# Reaction rig bonuses by tier, scaled by the security of the system.
+RIG_MATERIAL_BONUS = {None: 0.0, 't1': 0.02, 't2': 0.024}
+RIG_TIME_BONUS = {None: 0.0, 't1': 0.20, 't2': 0.24}
+SECURITY_MULTIPLIER = {'low': 1.0, 'null': 1.1}
+STRUCTURE_TIME_BONUS = {'athanor': 0.0, 'tatara': 0.25}
+CACHE_SIZE = 8192
+
+
 def plan_reaction(inputs: dict, structure_bonus: float = 0.0) -> dict:
     """Return candidate reaction plans and estimated outputs (stub)."""
     # Very small placeholder
     base_value = sum(inputs.values())
     adjusted = base_value * (1.0 + structure_bonus)
     return {'estimated_output': adjusted}
+
+
+class ReactionProfile:
+    """Where reactions run: material and time reduction as fractions."""
+
+    def __init__(self, material_bonus: float = 0.0, time_bonus: float = 0.0):
+        self.material_bonus = material_bonus
+        self.time_bonus = time_bonus
+        self.key = (round(material_bonus, 6), round(time_bonus, 6))
+
+    @classmethod
+    def for_structure(cls, structure: str = 'athanor', rig: str = None, security: str = 'null'):
+        if structure not in STRUCTURE_TIME_BONUS or rig not in RIG_MATERIAL_BONUS or security not in SECURITY_MULTIPLIER:
+            raise ValueError(f'unknown reaction setup {structure}/{rig}/{security}')
+        mult = SECURITY_MULTIPLIER[security]
+        rig_time = RIG_TIME_BONUS[rig] * mult
+        time_bonus = 1 - (1 - STRUCTURE_TIME_BONUS[structure]) * (1 - rig_time)
+        return cls(RIG_MATERIAL_BONUS[rig] * mult, time_bonus)
+
+
+def job_materials(recipe, runs: int, material_bonus: float) -> dict:
+    """Materials for `runs` runs of one job: each line reduced, rounded up, never below one per run."""
+    factor = 1.0 - material_bonus
+    return {t: max(runs, math.ceil(round(runs * q * factor, 2))) for t, q in recipe.materials.items()}
+
+
+class ReactionPlanner:
+    """Plans moon goo -> intermediate -> composite chains on the shared recipe graph.
+
+    Job expansions are cached on (blueprint, runs, profile), single-target
+    plans on (type, quantity, profile) and whole plans on (targets, profile,
+    SDE version), so planning many targets (or the same targets again) reuses
+    work already done. The shared planner's caches are cleared when the SDE
+    version changes.
+    """
+
+    def __init__(self, graph=None, cache_size: int = CACHE_SIZE):
+        self._graph = graph
+        self.cache_size = cache_size
+        self._jobs = OrderedDict()
+        self._plans = OrderedDict()
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'job_hits': 0, 'job_misses': 0, 'plan_hits': 0, 'plan_misses': 0,
+                      'result_hits': 0, 'result_misses': 0}
+
+    @property
+    def graph(self):
+        graph = self._graph if self._graph is not None else recipe_graph.get()
+        if graph is None:
+            raise ValueError('blueprints are not imported')
+        return graph
+
+    def _cached(self, cache, key, kind, compute):
+        with self._lock:
+            hit = cache.get(key)
+            if hit is not None:
+                cache.move_to_end(key)
+                self.stats[kind + '_hits'] += 1
+                return hit
+            self.stats[kind + '_misses'] += 1
+        value = compute()
+        with self._lock:
+            cache[key] = value
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return value
+
+    def plan(self, targets: dict, profile: ReactionProfile = None) -> dict:
+        """Plan all `targets` ({type_id: quantity}) together, sharing intermediates.
+
+        The same targets (in any order) and profile are planned once per SDE version.
+        """
+        version = sde_watch.check()
+        profile = profile or ReactionProfile()
+        targets = dict(sorted((int(t), q) for t, q in targets.items()))
+        return self._cached(self._results, (tuple(targets.items()), profile.key, version), 'result',
+                            lambda: self._plan(targets, profile))
+
+    def _plan(self, targets: dict, profile: ReactionProfile) -> dict:
+        def job(recipe, runs):
+            return self._cached(self._jobs, (recipe.blueprint_id, runs, profile.key), 'job',
+                                lambda: job_materials(recipe, runs, profile.material_bonus))
+
+        graph = self.graph
+        tree = expand(graph, targets, job, activities=('reaction',))
+        jobs = []
+        for type_id, j in tree['jobs'].items():
+            recipe = graph.recipe(type_id, ('reaction',))
+            jobs.append(dict(j, type_id=type_id,
+                             time_seconds=math.ceil(recipe.time * j['runs'] * (1 - profile.time_bonus))))
+        targets = {int(t) for t in targets}
+        leaves = tree['materials']
+        return {
+            'jobs': jobs,
+            'inputs': {t: q for t, q in leaves.items() if t not in FUEL_BLOCK_TYPES},
+            'fuel_blocks': {t: q for t, q in leaves.items() if t in FUEL_BLOCK_TYPES},
+            'intermediates': {j['type_id']: j['quantity'] for j in jobs if j['type_id'] not in targets},
+            'total_runs': sum(j['runs'] for j in jobs),
+            'total_time_seconds': sum(j['time_seconds'] for j in jobs),
+        }
+
+    def plan_each(self, targets: dict, profile: ReactionProfile = None) -> dict:
+        """Separate plan per target, each cached on (type, quantity, profile)."""
+        sde_watch.check()
+        profile = profile or ReactionProfile()
+        return {
+            int(t): self._cached(self._plans, (int(t), q, profile.key), 'plan', lambda: self._plan({int(t): q}, profile))
+            for t, q in targets.items()
+        }
+
+    def clear(self):
+        with self._lock:
+            self._jobs.clear()
+            self._plans.clear()
+            self._results.clear()
+
+
+# Shared by routes in this process.
+reaction_planner = ReactionPlanner()
+sde_watch.register(reaction_planner.clear)
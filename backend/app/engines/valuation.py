@@ -0,0 +1,138 @@
+"""Asset valuation: quantity x unit price, materialized per character and location.
+
+Prices come from ESI's market average price where there is one, falling back
+to the SDE base_price. The sum over a character's assets is written to
+`asset_valuations` after each asset sync, so the dashboard reads a stored
+total instead of joining every asset against prices on each request.
+"""
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..sde import sde_types
+
+VALUATION_COLUMNS = ['character_id', 'location_id', 'items', 'quantity', 'value', 'unpriced', 'valued_at']
+
+
+class PriceTable:
+    """Sorted type_id -> unit price arrays; lookups for a batch are one searchsorted."""
+
+    def __init__(self, type_ids, prices):
+        order = np.argsort(type_ids, kind='stable')
+        self.type_ids = np.asarray(type_ids, dtype=np.int64)[order]
+        self.prices = np.asarray(prices, dtype=np.float64)[order]
+
+    @classmethod
+    def from_market(cls, rows):
+        """Build from ESI /markets/prices/ rows, preferring average_price over adjusted_price."""
+        rows = [r for r in rows or () if (r.get('average_price') or r.get('adjusted_price'))]
+        return cls(
+            np.fromiter((r['type_id'] for r in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((r.get('average_price') or r['adjusted_price'] for r in rows), dtype=np.float64, count=len(rows)),
+        )
+
+    def __len__(self):
+        return len(self.type_ids)
+
+    def lookup(self, type_ids):
+        """Unit price per entry of `type_ids` (NaN where unknown)."""
+        type_ids = np.asarray(type_ids, dtype=np.int64)
+        if not len(self.type_ids):
+            return np.full(len(type_ids), np.nan)
+        idx = np.searchsorted(self.type_ids, type_ids).clip(0, len(self.type_ids) - 1)
+        return np.where(self.type_ids[idx] == type_ids, self.prices[idx], np.nan)
+
+
+def _base_prices(type_ids):
+    rows = sde_types.get_many(type_ids.tolist())
+    return np.array([(rows.get(t) or (None,) * 4)[3] or np.nan for t in type_ids.tolist()], dtype=np.float64)
+
+
+def unit_prices(type_ids, prices: PriceTable = None):
+    """Market price where known, else SDE base_price, else NaN, for each type id."""
+    type_ids = np.asarray(type_ids, dtype=np.int64)
+    uniq, inverse = np.unique(type_ids, return_inverse=True)
+    unit = prices.lookup(uniq) if prices is not None else np.full(len(uniq), np.nan)
+    missing = np.isnan(unit)
+    if missing.any():
+        unit[missing] = _base_prices(uniq[missing])
+    return unit[inverse]
+
+
+def value_by_location(type_ids, location_ids, quantities, prices: PriceTable = None) -> dict:
+    """Group assets by location and return per-location arrays.
+
+    Returns {'location_id', 'items', 'quantity', 'value', 'unpriced'}; `value`
+    skips items with no known price and `unpriced` counts them.
+    """
+    location_ids = np.asarray(location_ids, dtype=np.int64)
+    quantities = np.asarray(quantities, dtype=np.float64)
+    unit = unit_prices(type_ids, prices)
+    priced = ~np.isnan(unit)
+    value = np.where(priced, unit * quantities, 0.0)
+
+    locs, group = np.unique(location_ids, return_inverse=True)
+    n = len(locs)
+    return {
+        'location_id': locs,
+        'items': np.bincount(group, minlength=n),
+        'quantity': np.bincount(group, weights=quantities, minlength=n),
+        'value': np.bincount(group, weights=value, minlength=n),
+        'unpriced': np.bincount(group, weights=~priced, minlength=n).astype(np.int64),
+    }
+
+
+def _ensure_valuations_table(conn, dialect):
+    table = 'asset_valuations'
+    if dialect == 'postgresql':
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (character_id bigint NOT NULL, location_id bigint NOT NULL, items integer, quantity double precision, value double precision, unpriced integer, valued_at timestamp, PRIMARY KEY (character_id, location_id));"))
+    else:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (character_id bigint NOT NULL, location_id bigint NOT NULL, items integer, quantity REAL, value REAL, unpriced integer, valued_at timestamp, PRIMARY KEY (character_id, location_id));"))
+
+
+def refresh_character_valuation(conn, character_id: int, prices: PriceTable = None) -> dict:
+    """Re-value one character's stored assets and replace its rows in asset_valuations."""
+    _ensure_valuations_table(conn, conn.dialect.name)
+    rows = conn.execute(
+        text("SELECT type_id, location_id, quantity FROM esi_assets WHERE character_id = :c"),
+        {'c': character_id},
+    ).fetchall()
+    valued_at = datetime.utcnow().isoformat()
+    conn.execute(text("DELETE FROM asset_valuations WHERE character_id = :c"), {'c': character_id})
+    if not rows:
+        return {'character_id': character_id, 'locations': 0, 'value': 0.0, 'unpriced': 0}
+
+    n = len(rows)
+    type_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+    location_ids = np.fromiter((r[1] or 0 for r in rows), dtype=np.int64, count=n)
+    quantities = np.fromiter((1 if r[2] is None else r[2] for r in rows), dtype=np.float64, count=n)
+    v = value_by_location(type_ids, location_ids, quantities, prices)
+
+    conn.execute(
+        text(f"INSERT INTO asset_valuations ({', '.join(VALUATION_COLUMNS)}) VALUES ({', '.join(':' + c for c in VALUATION_COLUMNS)})"),
+        [
+            {'character_id': character_id, 'location_id': loc, 'items': items, 'quantity': qty,
+             'value': value, 'unpriced': unpriced, 'valued_at': valued_at}
+            for loc, items, qty, value, unpriced in zip(
+                v['location_id'].tolist(), v['items'].tolist(), v['quantity'].tolist(),
+                v['value'].tolist(), v['unpriced'].tolist())
+        ],
+    )
+    return {'character_id': character_id, 'locations': len(v['location_id']),
+            'value': float(v['value'].sum()), 'unpriced': int(v['unpriced'].sum())}
+
+
+def net_worth(conn, character_id: int = None) -> float:
+    """Stored asset value for one character, or all of them; 0 before the first valuation."""
+    sql = "SELECT COALESCE(SUM(value), 0) FROM asset_valuations"
+    params = {}
+    if character_id is not None:
+        sql += " WHERE character_id = :c"
+        params['c'] = character_id
+    try:
+        return float(conn.execute(text(sql), params).scalar() or 0)
+    except SQLAlchemyError:
+        # no asset sync has run yet
+        return 0.0
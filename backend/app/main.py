@@ -1,18 +1,52 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from .auth import router as auth_router
 from .routes.dashboard import router as dashboard_router
 from .routes.sync import router as sync_router
 from .routes.data import router as data_router
 from .db import engine
 from .models import Base
-
-app = FastAPI(title="I-EVE-TITS API")
+from .metrics import MetricsMiddleware, registry
+from .scheduler import scheduler
+from .services.api_cache import api_cache
+from .services.cache import response_cache
+from .services.http import close_client
+from .services.ratelimit import limiter
+from .services.zkill import ZKILL_BACKEND, ZKillIngester, make_source, kill_stats
 
 
-@app.on_event("startup")
-def on_startup():
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     # create DB tables if they don't exist
     Base.metadata.create_all(bind=engine)
+    # killmail feed for /dashboard/kills, when ZKILL_SOURCE names one; with shared
+    # (redis) counters app.scripts.run_zkill ingests once for every API process
+    source = make_source() if ZKILL_BACKEND == 'memory' else None
+    ingester = task = None
+    if source is not None:
+        ingester = ZKillIngester(source)
+        task = asyncio.create_task(ingester.run())
+    yield
+    if task is not None:
+        ingester.stop()
+        task.cancel()
+    # drop the pooled ESI/SSO connections opened by this loop
+    await close_client()
+
+
+app = FastAPI(title="I-EVE-TITS API", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+
+# in-process component counters, read at scrape time
+registry.stats_gauge('esi_limiter', 'ESI rate limiter counters.', lambda: limiter.stats)
+registry.stats_gauge('esi_cache', 'ESI response cache counters.', lambda: response_cache.stats)
+registry.stats_gauge('api_cache', 'API response cache counters.', lambda: api_cache.stats)
+registry.stats_gauge('sync_scheduler', 'Sync scheduler counters.', lambda: scheduler.stats)
+registry.stats_gauge('zkill_aggregator', 'Killmail aggregator counters.', lambda: kill_stats.stats)
+registry.stats_gauge('metrics_registry', 'Metric push counters.', lambda: registry.stats)
 
 
 @app.get("/health")
@@ -20,6 +54,11 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
+
+
 @app.get("/")
 async def root():
     return {"message": "I-EVE-TITS backend running"}
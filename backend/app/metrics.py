@@ -0,0 +1,311 @@
+"""Prometheus text-format metrics without a client library.
+
+Counters and histograms live in process memory; recording one is a dict
+update under a lock. RQ runs every job in a forked work horse that exits
+afterwards, so with METRICS_BACKEND=redis each job pushes what it recorded
+into one Redis hash when it finishes. /metrics on the API renders its own
+samples plus that hash, so sync, ESI and SQL timings from the workers show
+up on the same endpoint.
+"""
+import os
+import re
+import json
+import time
+import bisect
+import functools
+import threading
+
+from redis.exceptions import RedisError
+
+# 'memory' keeps samples per process; 'redis' also collects what RQ jobs record.
+# Default: 'redis' when REDIS_URL is set, otherwise 'memory'.
+METRICS_BACKEND = os.getenv('METRICS_BACKEND', 'redis' if os.getenv('REDIS_URL') else 'memory')
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379')
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+SQL_VERBS = frozenset({'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'CREATE', 'COPY', 'WITH', 'BEGIN', 'COMMIT'})
+
+_ID_SEGMENT = re.compile(r'/\d+')
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _order(sample):
+    # series together, buckets in increasing le, then _sum and _count
+    (suffix, names, key), _ = sample
+    if suffix == '_bucket':
+        return key[:-1], 0, float(key[-1].replace('+Inf', 'inf'))
+    return key, {'': 0, '_sum': 1, '_count': 2}[suffix], 0.0
+
+
+def _fmt(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1.0, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + value
+
+    def _samples(self):
+        return [('', self.labels, key, v) for key, v in self._values.items()]
+
+    def samples(self, drain: bool = False):
+        with self._lock:
+            out = self._samples()
+            if drain:
+                self._values = {}
+            return out
+
+
+class Histogram(Counter):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, labels=()):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def _samples(self):
+        out = []
+        names = self.labels + ('le',)
+        for key, (counts, total) in self._values.items():
+            cum = 0
+            for le, n in zip(self.buckets + (float('inf'),), counts):
+                cum += n
+                out.append(('_bucket', names, key + (_fmt(le),), cum))
+            out.append(('_sum', self.labels, key, total))
+            out.append(('_count', self.labels, key, cum))
+        return out
+
+
+class StatsGauge:
+    """Exposes a component's `stats` dict (one series per key) as a gauge, read at scrape time."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, stats):
+        self.name = name
+        self.help = help
+        self.stats = stats
+        self.labels = ('stat',)
+
+    def samples(self, drain: bool = False):
+        if drain:
+            return []
+        stats = self.stats() if callable(self.stats) else self.stats
+        return [('', self.labels, (k,), v) for k, v in dict(stats).items()
+                if isinstance(v, (int, float)) and not isinstance(v, bool)]
+
+
+class RedisShared:
+    """Sample deltas summed into one Redis hash, field = [metric, suffix, label names, label values]."""
+
+    def __init__(self, url: str = REDIS_URL, key: str = 'metrics:shared'):
+        from redis import Redis
+        self.redis = Redis.from_url(url, socket_timeout=1)
+        self.key = key
+
+    def add(self, samples):
+        pipe = self.redis.pipeline(transaction=False)
+        for name, suffix, names, key, value in samples:
+            pipe.hincrbyfloat(self.key, json.dumps([name, suffix, names, key]), value)
+        pipe.execute()
+
+    def read(self) -> dict:
+        out = {}
+        for field, value in self.redis.hgetall(self.key).items():
+            name, suffix, names, key = json.loads(field)
+            out.setdefault(name, {})[(suffix, tuple(names), tuple(key))] = float(value)
+        return out
+
+
+class Registry:
+    def __init__(self, shared=None):
+        self.metrics = {}
+        self.shared = shared
+        self.stats = {'pushes': 0, 'push_errors': 0}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def stats_gauge(self, name, help, stats) -> StatsGauge:
+        return self.register(StatsGauge(name, help, stats))
+
+    def push(self):
+        """Move this process's counters and histograms into the shared hash (no-op without one)."""
+        if self.shared is None:
+            return
+        samples = [(m.name, suffix, names, key, v)
+                   for m in self.metrics.values() for suffix, names, key, v in m.samples(drain=True)]
+        try:
+            if samples:
+                self.shared.add(samples)
+            self.stats['pushes'] += 1
+        except RedisError:
+            # these samples are lost; the job itself is unaffected
+            self.stats['push_errors'] += 1
+
+    def render(self) -> str:
+        shared = {}
+        if self.shared is not None:
+            try:
+                shared = self.shared.read()
+            except RedisError:
+                self.stats['push_errors'] += 1
+        lines = []
+        for m in self.metrics.values():
+            merged = dict(shared.get(m.name, {}))
+            for suffix, names, key, v in m.samples():
+                merged[(suffix, names, key)] = merged.get((suffix, names, key), 0.0) + v
+            lines.append(f'# HELP {m.name} {m.help}')
+            lines.append(f'# TYPE {m.name} {m.kind}')
+            for (suffix, names, key), v in sorted(merged.items(), key=_order):
+                labels = ','.join(f'{n}="{_escape(k)}"' for n, k in zip(names, key))
+                lines.append(f'{m.name}{suffix}{{{labels}}} {_fmt(v)}' if labels else f'{m.name}{suffix} {_fmt(v)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry(RedisShared() if METRICS_BACKEND == 'redis' else None)
+
+http_request_seconds = registry.histogram('http_request_duration_seconds', 'API request latency by route.',
+                                          ('method', 'route'))
+http_responses = registry.counter('http_responses_total', 'API responses by route and status.',
+                                  ('method', 'route', 'status'))
+db_query_seconds = registry.histogram('db_query_duration_seconds', 'SQL statement latency by verb.', ('verb',))
+esi_request_seconds = registry.histogram('esi_request_duration_seconds', 'ESI request latency (network only).',
+                                         ('endpoint',))
+esi_responses = registry.counter('esi_responses_total', 'ESI responses by endpoint, HTTP status and cache outcome.',
+                                 ('endpoint', 'status', 'cache'))
+esi_pages = registry.counter('esi_pages_total', 'Pages read while walking paginated ESI endpoints.', ('endpoint',))
+job_seconds = registry.histogram('job_duration_seconds', 'RQ job run time.', ('task',), buckets=JOB_BUCKETS)
+job_rows = registry.counter('job_rows_total', 'Rows written by RQ jobs.', ('task',))
+jobs = registry.counter('jobs_total', 'RQ jobs by outcome.', ('task', 'outcome'))
+
+
+def esi_endpoint(url: str) -> str:
+    """ESI path with ids folded into {id}, so labels stay few."""
+    path = url.split('://', 1)[-1].split('/', 1)[-1].split('?', 1)[0]
+    return _ID_SEGMENT.sub('/{id}', '/' + path)
+
+
+def sql_verb(statement: str) -> str:
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    return verb if verb in SQL_VERBS else 'OTHER'
+
+
+def instrument_engine(engine):
+    """Time every statement run on `engine` into db_query_duration_seconds.
+
+    The start time lives on the statement's execution context, so a statement
+    that fails leaves nothing behind on the pooled connection; failed
+    statements are timed too. Calls made on the raw DBAPI connection, such
+    as COPY through cursor.copy_expert in bulk.py, bypass these events and
+    are timed by their caller.
+    """
+    from sqlalchemy import event
+
+    def _observe(context, statement):
+        started = getattr(context, '_query_start', None)
+        if started is not None:
+            context._query_start = None
+            db_query_seconds.observe(time.perf_counter() - started, (sql_verb(statement),))
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        _observe(context, statement)
+
+    @event.listens_for(engine, 'handle_error')
+    def _failed(exception_context):
+        _observe(exception_context.execution_context, exception_context.statement or '')
+
+    return engine
+
+
+def timed_job(fn):
+    """Record an RQ task's duration, outcome and `inserted` rows, then push them to the shared hash."""
+    task = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        outcome = 'failed'
+        try:
+            result = fn(*args, **kwargs)
+            outcome = 'finished'
+            rows = result.get('inserted') if isinstance(result, dict) else None
+            if rows:
+                job_rows.inc(rows, (task,))
+            return result
+        finally:
+            job_seconds.observe(time.perf_counter() - start, (task,))
+            jobs.inc(1, (task, outcome))
+            registry.push()
+
+    return wrapper
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every request under its route template (not the raw path)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._paths = None
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            return '<unmatched>'
+        if self._paths is None or endpoint not in self._paths:
+            self._paths = {getattr(r, 'endpoint', None): r.path for r in scope['app'].routes}
+        return self._paths.get(endpoint, '<unmatched>')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = self._route(scope)
+            http_request_seconds.observe(time.perf_counter() - start, (scope['method'], route))
+            http_responses.inc(1, (scope['method'], route, str(status[0])))
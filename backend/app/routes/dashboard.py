@@ -1,14 +1,199 @@
-from fastapi import APIRouter
-from ..engines.mining import compute_mining_yield
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from ..db import engine
+from ..engines.mining import compute_mining_yield, compute_mining_yield_batch
+from ..engines.market_analytics import market_analytics
+from ..engines.valuation import net_worth
+from ..engines.pi import attach_extractors, compute_pi_output, schematic_graph, sweep
+from ..engines.blueprints import recipe_graph
+from ..engines.bom import StructureProfile, bom_engine
+from ..engines.reaction import ReactionProfile, reaction_planner
+from ..services.api_cache import api_cache
+from ..services.market import order_books
+from ..services.zkill import recent_losses
+from ..sde import sde_types
+
+MAX_MARKET_TYPES = 5000
+MAX_MINING_RESULTS = 1_000_000
+MAX_BUILD_LINES = 1000
 
 router = APIRouter(prefix="/dashboard")
 
-@router.get('/overview')
-async def overview():
-    # placeholder summary
+def _net_worth(character_id):
+    with engine.connect() as conn:
+        return net_worth(conn, character_id)
+
+
+def _overview(character_id):
+    # placeholder mining summary; net worth is read from asset_valuations
     mining = compute_mining_yield({'mining':5},{'base_yield':100},{'fleet_bonus':0.1})
     return {
-        'net_worth': 0,
+        'net_worth': _net_worth(character_id),
         'active_jobs': 0,
         'mining_summary': mining,
     }
+
+
+@router.get('/overview')
+async def overview(request: Request, character_id: int = None):
+    # cached until a sync changes the character's (or, without one, anyone's) assets
+    return await run_in_threadpool(api_cache.respond, request, 'overview', {}, lambda: _overview(character_id),
+                                   character_id=character_id)
+
+
+class MiningBatchRequest(BaseModel):
+    mining_skills: List[float]
+    base_yields: List[float]
+    fleet_bonuses: List[float]
+    ore_type_ids: Optional[List[int]] = None
+    cross: bool = True
+
+
+@router.post('/mining/batch')
+def mining_batch(req: MiningBatchRequest):
+    """Mining yield for every skill x ship x boost (x ore) combination, or per zipped row."""
+    cols = (req.mining_skills, req.base_yields, req.fleet_bonuses)
+    if not all(cols):
+        raise HTTPException(status_code=400, detail='mining_skills, base_yields and fleet_bonuses must be non-empty')
+    if req.cross:
+        count = len(cols[0]) * len(cols[1]) * len(cols[2])
+    else:
+        lengths = {len(c) for c in cols} - {1}
+        if len(lengths) > 1:
+            raise HTTPException(status_code=400, detail='zipped columns must have equal length (or length 1)')
+        count = max(len(c) for c in cols)
+    volumes = None
+    if req.ore_type_ids:
+        count *= len(req.ore_type_ids)
+        rows = sde_types.get_many(req.ore_type_ids)
+        volumes = [(rows.get(t) or (None,) * 4)[2] or 0.0 for t in req.ore_type_ids]
+    if count > MAX_MINING_RESULTS:
+        raise HTTPException(status_code=400, detail=f'at most {MAX_MINING_RESULTS} combinations per request')
+
+    batch = compute_mining_yield_batch(*cols, ore_volumes=volumes, cross=req.cross)
+    return {
+        'shape': list(batch.shape),
+        'axes': list(batch.axes),
+        'ore_type_ids': req.ore_type_ids,
+        'summary': batch.summary(),
+        'columns': batch.columns(),
+    }
+
+
+class PIRequest(BaseModel):
+    planets: List[dict]
+    extractors: Dict[int, List[dict]] = {}
+    variants: Optional[List[Dict[int, dict]]] = None
+
+
+@router.post('/pi')
+def pi_colony(req: PIRequest):
+    """Evaluate a PI colony, plus optional what-if variants (planet index -> replacement planet)."""
+    graph = schematic_graph.get()
+    if graph is None:
+        raise HTTPException(status_code=503, detail='planet schematics are not imported')
+    try:
+        planets = attach_extractors(req.planets, req.extractors)
+        result = compute_pi_output(planets, {}, graph=graph)
+        if req.variants:
+            result['variants'] = sweep(graph, planets, req.variants)
+    except (ValueError, KeyError, IndexError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return result
+
+
+class ReactionPlanRequest(BaseModel):
+    targets: Dict[int, int]
+    structure: str = 'athanor'
+    rig: Optional[str] = None
+    security: str = 'null'
+    separate: bool = False
+
+
+@router.post('/reactions/plan')
+def reactions_plan(req: ReactionPlanRequest):
+    """Runs, moon goo, intermediates and fuel blocks for reaction targets."""
+    if not req.targets or any(q <= 0 for q in req.targets.values()):
+        raise HTTPException(status_code=400, detail='targets must map type ids to positive quantities')
+    if recipe_graph.get() is None:
+        raise HTTPException(status_code=503, detail='blueprints are not imported')
+    try:
+        profile = ReactionProfile.for_structure(req.structure, req.rig, req.security)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if req.separate:
+        return {'plans': reaction_planner.plan_each(req.targets, profile)}
+    return reaction_planner.plan(req.targets, profile)
+
+
+class BomLine(BaseModel):
+    type_id: int
+    quantity: int
+    me: Optional[int] = None
+    te: Optional[int] = None
+
+
+class BomRequest(BaseModel):
+    lines: List[BomLine]
+    structure: str = 'station'
+    rig: Optional[str] = None
+    security: str = 'high'
+
+
+@router.post('/industry/bom')
+def industry_bom(req: BomRequest):
+    """Bill of materials for a batch of build lines, components planned once across lines."""
+    if not req.lines or len(req.lines) > MAX_BUILD_LINES:
+        raise HTTPException(status_code=400, detail=f'between 1 and {MAX_BUILD_LINES} build lines required')
+    if recipe_graph.get() is None:
+        raise HTTPException(status_code=503, detail='blueprints are not imported')
+    try:
+        profile = StructureProfile.for_structure(req.structure, req.rig, req.security)
+        return bom_engine.build([line.dict() for line in req.lines], profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _type_ids(type_ids: str):
+    try:
+        ids = [int(t) for t in type_ids.split(',') if t.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail='type_ids must be comma-separated integers')
+    if not ids or len(ids) > MAX_MARKET_TYPES:
+        raise HTTPException(status_code=400, detail=f'between 1 and {MAX_MARKET_TYPES} type_ids required')
+    return ids
+
+
+@router.get('/market/{region_id}')
+async def market_indicators(region_id: int, type_ids: str):
+    """Price indicators for a comma-separated list of type ids in one region."""
+    ids = _type_ids(type_ids)
+    results = await market_analytics.analyze_async(region_id, ids)
+    return {'region_id': region_id, 'types': {str(k): v for k, v in results.items()}}
+
+
+@router.get('/market/{region_id}/orders')
+async def market_orders(region_id: int, type_ids: str, location_id: int = None):
+    """Best bid/ask and depth per type, region-wide and per location, from live orders."""
+    ids = _type_ids(type_ids)
+    index = await order_books.get_async(region_id)
+    best = index.best(ids)
+    by_location = index.quotes(ids, location_id)
+    return {
+        'region_id': region_id,
+        'types': {
+            str(t): {'region': best[t], 'locations': {str(loc): q for loc, q in by_location[t].items()}}
+            for t in ids
+        },
+    }
+
+
+@router.get('/kills/{region_id}')
+async def region_kills(region_id: int, hours: int = 24, limit: int = 10):
+    """Most destroyed ship types in a region over the last `hours`, from the live killmail feed."""
+    if hours < 1 or limit < 1:
+        raise HTTPException(status_code=400, detail='hours and limit must be positive')
+    return await recent_losses(region_id, hours, limit)
@@ -1,90 +1,187 @@
-from fastapi import APIRouter, HTTPException
+import io
+import csv
+import json
+import zlib
+import base64
+import binascii
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy import text
 from ..db import SessionLocal, engine
+from ..sde import sde_types
+from ..engines.asset_tree import root_totals, location_totals, subtree
+from ..services.api_cache import api_cache
 
 router = APIRouter(prefix="/data")
 
-@router.get('/assets/{character_id}')
-def get_assets(character_id: int, limit: int = 100, offset: int = 0):
-    """Retrieve stored assets for a character with optional SDE type lookup."""
+# Rows fetched from the server-side cursor (and type-name lookups) per chunk of an export.
+EXPORT_CHUNK = 2000
+EXPORTS = {
+    'assets': ('esi_assets', 'item_id', ['item_id', 'type_id', 'location_id', 'quantity', 'synced_at']),
+    'industry-jobs': ('esi_industry_jobs', 'job_id', ['job_id', 'type_id', 'output_location_id', 'status', 'synced_at']),
+}
+
+
+def _encode_cursor(last_id) -> str:
+    raw = json.dumps({'after': last_id}).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return int(json.loads(raw)['after'])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail='invalid cursor')
+
+
+def _page(db, columns, table, key, character_id, limit, offset, cursor):
+    """Fetch one page ordered by `key`; keyset when a cursor is given, OFFSET otherwise.
+
+    Reads limit + 1 rows so the next cursor is only returned when more rows exist.
+    """
+    if limit < 1:
+        raise HTTPException(status_code=400, detail='limit must be positive')
+    cols = ', '.join(columns)
+    params = {'cid': character_id, 'lim': limit + 1}
+    if cursor:
+        params['after'] = _decode_cursor(cursor)
+        sql = f"SELECT {cols} FROM {table} WHERE character_id = :cid AND {key} > :after ORDER BY {key} LIMIT :lim"
+    else:
+        # OFFSET kept for old clients; deep offsets still scan, cursors don't
+        params['offset'] = offset
+        sql = f"SELECT {cols} FROM {table} WHERE character_id = :cid ORDER BY {key} LIMIT :lim OFFSET :offset"
+    rows = db.execute(text(sql), params).fetchall()
+    next_cursor = _encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def _assets_page(character_id, limit, offset, cursor):
     db = SessionLocal()
     try:
-        # check if assets table exists
-        inspector_result = db.execute(text("SELECT 1 FROM information_schema.tables WHERE table_name='esi_assets'")).first() if engine.dialect.name == 'postgresql' else True
-        
-        result = db.execute(
-            text("SELECT item_id, type_id, location_id, quantity, synced_at FROM esi_assets WHERE character_id = :cid ORDER BY item_id LIMIT :lim OFFSET :offset"),
-            {'cid': character_id, 'lim': limit, 'offset': offset}
-        )
-        assets = result.fetchall()
-        
-        # enrich with type info if available
-        enriched = []
-        for asset in assets:
-            item = {
-                'item_id': asset[0],
-                'type_id': asset[1],
-                'location_id': asset[2],
-                'quantity': asset[3],
-                'synced_at': asset[4],
-                'type_name': None,
-            }
-            # try lookup type name from sde_types_norm
-            try:
-                type_result = db.execute(
-                    text("SELECT name FROM sde_types_norm WHERE type_id = :tid"),
-                    {'tid': asset[1]}
-                ).first()
-                if type_result:
-                    item['type_name'] = type_result[0]
-            except:
-                pass
-            enriched.append(item)
-        
-        return {'assets': enriched}
+        assets, next_cursor = _page(db, ['item_id', 'type_id', 'location_id', 'quantity', 'synced_at'],
+                                    'esi_assets', 'item_id', character_id, limit, offset, cursor)
     finally:
         db.close()
 
-@router.get('/industry-jobs/{character_id}')
-def get_industry_jobs(character_id: int, limit: int = 100, offset: int = 0):
-    """Retrieve stored industry jobs with SDE type lookups."""
+    # enrich with type names from the shared SDE dictionary (one batched lookup at most)
+    names = sde_types.names(a[1] for a in assets)
+    enriched = [
+        {
+            'item_id': asset[0],
+            'type_id': asset[1],
+            'location_id': asset[2],
+            'quantity': asset[3],
+            'synced_at': asset[4],
+            'type_name': names.get(asset[1]),
+        }
+        for asset in assets
+    ]
+    return {'assets': enriched, 'next_cursor': next_cursor}
+
+@router.get('/assets/{character_id}')
+def get_assets(character_id: int, request: Request, limit: int = 100, offset: int = 0, cursor: str = None):
+    """Retrieve stored assets for a character with optional SDE type lookup.
+
+    Pass the returned `next_cursor` back as `cursor` to get the following page.
+    Cached until the character's next changed sync or SDE import.
+    """
+    params = {'limit': limit, 'offset': offset, 'cursor': cursor}
+    return api_cache.respond(request, 'assets', dict(params, character_id=character_id),
+                             lambda: _assets_page(character_id, **params), character_id=character_id, sde=True)
+
+def _jobs_page(character_id, limit, offset, cursor):
     db = SessionLocal()
     try:
-        result = db.execute(
-            text("SELECT job_id, type_id, output_location_id, status, synced_at FROM esi_industry_jobs WHERE character_id = :cid ORDER BY job_id LIMIT :lim OFFSET :offset"),
-            {'cid': character_id, 'lim': limit, 'offset': offset}
-        )
-        jobs = result.fetchall()
-        
-        enriched = []
-        for job in jobs:
-            item = {
-                'job_id': job[0],
-                'type_id': job[1],
-                'output_location_id': job[2],
-                'status': job[3],
-                'synced_at': job[4],
-                'type_name': None,
-            }
-            # lookup type name
-            try:
-                type_result = db.execute(
-                    text("SELECT name FROM sde_types_norm WHERE type_id = :tid"),
-                    {'tid': job[1]}
-                ).first()
-                if type_result:
-                    item['type_name'] = type_result[0]
-            except:
-                pass
-            enriched.append(item)
-        
-        return {'jobs': enriched}
+        jobs, next_cursor = _page(db, ['job_id', 'type_id', 'output_location_id', 'status', 'synced_at'],
+                                  'esi_industry_jobs', 'job_id', character_id, limit, offset, cursor)
     finally:
         db.close()
 
-@router.get('/sde-type/{type_id}')
-def get_sde_type(type_id: int):
-    """Look up a type from SDE normalized table."""
+    names = sde_types.names(j[1] for j in jobs)
+    enriched = [
+        {
+            'job_id': job[0],
+            'type_id': job[1],
+            'output_location_id': job[2],
+            'status': job[3],
+            'synced_at': job[4],
+            'type_name': names.get(job[1]),
+        }
+        for job in jobs
+    ]
+    return {'jobs': enriched, 'next_cursor': next_cursor}
+
+@router.get('/industry-jobs/{character_id}')
+def get_industry_jobs(character_id: int, request: Request, limit: int = 100, offset: int = 0, cursor: str = None):
+    """Retrieve stored industry jobs with SDE type lookups.
+
+    Pass the returned `next_cursor` back as `cursor` to get the following page.
+    """
+    params = {'limit': limit, 'offset': offset, 'cursor': cursor}
+    return api_cache.respond(request, 'industry-jobs', dict(params, character_id=character_id),
+                             lambda: _jobs_page(character_id, **params), character_id=character_id, sde=True)
+
+def _asset_locations(character_id):
+    with engine.connect() as conn:
+        return {'character_id': character_id, 'locations': root_totals(conn, character_id)}
+
+@router.get('/assets/{character_id}/locations')
+def get_asset_locations(character_id: int, request: Request):
+    """Totals per root location (station, structure or system), counting everything nested in containers."""
+    return api_cache.respond(request, 'asset-locations', {'character_id': character_id},
+                             lambda: _asset_locations(character_id), character_id=character_id)
+
+def _asset_subtree(character_id, location_id, limit, cursor, max_depth):
+    if limit < 1:
+        raise HTTPException(status_code=400, detail='limit must be positive')
+    after = _decode_cursor(cursor) if cursor else None
+    with engine.connect() as conn:
+        rows = subtree(conn, character_id, location_id, limit + 1, after, max_depth)
+    next_cursor = _encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+    rows = rows[:limit]
+
+    names = sde_types.names(r[1] for r in rows)
+    assets = [
+        {
+            'item_id': r[0],
+            'type_id': r[1],
+            'quantity': r[2],
+            'value': r[3],
+            'parent_id': r[4],
+            'root_location_id': r[5],
+            'depth': r[6],
+            'path': [int(p) for p in r[7].split('/')],
+            'distance': r[8],
+            'type_name': names.get(r[1]),
+        }
+        for r in rows
+    ]
+    return {'location_id': location_id, 'assets': assets, 'next_cursor': next_cursor}
+
+@router.get('/assets/{character_id}/locations/{location_id}')
+def get_asset_subtree(character_id: int, location_id: int, request: Request, limit: int = 100,
+                      cursor: str = None, max_depth: int = None):
+    """Everything inside a station, structure or container, at any nesting depth, ordered by item_id.
+
+    `max_depth=1` lists only what sits directly in `location_id`. Pass the
+    returned `next_cursor` back as `cursor` to get the following page.
+    """
+    params = {'limit': limit, 'cursor': cursor, 'max_depth': max_depth}
+    return api_cache.respond(request, 'asset-subtree', dict(params, character_id=character_id, location_id=location_id),
+                             lambda: _asset_subtree(character_id, location_id, **params),
+                             character_id=character_id, sde=True)
+
+def _asset_location_totals(character_id, location_id):
+    with engine.connect() as conn:
+        return location_totals(conn, character_id, location_id)
+
+@router.get('/assets/{character_id}/locations/{location_id}/totals')
+def get_asset_location_totals(character_id: int, location_id: int, request: Request):
+    """Item count, quantity and value of everything under one station, structure or container."""
+    return api_cache.respond(request, 'asset-location-totals', {'character_id': character_id, 'location_id': location_id},
+                             lambda: _asset_location_totals(character_id, location_id), character_id=character_id)
+
+def _sde_type(type_id):
     db = SessionLocal()
     try:
         result = db.execute(
@@ -106,9 +203,12 @@ def get_sde_type(type_id: int):
     finally:
         db.close()
 
-@router.get('/sde-group/{group_id}')
-def get_sde_group(group_id: int):
-    """Look up a group from SDE normalized table."""
+@router.get('/sde-type/{type_id}')
+def get_sde_type(type_id: int, request: Request):
+    """Look up a type from SDE normalized table (cached until the next SDE import)."""
+    return api_cache.respond(request, 'sde-type', {'type_id': type_id}, lambda: _sde_type(type_id), sde=True)
+
+def _sde_group(group_id):
     db = SessionLocal()
     try:
         result = db.execute(
@@ -125,3 +225,83 @@ def get_sde_group(group_id: int):
         }
     finally:
         db.close()
+
+@router.get('/sde-group/{group_id}')
+def get_sde_group(group_id: int, request: Request):
+    """Look up a group from SDE normalized table (cached until the next SDE import)."""
+    return api_cache.respond(request, 'sde-group', {'group_id': group_id}, lambda: _sde_group(group_id), sde=True)
+
+
+def _export_chunks(table, key, columns, character_id):
+    """Yield lists of row dicts (with type_name) straight off a server-side cursor."""
+    cols = ', '.join(columns)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_CHUNK).execute(
+            text(f"SELECT {cols} FROM {table} WHERE character_id = :cid ORDER BY {key}"),
+            {'cid': character_id}
+        )
+        for part in result.partitions():
+            names = sde_types.names(r[1] for r in part)
+            chunk = []
+            for r in part:
+                row = dict(zip(columns, r))
+                row['type_name'] = names.get(r[1])
+                chunk.append(row)
+            yield chunk
+
+
+def _ndjson(chunks):
+    for chunk in chunks:
+        yield ''.join(json.dumps(row, default=str) + '\n' for row in chunk).encode('utf-8')
+
+
+def _csv(chunks, fields):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fields)
+    writer.writeheader()
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buf.getvalue().encode('utf-8')
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode('utf-8')
+
+
+def _gzip(body):
+    z = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for part in body:
+        out = z.compress(part)
+        if out:
+            yield out
+    yield z.flush()
+
+
+@router.get('/export/{kind}/{character_id}')
+def export_inventory(kind: str, character_id: int, request: Request, format: str = 'ndjson'):
+    """Stream every stored asset or industry job for a character as NDJSON or CSV.
+
+    Rows are read in chunks from a server-side cursor and written out as they
+    come, so memory stays flat regardless of inventory size. The body is
+    gzipped when the client sends Accept-Encoding: gzip.
+    """
+    if kind not in EXPORTS:
+        raise HTTPException(status_code=404, detail='unknown export')
+    if format not in ('ndjson', 'csv'):
+        raise HTTPException(status_code=400, detail='format must be ndjson or csv')
+
+    table, key, columns = EXPORTS[kind]
+    chunks = _export_chunks(table, key, columns, character_id)
+    if format == 'csv':
+        body, media_type = _csv(chunks, columns + ['type_name']), 'text/csv'
+    else:
+        body, media_type = _ndjson(chunks), 'application/x-ndjson'
+
+    headers = {
+        'Content-Disposition': f'attachment; filename="{kind}-{character_id}.{format}"',
+        'Vary': 'Accept-Encoding',
+    }
+    if 'gzip' in request.headers.get('accept-encoding', ''):
+        body = _gzip(body)
+        headers['Content-Encoding'] = 'gzip'
+    return StreamingResponse(body, media_type=media_type, headers=headers)
@@ -1,25 +1,39 @@
 from fastapi import APIRouter, HTTPException
-from rq import Queue
 from redis import Redis
+from rq import Queue
 import os
 
-from ..tasks import task_sync_assets, task_sync_industry
+from ..scheduler import scheduler
 
 router = APIRouter(prefix="/sync")
 
 redis_url = os.getenv('REDIS_URL', 'redis://redis:6379')
 redis_conn = Redis.from_url(redis_url)
-q = Queue('default', connection=redis_conn)
+# CPU-bound jobs run in the worker's cpu pool (see worker.py), away from character syncs.
+cpu_queue = Queue('cpu', connection=redis_conn)
+SDE_IMPORT_JOB = 'import-sde'
+SDE_IMPORT_TASK = f'{__package__.rpartition(".")[0]}.tasks.task_import_sde'
+SDE_IMPORT_TIMEOUT = int(os.getenv('SDE_IMPORT_TIMEOUT', '3600'))
 
 @router.post('/enqueue/assets/{token_id}')
 def enqueue_assets(token_id: int):
-    job = q.enqueue(task_sync_assets, token_id)
-    return {"status": "queued", "job_id": job.get_id()}
+    # interactive lane; a sync of this token already queued or running is returned instead
+    return scheduler.enqueue('assets', token_id, priority='interactive')
 
 @router.post('/enqueue/industry/{token_id}')
 def enqueue_industry(token_id: int):
-    job = q.enqueue(task_sync_industry, token_id)
-    return {"status": "queued", "job_id": job.get_id()}
+    return scheduler.enqueue('industry', token_id, priority='interactive')
+
+@router.post('/enqueue/sde-import')
+def enqueue_sde_import(force: bool = False):
+    # one import at a time: a queued or running one is returned instead
+    job = cpu_queue.fetch_job(SDE_IMPORT_JOB)
+    status = job.get_status() if job is not None else None
+    status = str(getattr(status, 'value', status))
+    if status in ('queued', 'started', 'deferred', 'scheduled'):
+        return {'status': status, 'job_id': job.get_id(), 'duplicate': True}
+    job = cpu_queue.enqueue(SDE_IMPORT_TASK, force, job_id=SDE_IMPORT_JOB, job_timeout=SDE_IMPORT_TIMEOUT)
+    return {'status': 'queued', 'job_id': job.get_id(), 'duplicate': False}
 
 @router.get('/status/{job_id}')
 def job_status(job_id: str):
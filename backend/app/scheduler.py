@@ -0,0 +1,387 @@
+"""When each token's syncs are next due, and getting them onto RQ exactly once.
+
+Every (kind, token) pair has a due time in a sorted set. A finished sync
+records the next one from the ESI `Expires` header of what it fetched (or
+the kind's default interval), plus jitter so characters synced together
+drift apart. `tick()` claims the pairs that are due and enqueues them on the
+background lane; `POST /sync/enqueue/...` uses the interactive lane, which
+workers drain first.
+
+Before a pair is queued it is leased (`SET NX` in Redis) to the job that
+will sync it, either its own job (`sync-assets-42`) or a batch job. The
+lease is released when the sync records its next due time. A lease whose job
+finished or failed without doing so is taken over, and any lease expires
+after SYNC_CLAIM_LEASE. So a pair already queued or running is never queued
+a second time, by any process or lane.
+"""
+import os
+import time
+import uuid
+import random
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from .db import engine
+
+# 'memory' keeps due times per process; 'redis' shares them between the API, workers and the scheduler loop.
+# Workers record due times in short-lived RQ processes, so only 'redis' schedules anything.
+# Default: 'redis' when REDIS_URL is set, otherwise 'memory'.
+SCHEDULER_BACKEND = os.getenv('SYNC_SCHEDULER_BACKEND', 'redis' if os.getenv('REDIS_URL') else 'memory')
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379')
+# Spread each due time over this fraction of its interval.
+JITTER = float(os.getenv('SYNC_JITTER', '0.1'))
+# Never sync a pair more often than this, whatever Expires says.
+MIN_INTERVAL = int(os.getenv('SYNC_MIN_INTERVAL', '60'))
+# A claimed pair whose job never reports back is retried after this long.
+CLAIM_LEASE = int(os.getenv('SYNC_CLAIM_LEASE', '900'))
+TICK_LIMIT = int(os.getenv('SYNC_TICK_LIMIT', '500'))
+# Scheduled syncs run this many tokens per job (task_sync_tokens); 1 keeps one job per pair.
+# Interactive requests always get a job of their own.
+BATCH_SIZE = int(os.getenv('SYNC_BATCH_SIZE', '20'))
+
+# RQ queue per priority lane; workers listen in this order.
+QUEUES = {'interactive': 'sync-interactive', 'background': 'sync-background'}
+# kind -> (task, default interval in seconds); ESI caches assets for an hour, industry jobs for 5 minutes.
+SYNC_KINDS = {
+    'assets': (f'{__package__}.tasks.task_sync_assets', 3600),
+    'industry': (f'{__package__}.tasks.task_sync_industry', 300),
+}
+BATCH_TASK = f'{__package__}.tasks.task_sync_tokens'
+# A lease held by a job in one of these states is stale and may be taken over.
+TERMINAL_STATUSES = ('finished', 'failed', 'stopped', 'canceled')
+
+# Claim up to ARGV[2] members due by ARGV[1], pushing each out to ARGV[3].
+_CLAIM_LUA = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, m in ipairs(due) do
+  redis.call('ZADD', KEYS[1], ARGV[3], m)
+end
+return due
+"""
+# Replace lease KEYS[1] with ARGV[2] (for ARGV[3] seconds) only if it still holds ARGV[1].
+_SWAP_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  redis.call('SET', KEYS[1], ARGV[2], 'EX', tonumber(ARGV[3]))
+  return 1
+end
+return 0
+"""
+
+
+def job_id(kind: str, token_id: int) -> str:
+    return f'sync-{kind}-{token_id}'
+
+
+def _member(kind, token_id):
+    return f'{kind}:{token_id}'
+
+
+def _lease_value(jid, lane):
+    return f'{jid}|{lane}'
+
+
+def _batch_id(kind):
+    return f'sync-batch-{kind}-{uuid.uuid4().hex[:12]}'
+
+
+def _status(job):
+    status = job.get_status()
+    return str(getattr(status, 'value', status))
+
+
+def _parse(member):
+    if isinstance(member, bytes):
+        member = member.decode()
+    kind, token_id = member.split(':', 1)
+    return kind, int(token_id)
+
+
+class MemoryDueStore:
+    def __init__(self):
+        self._due = {}
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def set(self, member, due_at, only_new=False):
+        with self._lock:
+            if only_new and member in self._due:
+                return
+            self._due[member] = due_at
+
+    def get(self, member):
+        return self._due.get(member)
+
+    def claim(self, now, limit, lease_until):
+        with self._lock:
+            due = sorted((d, m) for m, d in self._due.items() if d <= now)[:limit]
+            for _, m in due:
+                self._due[m] = lease_until
+            return [m for _, m in due]
+
+    def remove(self, member):
+        with self._lock:
+            self._due.pop(member, None)
+
+    def _lease(self, member):
+        lease = self._leases.get(member)
+        if lease is not None and lease[1] <= time.time():
+            del self._leases[member]
+            return None
+        return lease
+
+    def acquire(self, member, holder, ttl) -> bool:
+        with self._lock:
+            if self._lease(member) is not None:
+                return False
+            self._leases[member] = (holder, time.time() + ttl)
+            return True
+
+    def holder(self, member):
+        with self._lock:
+            lease = self._lease(member)
+            return lease[0] if lease is not None else None
+
+    def swap(self, member, old, new, ttl) -> bool:
+        with self._lock:
+            lease = self._lease(member)
+            if lease is None or lease[0] != old:
+                return False
+            self._leases[member] = (new, time.time() + ttl)
+            return True
+
+    def release(self, member):
+        with self._lock:
+            self._leases.pop(member, None)
+
+    def clear(self):
+        with self._lock:
+            self._due.clear()
+            self._leases.clear()
+
+
+class RedisDueStore:
+    """Due times in one sorted set and a lease key per pair.
+
+    Claims, lease takes and lease swaps are atomic, so several scheduler
+    loops and API processes never double-enqueue.
+    """
+
+    def __init__(self, url: str = REDIS_URL, key: str = 'sync:due', lease_prefix: str = 'sync:lease:'):
+        from redis import Redis
+        self.redis = Redis.from_url(url)
+        self.key = key
+        self.lease_prefix = lease_prefix
+        self._claim = self.redis.register_script(_CLAIM_LUA)
+        self._swap = self.redis.register_script(_SWAP_LUA)
+
+    def set(self, member, due_at, only_new=False):
+        self.redis.zadd(self.key, {member: due_at}, nx=only_new)
+
+    def get(self, member):
+        return self.redis.zscore(self.key, member)
+
+    def claim(self, now, limit, lease_until):
+        return self._claim(keys=[self.key], args=[now, limit, lease_until])
+
+    def remove(self, member):
+        self.redis.zrem(self.key, member)
+
+    def acquire(self, member, holder, ttl) -> bool:
+        return bool(self.redis.set(self.lease_prefix + member, holder, nx=True, ex=int(ttl)))
+
+    def holder(self, member):
+        value = self.redis.get(self.lease_prefix + member)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def swap(self, member, old, new, ttl) -> bool:
+        return bool(self._swap(keys=[self.lease_prefix + member], args=[old, new, int(ttl)]))
+
+    def release(self, member):
+        self.redis.delete(self.lease_prefix + member)
+
+    def clear(self):
+        self.redis.delete(self.key)
+        for key in self.redis.scan_iter(self.lease_prefix + '*'):
+            self.redis.delete(key)
+
+
+class SyncScheduler:
+    def __init__(self, store=None, queues: dict = None, jitter: float = JITTER):
+        self.store = store if store is not None else _make_store()
+        self._queues = queues
+        self.jitter = jitter
+        self.stats = {'enqueued': 0, 'duplicates': 0, 'promoted': 0, 'claimed': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def queues(self) -> dict:
+        if self._queues is None:
+            from redis import Redis
+            from rq import Queue
+            conn = Redis.from_url(REDIS_URL)
+            self._queues = {lane: Queue(name, connection=conn) for lane, name in QUEUES.items()}
+        return self._queues
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def next_due(self, kind: str, expires_at: float = None, now: float = None) -> float:
+        """Due time after a sync: when ESI's copy expires (or the default interval), plus jitter."""
+        now = time.time() if now is None else now
+        interval = SYNC_KINDS[kind][1]
+        due = expires_at if expires_at and expires_at > now else now + interval
+        due = max(due, now + MIN_INTERVAL)
+        return due + random.uniform(0, self.jitter * interval)
+
+    def mark_synced(self, kind: str, token_id: int, expires_at: float = None, now: float = None) -> float:
+        due = self.next_due(kind, expires_at, now)
+        self.store.set(_member(kind, token_id), due)
+        self.store.release(_member(kind, token_id))
+        return due
+
+    def due_at(self, kind: str, token_id: int):
+        return self.store.get(_member(kind, token_id))
+
+    def add_tokens(self, token_ids, now: float = None):
+        """Start tracking tokens not seen before, spread over the first interval rather than all at once."""
+        now = time.time() if now is None else now
+        for token_id in token_ids:
+            for kind, (_, interval) in SYNC_KINDS.items():
+                self.store.set(_member(kind, token_id), now + random.uniform(0, self.jitter * interval), only_new=True)
+
+    def remove_token(self, token_id: int):
+        for kind in SYNC_KINDS:
+            self.store.remove(_member(kind, token_id))
+
+    def _lease(self, member, value):
+        """Lease `member` to `value` ('job_id|lane').
+
+        Returns None once leased, or (current value, job id, lane, job) for a
+        live holder. A holder whose job finished or failed without releasing
+        is taken over. A holder whose job isn't visible yet is still being
+        queued, so it counts as live.
+        """
+        while True:
+            if self.store.acquire(member, value, CLAIM_LEASE):
+                return None
+            current = self.store.holder(member)
+            if current is None:
+                # released in between
+                continue
+            jid, lane = current.rsplit('|', 1)
+            job = self.queues[lane].fetch_job(jid) if lane in self.queues else None
+            if job is None or _status(job) not in TERMINAL_STATUSES:
+                return current, jid, lane, job
+            if self.store.swap(member, current, value, CLAIM_LEASE):
+                return None
+
+    def _duplicate(self, jid, lane, job):
+        self._count('duplicates')
+        status = _status(job) if job is not None else 'queued'
+        return {'status': status, 'job_id': jid, 'duplicate': True, 'priority': lane}
+
+    def enqueue(self, kind: str, token_id: int, priority: str = 'background') -> dict:
+        """Queue a sync unless the same pair is already queued or running.
+
+        An interactive request for a pair still waiting in the background
+        lane moves it to the interactive lane instead of queueing it twice.
+        The move happens only if the job actually comes off the background
+        queue; one a worker has already taken is reported as a duplicate.
+        """
+        if kind not in SYNC_KINDS or priority not in QUEUES:
+            raise ValueError(f'unknown sync {kind}/{priority}')
+        jid, member = job_id(kind, token_id), _member(kind, token_id)
+        value = _lease_value(jid, priority)
+        held = self._lease(member, value)
+        if held is not None:
+            current, holder, lane, job = held
+            promote = (holder == jid and lane == 'background' and priority == 'interactive'
+                       and job is not None and _status(job) == 'queued')
+            # the swap lets exactly one of several concurrent interactive requests promote
+            if not (promote and self.store.swap(member, current, value, CLAIM_LEASE)):
+                return self._duplicate(holder, lane, job)
+            if not self.queues[lane].remove(job):
+                # a worker dequeued it after the status check: it is running now, so hand the lease back
+                self.store.swap(member, value, current, CLAIM_LEASE)
+                return self._duplicate(holder, lane, job)
+            self._count('promoted')
+        task, interval = SYNC_KINDS[kind]
+        try:
+            job = self.queues[priority].enqueue(task, token_id, job_id=jid, result_ttl=interval)
+        except Exception:
+            self.store.release(member)
+            raise
+        self._count('enqueued')
+        return {'status': 'queued', 'job_id': job.get_id(), 'duplicate': False, 'priority': priority}
+
+    def run_due(self, now: float = None, limit: int = TICK_LIMIT, batch_size: int = BATCH_SIZE) -> list:
+        """Enqueue every pair that is due on the background lane; returns the enqueue results."""
+        now = time.time() if now is None else now
+        claimed = [_parse(m) for m in self.store.claim(now, limit, now + CLAIM_LEASE)]
+        self._count('claimed', len(claimed))
+        if batch_size <= 1:
+            return [self.enqueue(kind, token_id, priority='background') for kind, token_id in claimed]
+        return self._enqueue_batches(claimed, batch_size)
+
+    def _enqueue_batch(self, kind, token_ids, jid):
+        try:
+            job = self.queues['background'].enqueue(BATCH_TASK, token_ids, (kind,), job_id=jid,
+                                                    result_ttl=SYNC_KINDS[kind][1])
+        except Exception:
+            for token_id in token_ids:
+                self.store.release(_member(kind, token_id))
+            raise
+        self._count('enqueued')
+        return {'status': 'queued', 'job_id': job.get_id(), 'duplicate': False,
+                'priority': 'background', 'token_ids': token_ids}
+
+    def _enqueue_batches(self, pairs, batch_size):
+        """Group due pairs into task_sync_tokens jobs per kind.
+
+        Each pair is leased to its batch job first. Pairs already queued, on
+        their own or in another batch, are skipped. A later single-pair
+        enqueue sees the batch as the pair's live job.
+        """
+        out, by_kind = [], {}
+        for kind, token_id in pairs:
+            by_kind.setdefault(kind, []).append(token_id)
+        for kind, token_ids in by_kind.items():
+            chunk, jid = [], _batch_id(kind)
+            for token_id in token_ids:
+                held = self._lease(_member(kind, token_id), _lease_value(jid, 'background'))
+                if held is not None:
+                    out.append(self._duplicate(*held[1:]))
+                    continue
+                chunk.append(token_id)
+                if len(chunk) == batch_size:
+                    out.append(self._enqueue_batch(kind, chunk, jid))
+                    chunk, jid = [], _batch_id(kind)
+            if chunk:
+                out.append(self._enqueue_batch(kind, chunk, jid))
+        return out
+
+    def tick(self, now: float = None) -> list:
+        """Pick up newly linked tokens, then enqueue whatever is due."""
+        self.add_tokens(load_token_ids(), now)
+        return self.run_due(now)
+
+
+def load_token_ids(bind=None) -> list:
+    try:
+        with (bind if bind is not None else engine).connect() as conn:
+            return [r[0] for r in conn.execute(text('SELECT id FROM esi_tokens'))]
+    except SQLAlchemyError:
+        return []
+
+
+def _make_store():
+    if SCHEDULER_BACKEND == 'redis':
+        return RedisDueStore()
+    return MemoryDueStore()
+
+
+# Shared by the sync routes, the tasks and the scheduler loop in this process.
+scheduler = SyncScheduler()
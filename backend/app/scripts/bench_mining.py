@@ -0,0 +1,53 @@
+"""Mining yield throughput: looping compute_mining_yield vs compute_mining_yield_batch.
+
+Usage (from backend/):  python -m app.scripts.bench_mining [skills] [ships] [boosts] [repeats]
+Evaluates every skill x ship x boost combination both ways and checks they agree.
+"""
+import sys
+import json
+import time
+
+import numpy as np
+
+from ..engines.mining import compute_mining_yield, compute_mining_yield_batch
+
+
+def _best(fn, repeats):
+    best = float('inf')
+    out = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def run(n_skills=6, n_ships=200, n_boosts=100, repeats=3):
+    skills = list(range(n_skills))
+    ships = [50.0 + 5 * i for i in range(n_ships)]
+    boosts = [i / n_boosts * 0.5 for i in range(n_boosts)]
+
+    def scalar():
+        return [
+            compute_mining_yield({'mining': s}, {'base_yield': b}, {'fleet_bonus': f})['yield_per_hour']
+            for s in skills for b in ships for f in boosts
+        ]
+
+    def batch():
+        return compute_mining_yield_batch(skills, ships, boosts).yield_per_hour
+
+    loop_s, loop_out = _best(scalar, repeats)
+    batch_s, batch_out = _best(batch, repeats)
+    n = len(loop_out)
+    return {
+        'combinations': n,
+        'loop': {'seconds': round(loop_s, 6), 'per_sec': round(n / loop_s)},
+        'batch': {'seconds': round(batch_s, 6), 'per_sec': round(n / batch_s)},
+        'speedup': round(loop_s / batch_s, 1),
+        'max_abs_diff': float(np.abs(np.asarray(loop_out) - batch_out.ravel()).max()),
+    }
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:5]]
+    print(json.dumps(run(*args), indent=2))
@@ -0,0 +1,98 @@
+"""Per-page latency of /data/assets type enrichment: N+1 lookups vs the shared SDE dictionary.
+
+Usage (from backend/):  python -m app.scripts.bench_sde_lookup [types] [assets] [page_size]
+Runs against a throwaway SQLite file; nothing touches DATABASE_URL.
+"""
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import statistics
+
+from sqlalchemy import create_engine, text
+
+from ..sde import TypeDictionary
+
+PAGE_QUERY = "SELECT item_id, type_id, location_id, quantity, synced_at FROM esi_assets WHERE character_id = :cid ORDER BY item_id LIMIT :lim OFFSET :offset"
+
+
+def _setup(eng, n_types, n_assets):
+    rnd = random.Random(42)
+    with eng.begin() as conn:
+        conn.execute(text("CREATE TABLE sde_types_norm (type_id bigint PRIMARY KEY, name text, group_id integer, market_group_id integer, volume numeric, portion_size integer, base_price numeric, data text)"))
+        conn.execute(text("CREATE TABLE esi_assets (id INTEGER PRIMARY KEY AUTOINCREMENT, character_id bigint, item_id bigint UNIQUE, type_id integer, location_id bigint, quantity integer, synced_at timestamp, data TEXT)"))
+        conn.execute(text("INSERT INTO sde_types_norm (type_id, name, group_id, volume, base_price) VALUES (:t, :n, 1, 1.0, 10.0)"),
+                     [{'t': t, 'n': f'Type {t}'} for t in range(1, n_types + 1)])
+        conn.execute(text("INSERT INTO esi_assets (character_id, item_id, type_id, location_id, quantity) VALUES (1, :i, :t, 60003760, 1)"),
+                     [{'i': i, 't': rnd.randint(1, n_types)} for i in range(1, n_assets + 1)])
+
+
+def _page_n_plus_one(conn, offset, limit):
+    rows = conn.execute(text(PAGE_QUERY), {'cid': 1, 'lim': limit, 'offset': offset}).fetchall()
+    out = []
+    for r in rows:
+        name = conn.execute(text("SELECT name FROM sde_types_norm WHERE type_id = :tid"), {'tid': r[1]}).first()
+        out.append((r[0], name[0] if name else None))
+    return out
+
+
+def _page_dictionary(conn, types, offset, limit):
+    rows = conn.execute(text(PAGE_QUERY), {'cid': 1, 'lim': limit, 'offset': offset}).fetchall()
+    names = types.names(r[1] for r in rows)
+    return [(r[0], names.get(r[1])) for r in rows]
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+        'p50_ms': round(samples[len(samples) // 2] * 1000, 3),
+        'p95_ms': round(samples[int(len(samples) * 0.95) - 1] * 1000, 3),
+    }
+
+
+def run(n_types=20000, n_assets=50000, page_size=1000):
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        eng = create_engine(f'sqlite:///{path}')
+        _setup(eng, n_types, n_assets)
+        types = TypeDictionary(bind=eng)
+        offsets = list(range(0, n_assets, page_size))
+
+        with eng.connect() as conn:
+            before = []
+            for off in offsets:
+                t0 = time.perf_counter()
+                _page_n_plus_one(conn, off, page_size)
+                before.append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            types.get_many([1])
+            load = time.perf_counter() - t0
+
+            after = []
+            for off in offsets:
+                t0 = time.perf_counter()
+                _page_dictionary(conn, types, off, page_size)
+                after.append(time.perf_counter() - t0)
+        eng.dispose()
+    finally:
+        os.remove(path)
+
+    return {
+        'types': n_types,
+        'assets': n_assets,
+        'page_size': page_size,
+        'pages': len(offsets),
+        'before': _summary(before),
+        'after': _summary(after),
+        'dictionary_load_ms': round(load * 1000, 3),
+    }
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:4]]
+    print(json.dumps(run(*args), indent=2))
@@ -0,0 +1,351 @@
+"""Offline benchmark suite: sync throughput, SDE import rate, /data latency and engine throughput.
+
+Usage (from backend/):  python -m app.scripts.bench_suite [--scale small|medium|large] [--only sync,sde,data,engines]
+                                                          [--latency SECONDS] [--out FILE] [--compare OLD.json]
+
+Everything runs against a throwaway SQLite file, synthetic SDE files
+(synth_sde) and an in-process ESI stand-in (fake_esi); nothing touches
+DATABASE_URL, Redis or the network. Results are printed (or written to
+--out) as JSON stamped with the commit, so a run on one commit can be
+compared against another with --compare.
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .. import tasks
+from ..metrics import instrument_engine
+from ..sde import TypeDictionary
+from ..scheduler import SyncScheduler, MemoryDueStore
+from ..routes import data as data_routes
+from ..engines import valuation
+from ..services import cache, esi, http
+from ..services.api_cache import ApiCache
+from ..services.cache import LRUBackend
+from ..services.ratelimit import RateLimiter
+from . import import_sde, synth_sde, bench_mining
+from .fake_esi import FakeEsi
+
+# Token / character ids the benchmark syncs (the fake ESI serves any id).
+CHARACTER_BASE = 90000001
+HISTORY_REGION = 10000002
+SCALES = {
+    'small': {'characters': 2, 'assets': 2000, 'jobs': 50, 'types': 2000, 'blueprints': 500, 'systems': 500,
+              'orders': 20000, 'history_types': 100, 'requests': 50},
+    'medium': {'characters': 10, 'assets': 10000, 'jobs': 200, 'types': 20000, 'blueprints': 5000, 'systems': 5000,
+               'orders': 100000, 'history_types': 500, 'requests': 200},
+    'large': {'characters': 25, 'assets': 50000, 'jobs': 500, 'types': 50000, 'blueprints': 15000, 'systems': 8000,
+              'orders': 300000, 'history_types': 2000, 'requests': 500},
+}
+BENCHMARKS = ('sde', 'sync', 'data', 'engines')
+
+
+class _ExpirableBackend(LRUBackend):
+    """LRU that can report every entry as expired, forcing ETag revalidation on the next read."""
+    expired = False
+
+    def get(self, key):
+        entry = super().get(key)
+        if entry is not None and self.expired:
+            entry = {**entry, 'expires': 0.0}
+        return entry
+
+
+@contextmanager
+def _patched(targets):
+    """Temporarily set module attributes: targets is [(module, name, value)]."""
+    saved = [(mod, name, getattr(mod, name)) for mod, name, _ in targets]
+    for mod, name, value in targets:
+        setattr(mod, name, value)
+    try:
+        yield
+    finally:
+        for mod, name, value in saved:
+            setattr(mod, name, value)
+
+
+@contextmanager
+def offline(workdir: str, fake: FakeEsi):
+    """Point the sync tasks, SDE import and /data routes at `workdir` and `fake`.
+
+    Yields the throwaway engine. Module globals are restored on exit.
+    """
+    eng = instrument_engine(create_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                                          connect_args={'check_same_thread': False}))
+    types = TypeDictionary(bind=eng)
+    api = ApiCache()
+    targets = [
+        (tasks, 'engine', eng),
+        (tasks, 'api_cache', api),
+        (tasks, 'scheduler', SyncScheduler(MemoryDueStore(), queues={})),
+        (import_sde, 'engine', eng),
+        (import_sde, 'api_cache', api),
+        (import_sde, 'DATA_DIR', os.path.join(workdir, 'sde')),
+        (data_routes, 'engine', eng),
+        (data_routes, 'SessionLocal', sessionmaker(autocommit=False, autoflush=False, bind=eng)),
+        (data_routes, 'sde_types', types),
+        (data_routes, 'api_cache', api),
+        (valuation, 'sde_types', types),
+        (cache, 'limiter', RateLimiter(rate=1e9, burst=1e9)),
+        (cache.response_cache, 'backend', _ExpirableBackend(1_000_000)),
+        (esi, '_load_token', lambda token_id: ('bench-token', token_id)),
+    ]
+    with _patched(targets):
+        http.set_transport(fake.transport())
+        try:
+            yield eng
+        finally:
+            http.set_transport(None)
+            eng.dispose()
+
+
+def _rate(n, seconds):
+    return round(n / seconds, 1) if seconds > 0 else None
+
+
+def _latency(samples) -> dict:
+    s = sorted(samples)
+    pick = lambda q: round(s[min(len(s) - 1, int(q * len(s)))] * 1000, 3)
+    return {'n': len(s), 'mean_ms': round(sum(s) / len(s) * 1000, 3), 'p50_ms': pick(0.50), 'p95_ms': pick(0.95),
+            'max_ms': round(s[-1] * 1000, 3)}
+
+
+def bench_sde(workdir: str, params: dict) -> dict:
+    """Import synthetic SDE files, then re-run the import with nothing changed."""
+    t0 = time.perf_counter()
+    counts = synth_sde.generate(os.path.join(workdir, 'sde'), types=params['types'], blueprints=params['blueprints'],
+                                systems=params['systems'])['counts']
+    generate_s = time.perf_counter() - t0
+    snapshot = os.path.join(workdir, 'types.snapshot')
+    with redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        results = import_sde.import_all(workers=1, snapshot_path=snapshot)
+        cold_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        import_sde.import_all(workers=1, snapshot_path=snapshot)
+        unchanged_s = time.perf_counter() - t0
+    errors = [r for r in results if 'error' in r]
+    if errors:
+        raise RuntimeError(f'SDE import failed: {errors}')
+    rows = sum(r['rows'] for r in results)
+    return {
+        'files': counts,
+        'generate_seconds': round(generate_s, 4),
+        'import': {'seconds': round(cold_s, 4), 'rows': rows, 'rows_per_sec': _rate(rows, cold_s)},
+        'unchanged_rerun_seconds': round(unchanged_s, 4),
+    }
+
+
+def _sync_phase(fake, token_ids) -> dict:
+    before = dict(fake.stats)
+    t0 = time.perf_counter()
+    out = tasks.task_sync_tokens(token_ids)
+    seconds = time.perf_counter() - t0
+    if out['errors']:
+        raise RuntimeError(f"sync failed: {out['errors']}")
+    rows = pages = 0
+    for result in out['results'].values():
+        rows += result['assets']['inserted'] + result['industry']['inserted']
+        pages += result['assets']['pages'] + 1
+    return {
+        'seconds': round(seconds, 4),
+        'rows': rows,
+        'rows_per_sec': _rate(rows, seconds),
+        'pages_per_sec': _rate(pages, seconds),
+        'esi_requests': fake.stats['requests'] - before['requests'],
+        'not_modified': fake.stats['not_modified'] - before['not_modified'],
+        'mb_downloaded': round((fake.stats['bytes'] - before['bytes']) / 1e6, 2),
+    }
+
+
+def bench_sync(fake: FakeEsi, params: dict) -> dict:
+    """Assets + industry sync for every character: cold, with fresh cache entries, and revalidated by ETag."""
+    token_ids = list(range(CHARACTER_BASE, CHARACTER_BASE + params['characters']))
+    backend = cache.response_cache.backend
+    cold = _sync_phase(fake, token_ids)
+    warm = _sync_phase(fake, token_ids)
+    backend.expired = True
+    try:
+        revalidated = _sync_phase(fake, token_ids)
+    finally:
+        backend.expired = False
+    return {'characters': len(token_ids), 'cold': cold, 'warm': warm, 'revalidated': revalidated}
+
+
+def bench_data(params: dict) -> dict:
+    """/data/* latency through the full app stack: computed, served from the API cache, and 304."""
+    from fastapi.testclient import TestClient
+    from ..main import app
+
+    client = TestClient(app)
+    api = data_routes.api_cache
+    n = params['requests']
+    cid = CHARACTER_BASE
+    first = client.get(f'/data/assets/{cid}', params={'limit': 100}).json()
+    routes = {
+        'assets_first_page': f'/data/assets/{cid}?limit=100',
+        'assets_cursor_page': f"/data/assets/{cid}?limit=100&cursor={first['next_cursor']}",
+        'industry_jobs': f'/data/industry-jobs/{cid}?limit=100',
+        'sde_type': f'/data/sde-type/{synth_sde.TYPE_BASE + 1}',
+    }
+    out = {}
+    for name, url in routes.items():
+        uncached, cached, revalidated = [], [], []
+        for _ in range(n):
+            api.clear()
+            t0 = time.perf_counter()
+            r = client.get(url)
+            uncached.append(time.perf_counter() - t0)
+            if r.status_code != 200:
+                raise RuntimeError(f'{url}: HTTP {r.status_code}')
+        etag = r.headers['etag']
+        for _ in range(n):
+            t0 = time.perf_counter()
+            client.get(url)
+            cached.append(time.perf_counter() - t0)
+        for _ in range(n):
+            t0 = time.perf_counter()
+            client.get(url, headers={'If-None-Match': etag})
+            revalidated.append(time.perf_counter() - t0)
+        out[name] = {'uncached': _latency(uncached), 'cached': _latency(cached), 'not_modified': _latency(revalidated)}
+    return out
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+
+def bench_engines(workdir: str, fake: FakeEsi, params: dict) -> dict:
+    """BOM explosion over the synthetic blueprints, mining batch, market indicators and order index build."""
+    from ..engines.blueprints import RecipeGraph, recipes_from_sde
+    from ..engines.bom import BomEngine
+    from ..engines.market_analytics import HistoryMatrix, compute_indicators
+    from ..services.market import OrderIndex, _page_columns
+
+    out = {}
+    sde_dir = os.path.join(workdir, 'sde')
+    if not os.path.exists(os.path.join(sde_dir, 'blueprints.jsonl')):
+        synth_sde.generate(sde_dir, types=params['types'], blueprints=params['blueprints'], systems=params['systems'])
+    with open(os.path.join(sde_dir, 'blueprints.jsonl'), encoding='utf-8') as f:
+        graph_s, graph = _timed(lambda: RecipeGraph(r for line in f for r in recipes_from_sde(json.loads(line))))
+    products = [r.product_type for r in graph.recipes]
+    bom = BomEngine(graph, cache_size=len(products) * 4)
+    explode_s, _ = _timed(lambda: [bom.explode(t) for t in products])
+    lines = [{'type_id': t, 'quantity': 10} for t in products[-50:]]
+    build_s, _ = _timed(lambda: bom.build(lines))
+    out['bom'] = {'recipes': len(products), 'graph_load_seconds': round(graph_s, 4),
+                  'explode_all_seconds': round(explode_s, 4), 'explode_per_sec': _rate(len(products), explode_s),
+                  'build_50_lines_seconds': round(build_s, 4)}
+
+    mining = bench_mining.run(repeats=1)
+    out['mining'] = {'combinations': mining['combinations'], 'batch_per_sec': mining['batch']['per_sec'],
+                     'loop_per_sec': mining['loop']['per_sec']}
+
+    type_ids = fake.type_ids[:params['history_types']]
+    histories = {t: fake.history(HISTORY_REGION, t) for t in type_ids}
+    matrix_s, matrix = _timed(lambda: HistoryMatrix.from_histories(histories, end='2025-12-31'))
+    indicators_s, _ = _timed(lambda: compute_indicators(matrix))
+    out['market_indicators'] = {'types': len(type_ids), 'matrix_seconds': round(matrix_s, 4),
+                                'indicators_seconds': round(indicators_s, 4),
+                                'types_per_sec': _rate(len(type_ids), matrix_s + indicators_s)}
+
+    orders = fake.orders(HISTORY_REGION)
+    index_s, index = _timed(lambda: OrderIndex.build(_page_columns(orders)))
+    best_s, _ = _timed(lambda: index.best(fake.type_ids))
+    out['order_index'] = {'orders': len(orders), 'build_seconds': round(index_s, 4),
+                          'orders_per_sec': _rate(len(orders), index_s), 'best_all_types_seconds': round(best_s, 4)}
+    return out
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(scale: str = 'small', only=None, latency: float = 0.0, **overrides) -> dict:
+    """Run the selected benchmarks (all by default) in a fresh temp dir; returns the JSON-ready report."""
+    params = dict(SCALES[scale], **overrides)
+    only = list(only or BENCHMARKS)
+    workdir = tempfile.mkdtemp(prefix='ieve-bench-')
+    fake = FakeEsi(params['assets'], params['jobs'], params['orders'],
+                   type_ids=range(synth_sde.TYPE_BASE, synth_sde.TYPE_BASE + params['types']), latency=latency)
+    results = {}
+    try:
+        with offline(workdir, fake):
+            # the data benchmark reads what sde and sync wrote, so they run first when selected
+            if 'sde' in only or 'data' in only:
+                results['sde'] = bench_sde(workdir, params)
+            if 'sync' in only or 'data' in only:
+                results['sync'] = bench_sync(fake, params)
+            if 'data' in only:
+                results['data'] = bench_data(params)
+            if 'engines' in only:
+                results['engines'] = bench_engines(workdir, fake, params)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'meta': {'commit': _commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+                 'started': datetime.utcnow().isoformat(timespec='seconds'), 'scale': scale,
+                 'latency': latency, 'params': params},
+        'results': {k: results[k] for k in BENCHMARKS if k in results and k in only},
+    }
+
+
+def _flatten(obj, prefix=''):
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            yield from _flatten(v, f'{prefix}.{k}' if prefix else k)
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        yield prefix, obj
+
+
+def compare(old: dict, new: dict) -> list:
+    """[(metric, old, new, relative change)] for every numeric result present in both reports."""
+    before = dict(_flatten(old.get('results', {})))
+    rows = []
+    for key, value in _flatten(new.get('results', {})):
+        if key in before:
+            change = (value - before[key]) / before[key] if before[key] else None
+            rows.append((key, before[key], value, change))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmarks for sync, SDE import, /data and engines')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--only', default=None, help=f"comma-separated subset of {','.join(BENCHMARKS)}")
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds of simulated ESI latency per request')
+    parser.add_argument('--out', default=None, help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', default=None, help='earlier JSON report to print relative changes against')
+    args = parser.parse_args()
+
+    report = run(args.scale, args.only.split(',') if args.only else None, args.latency)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            old = json.load(f)
+        print(f"\nvs {args.compare} (commit {old.get('meta', {}).get('commit')}):", file=sys.stderr)
+        for key, a, b, change in compare(old, report):
+            pct = f'{change:+.1%}' if change is not None else 'n/a'
+            print(f'  {key:<60} {a:>14} -> {b:<14} {pct}', file=sys.stderr)
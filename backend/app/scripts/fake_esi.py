@@ -0,0 +1,203 @@
+"""Local ESI stand-in: an httpx mock transport serving deterministic synthetic data.
+
+Install it with services.http.set_transport(FakeEsi(...).transport()) and every
+ESI call made through the shared client hits it instead of the network.
+
+Served (paths as under https://esi.evetech.net/latest):
+  /characters/{id}/assets/        paginated, 1000 per page
+  /characters/{id}/industry/jobs/
+  /markets/{region}/orders/       paginated, 1000 per page
+  /markets/prices/
+  /markets/{region}/history/?type_id=
+
+Responses carry ETag, Expires, Last-Modified, X-Pages and the error-limit
+headers the way ESI does. A matching If-None-Match gets a 304, and
+`latency` adds a fixed delay to each response.
+"""
+import re
+import json
+import time
+import asyncio
+import hashlib
+import random
+import threading
+from datetime import date, timedelta
+from email.utils import formatdate
+
+import httpx
+
+PAGE_SIZE = 1000
+# Cache times ESI advertises per route (seconds).
+CACHE_SECONDS = {'assets': 3600, 'jobs': 300, 'orders': 300, 'prices': 3600, 'history': 3600}
+STATIONS = (60003760, 60008494, 60011866, 60004588, 60005686)
+
+_ROUTES = [
+    ('assets', re.compile(r'/characters/(\d+)/assets/$')),
+    ('jobs', re.compile(r'/characters/(\d+)/industry/jobs/$')),
+    ('prices', re.compile(r'/markets/prices/$')),
+    ('orders', re.compile(r'/markets/(\d+)/orders/$')),
+    ('history', re.compile(r'/markets/(\d+)/history/$')),
+]
+
+
+class FakeEsi:
+    def __init__(self, assets_per_character: int = 5000, jobs_per_character: int = 50,
+                 orders_per_region: int = 20000, type_ids=None, latency: float = 0.0, seed: int = 42):
+        self.assets_per_character = assets_per_character
+        self.jobs_per_character = jobs_per_character
+        self.orders_per_region = orders_per_region
+        self.type_ids = list(type_ids) if type_ids else list(range(1000, 3000))
+        self.latency = latency
+        self.seed = seed
+        self.stats = {'requests': 0, 'not_modified': 0, 'bytes': 0}
+        self._bodies = {}
+        self._lock = threading.Lock()
+
+    # --- synthetic data -----------------------------------------------------------
+
+    def assets(self, character_id: int) -> list:
+        rnd = random.Random(self.seed * 7919 + character_id)
+        base = character_id * 10_000_000
+        items, containers = [], []
+        for i in range(self.assets_per_character):
+            item_id = base + i + 1
+            if containers and rnd.random() < 0.3:
+                location, flag, kind = rnd.choice(containers), 'Cargo', 'item'
+            else:
+                location, flag, kind = rnd.choice(STATIONS), 'Hangar', 'station'
+            singleton = rnd.random() < 0.05
+            items.append({
+                'item_id': item_id,
+                'type_id': rnd.choice(self.type_ids),
+                'location_id': location,
+                'location_flag': flag,
+                'location_type': kind,
+                'quantity': 1 if singleton else rnd.randint(1, 100000),
+                'is_singleton': singleton,
+            })
+            if singleton and len(containers) < 200:
+                containers.append(item_id)
+        return items
+
+    def jobs(self, character_id: int) -> list:
+        rnd = random.Random(self.seed * 104729 + character_id)
+        return [{
+            'job_id': character_id * 100_000 + i + 1,
+            'installer_id': character_id,
+            'activity_id': 1,
+            'blueprint_type_id': 900000 + rnd.randint(0, 4999),
+            'product_type_id': rnd.choice(self.type_ids),
+            'runs': rnd.randint(1, 100),
+            'status': rnd.choice(('active', 'active', 'ready', 'delivered')),
+            'facility_id': rnd.choice(STATIONS),
+            'output_location_id': rnd.choice(STATIONS),
+            'start_date': '2026-01-01T00:00:00Z',
+            'end_date': '2026-01-02T00:00:00Z',
+        } for i in range(self.jobs_per_character)]
+
+    def orders(self, region_id: int) -> list:
+        rnd = random.Random(self.seed * 15485863 + region_id)
+        out = []
+        for i in range(self.orders_per_region):
+            is_buy = rnd.random() < 0.45
+            out.append({
+                'order_id': region_id * 10_000_000 + i,
+                'type_id': rnd.choice(self.type_ids),
+                'location_id': rnd.choice(STATIONS),
+                'system_id': 30000142,
+                'price': round(rnd.uniform(1.0, 1e6) * (0.95 if is_buy else 1.0), 2),
+                'volume_total': 1000,
+                'volume_remain': rnd.randint(1, 1000),
+                'min_volume': 1,
+                'is_buy_order': is_buy,
+                'duration': 90,
+                'issued': '2026-01-01T00:00:00Z',
+                'range': 'region',
+            })
+        return out
+
+    def prices(self) -> list:
+        rnd = random.Random(self.seed)
+        return [{'type_id': t, 'average_price': round(rnd.uniform(1.0, 1e6), 2),
+                 'adjusted_price': round(rnd.uniform(1.0, 1e6), 2)} for t in self.type_ids]
+
+    def history(self, region_id: int, type_id: int, days: int = 400) -> list:
+        rnd = random.Random(self.seed + region_id * 31 + type_id)
+        start = date(2026, 1, 1) - timedelta(days=days)
+        price = rnd.uniform(10.0, 1e5)
+        out = []
+        for d in range(days):
+            price *= 1 + rnd.gauss(0, 0.02)
+            out.append({'date': (start + timedelta(days=d)).isoformat(), 'average': round(price, 2),
+                        'highest': round(price * 1.05, 2), 'lowest': round(price * 0.95, 2),
+                        'order_count': rnd.randint(1, 500), 'volume': rnd.randint(1, 100000)})
+        return out
+
+    # --- transport ------------------------------------------------------------------
+
+    def _dataset(self, route, ident, request):
+        if route == 'assets':
+            return self.assets(ident)
+        if route == 'jobs':
+            return self.jobs(ident)
+        if route == 'orders':
+            return self.orders(ident)
+        if route == 'prices':
+            return self.prices()
+        return self.history(ident, int(request.url.params.get('type_id', 0)))
+
+    def _pages(self, route, ident, request):
+        """Encoded page bodies, generated once per dataset and kept."""
+        key = (route, ident, request.url.params.get('type_id'))
+        with self._lock:
+            pages = self._bodies.get(key)
+        if pages is None:
+            data = self._dataset(route, ident, request)
+            if route in ('assets', 'orders'):
+                chunks = [data[i:i + PAGE_SIZE] for i in range(0, len(data), PAGE_SIZE)] or [[]]
+            else:
+                chunks = [data]
+            pages = [json.dumps(c).encode('utf-8') for c in chunks]
+            with self._lock:
+                self._bodies[key] = pages
+        return pages
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        for route, pattern in _ROUTES:
+            m = pattern.search(path)
+            if m:
+                break
+        else:
+            return httpx.Response(404, json={'error': 'Not found'})
+        ident = int(m.group(1)) if m.groups() else None
+        page = int(request.url.params.get('page', 1))
+        pages = self._pages(route, ident, request)
+        if not 1 <= page <= len(pages):
+            return httpx.Response(404, json={'error': 'Requested page does not exist!'})
+        body = pages[page - 1]
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        headers = {
+            'ETag': etag,
+            'Expires': formatdate(time.time() + CACHE_SECONDS[route], usegmt=True),
+            'Last-Modified': formatdate(time.time() - 60, usegmt=True),
+            'X-Pages': str(len(pages)),
+            'X-ESI-Error-Limit-Remain': '100',
+            'X-ESI-Error-Limit-Reset': '60',
+            'Content-Type': 'application/json; charset=UTF-8',
+        }
+        with self._lock:
+            self.stats['requests'] += 1
+            if request.headers.get('If-None-Match') == etag:
+                self.stats['not_modified'] += 1
+                return httpx.Response(304, headers=headers)
+            self.stats['bytes'] += len(body)
+        return httpx.Response(200, content=body, headers=headers)
+
+    async def handle_async(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(self.latency)
+        return self.handle(request)
+
+    def transport(self) -> httpx.MockTransport:
+        """Mock transport for the shared clients (async only when `latency` is set)."""
+        return httpx.MockTransport(self.handle_async if self.latency else self.handle)
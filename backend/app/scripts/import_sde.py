@@ -1,125 +1,280 @@
+import io
 import os
 import glob
 import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 from sqlalchemy import text
+from redis.exceptions import RedisError
 from ..db import engine
-import json
+from ..bulk import BulkWriter, BATCH_SIZE, _copy_value
+from ..sde_snapshot import SNAPSHOT_PATH, write_snapshot
+from ..services.api_cache import api_cache
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..'))
 DATA_DIR = os.path.join(ROOT, 'eve-static-data')
 if not os.path.isdir(DATA_DIR):
     DATA_DIR = os.path.join(ROOT, '..', 'eve-static-data')
 
+STATE_TABLE = 'sde_import_state'
+# Rows per COPY chunk / executemany batch while streaming a file.
+COPY_CHUNK = 5000
 
-def import_all():
-    files = glob.glob(os.path.join(DATA_DIR, '*.jsonl'))
-    print(f"Found {len(files)} files to import")
 
-    for fp in files:
-        name = os.path.basename(fp).replace('.jsonl', '')
-        table = f'sde_{name}'
-        print(f"Importing {name} -> {table}")
+def _file_hash(fp):
+    h = hashlib.sha256()
+    with open(fp, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
 
-        # create table (Postgres JSONB if available)
-        try:
-            with engine.begin() as conn:
-                # detect dialect
-                dialect = engine.dialect.name
-                if dialect == 'postgresql':
-                    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (id serial PRIMARY KEY, data jsonb);"))
-                else:
-                    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT);"))
-
-                batch = []
-                with open(fp, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        obj = json.loads(line)
-                        if obj.get('_key') == 'sde':
-                            continue
-                        if dialect == 'postgresql':
-                            batch.append((json.dumps(obj),))
-                        else:
-                            batch.append((json.dumps(obj),))
-
-                        if len(batch) >= 1000:
-                            if dialect == 'postgresql':
-                                conn.execute(text(f"INSERT INTO {table} (data) VALUES (CAST(:data AS jsonb))"), [{'data':b[0]} for b in batch])
-                            else:
-                                conn.execute(text(f"INSERT INTO {table} (data) VALUES (:data)"), [{'data':b[0]} for b in batch])
-                            batch = []
-
-                if batch:
-                    if dialect == 'postgresql':
-                        conn.execute(text(f"INSERT INTO {table} (data) VALUES (:data)"), [{'data':b[0]} for b in batch])
-                    else:
-                        conn.execute(text(f"INSERT INTO {table} (data) VALUES (:data)"), [{'data':b[0]} for b in batch])
-                print(f"  imported {table}")
-        except Exception as e:
-            print(f"Error importing {name}: {e}")
-
-
-def normalize_types():
+
+def _iter_records(fp):
+    with open(fp, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            if obj.get('_key') == 'sde':
+                continue
+            yield obj
+
+
+def _ensure_state_table(conn):
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {STATE_TABLE} (name text PRIMARY KEY, sha256 text, rows integer, imported_at timestamp);"))
+
+
+def _is_unchanged(conn, name, digest):
+    row = conn.execute(text(f"SELECT sha256 FROM {STATE_TABLE} WHERE name = :n"), {'n': name}).first()
+    return row is not None and row[0] == digest
+
+
+def _record_state(conn, name, digest, rows):
+    params = {'n': name, 'h': digest, 'r': rows, 'at': datetime.utcnow().isoformat()}
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text(f"INSERT INTO {STATE_TABLE} (name, sha256, rows, imported_at) VALUES (:n, :h, :r, :at) ON CONFLICT (name) DO UPDATE SET sha256=:h, rows=:r, imported_at=:at"), params)
+    else:
+        conn.execute(text(f"INSERT OR REPLACE INTO {STATE_TABLE} (name, sha256, rows, imported_at) VALUES (:n, :h, :r, :at)"), params)
+
+
+def _copy_raw(conn, table, records):
+    """Stream JSON documents into `table`.data with COPY, one chunk at a time."""
+    cursor = conn.connection.cursor()
+    rows = 0
+    try:
+        buf = io.StringIO()
+        pending = 0
+        for obj in records:
+            buf.write(_copy_value(json.dumps(obj)))
+            buf.write('\n')
+            pending += 1
+            if pending >= COPY_CHUNK:
+                buf.seek(0)
+                cursor.copy_expert(f"COPY {table} (data) FROM STDIN", buf)
+                rows += pending
+                buf, pending = io.StringIO(), 0
+        if pending:
+            buf.seek(0)
+            cursor.copy_expert(f"COPY {table} (data) FROM STDIN", buf)
+            rows += pending
+    finally:
+        cursor.close()
+    return rows
+
+
+def _insert_raw(conn, table, records):
+    stmt = text(f"INSERT INTO {table} (data) VALUES (:data)")
+    rows = 0
+    batch = []
+    for obj in records:
+        batch.append({'data': json.dumps(obj)})
+        if len(batch) >= BATCH_SIZE:
+            conn.execute(stmt, batch)
+            rows += len(batch)
+            batch = []
+    if batch:
+        conn.execute(stmt, batch)
+        rows += len(batch)
+    return rows
+
+
+def import_file(fp, force=False):
+    """Import one *.jsonl file into sde_<name>, replacing its previous contents.
+
+    Skipped when the file's sha256 matches the last successful import.
+    """
+    name = os.path.basename(fp).replace('.jsonl', '')
+    table = f'sde_{name}'
+    start = time.perf_counter()
+    digest = _file_hash(fp)
+    with engine.begin() as conn:
+        _ensure_state_table(conn)
+        if not force and _is_unchanged(conn, name, digest):
+            return {'name': name, 'skipped': True, 'rows': 0, 'elapsed': round(time.perf_counter() - start, 3)}
+
+        dialect = engine.dialect.name
+        if dialect == 'postgresql':
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (id serial PRIMARY KEY, data jsonb);"))
+            conn.execute(text(f"TRUNCATE {table}"))
+            rows = _copy_raw(conn, table, _iter_records(fp))
+        else:
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT);"))
+            conn.execute(text(f"DELETE FROM {table}"))
+            rows = _insert_raw(conn, table, _iter_records(fp))
+        _record_state(conn, name, digest, rows)
+    return {'name': name, 'skipped': False, 'rows': rows, 'elapsed': round(time.perf_counter() - start, 3)}
+
+
+def _normalize(fp, state_name, table, ddl, key, columns, to_row, force=False):
+    start = time.perf_counter()
+    digest = _file_hash(fp)
+    with engine.begin() as conn:
+        _ensure_state_table(conn)
+        if not force and _is_unchanged(conn, state_name, digest):
+            return {'name': state_name, 'skipped': True, 'rows': 0, 'elapsed': round(time.perf_counter() - start, 3)}
+        conn.execute(text(ddl))
+        writer = BulkWriter(conn, table, columns, key=key, casts={'data': 'jsonb'})
+        for obj in _iter_records(fp):
+            writer.add([to_row(obj)])
+        stats = writer.close()
+        _record_state(conn, state_name, digest, stats['rows'])
+    return {'name': state_name, 'skipped': False, 'rows': stats['rows'], 'elapsed': round(time.perf_counter() - start, 3)}
+
+
+def _type_row(obj):
+    return {
+        'type_id': int(obj.get('typeID', obj.get('id') or obj.get('_key') or 0)),
+        'name': obj.get('name', ''),
+        'group_id': obj.get('groupID') or obj.get('group_id'),
+        'market_group_id': obj.get('marketGroupID') or obj.get('market_group_id'),
+        'volume': obj.get('volume'),
+        'portion_size': obj.get('portionSize') or obj.get('portion_size'),
+        'base_price': obj.get('basePrice') or obj.get('base_price'),
+        'data': json.dumps(obj),
+    }
+
+
+def _group_row(obj):
+    return {
+        'group_id': obj.get('groupID') or obj.get('id') or obj.get('_key'),
+        'name': obj.get('name'),
+        'category_id': obj.get('categoryID') or obj.get('category_id'),
+        'data': json.dumps(obj),
+    }
+
+
+def normalize_types(force=False):
     # read raw file and create normalized types table
-    fp = None
-    candidates = [os.path.join(DATA_DIR, 'types.jsonl'), os.path.join(DATA_DIR, 'typeMaterials.jsonl')]
-    if os.path.exists(candidates[0]):
-        fp = candidates[0]
-    if not fp:
+    fp = os.path.join(DATA_DIR, 'types.jsonl')
+    if not os.path.exists(fp):
         print('types.jsonl not found, skipping types normalization')
-        return
-
+        return None
     table = 'sde_types_norm'
-    with engine.begin() as conn:
-        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (type_id bigint PRIMARY KEY, name text, group_id integer, market_group_id integer, volume numeric, portion_size integer, base_price numeric, data jsonb);") )
-        with open(fp, 'r', encoding='utf-8') as f:
-            batch = []
-            for line in f:
-                obj = json.loads(line)
-                if obj.get('_key') == 'sde':
-                    continue
-                type_id = int(obj.get('typeID', obj.get('id') or 0))
-                name = obj.get('name', '')
-                group_id = obj.get('groupID') or obj.get('group_id')
-                market_group_id = obj.get('marketGroupID') or obj.get('market_group_id')
-                volume = obj.get('volume')
-                portion = obj.get('portionSize') or obj.get('portion_size')
-                base_price = obj.get('basePrice') or obj.get('base_price')
-                conn.execute(text(f"INSERT INTO {table} (type_id,name,group_id,market_group_id,volume,portion_size,base_price,data) VALUES (:tid,:name,:gid,:mgid,:vol,:ps,:bp,CAST(:data AS jsonb)) ON CONFLICT (type_id) DO NOTHING"),
-                             {'tid': type_id, 'name': name, 'gid': group_id, 'mgid': market_group_id, 'vol': volume, 'ps': portion, 'bp': base_price, 'data': json.dumps(obj)})
-    print('Normalized types into', table)
-
-
-def normalize_groups():
+    result = _normalize(
+        fp, 'norm:types', table,
+        f"CREATE TABLE IF NOT EXISTS {table} (type_id bigint PRIMARY KEY, name text, group_id integer, market_group_id integer, volume numeric, portion_size integer, base_price numeric, data jsonb);",
+        'type_id', ['type_id', 'name', 'group_id', 'market_group_id', 'volume', 'portion_size', 'base_price', 'data'],
+        _type_row, force,
+    )
+    print('Normalized types into', table, '(unchanged)' if result['skipped'] else '')
+    return result
+
+
+def normalize_groups(force=False):
     fp = os.path.join(DATA_DIR, 'groups.jsonl')
     if not os.path.exists(fp):
         print('groups.jsonl not found, skipping groups normalization')
-        return
+        return None
     table = 'sde_groups_norm'
-    with engine.begin() as conn:
-        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (group_id integer PRIMARY KEY, name text, category_id integer, data jsonb);") )
-        with open(fp, 'r', encoding='utf-8') as f:
-            for line in f:
-                obj = json.loads(line)
-                if obj.get('_key') == 'sde':
-                    continue
-                gid = obj.get('groupID') or obj.get('id')
-                name = obj.get('name')
-                cat = obj.get('categoryID') or obj.get('category_id')
-                conn.execute(text(f"INSERT INTO {table} (group_id,name,category_id,data) VALUES (:gid,:name,:cat,CAST(:data AS jsonb)) ON CONFLICT (group_id) DO NOTHING"),
-                             {'gid': gid, 'name': name, 'cat': cat, 'data': json.dumps(obj)})
-    print('Normalized groups into', table)
+    result = _normalize(
+        fp, 'norm:groups', table,
+        f"CREATE TABLE IF NOT EXISTS {table} (group_id integer PRIMARY KEY, name text, category_id integer, data jsonb);",
+        'group_id', ['group_id', 'name', 'category_id', 'data'],
+        _group_row, force,
+    )
+    print('Normalized groups into', table, '(unchanged)' if result['skipped'] else '')
+    return result
 
 
-if __name__ == '__main__':
-    import_all()
-    try:
-        normalize_types()
-    except Exception as e:
-        print('normalize_types error:', e)
+def build_snapshot(path=SNAPSHOT_PATH):
+    """Write the memory-mapped types snapshot from sde_types_norm."""
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT type_id, name, group_id, volume, base_price FROM sde_types_norm")).fetchall()
+    count = write_snapshot(rows, path)
+    print(f'Wrote SDE snapshot with {count} types to {path}')
+    return count
+
+
+def _init_worker():
+    # forked children must not reuse the parent's pooled connections
+    engine.dispose(close=False)
+
+
+def _run(job):
+    kind, arg, force = job
     try:
-        normalize_groups()
+        if kind == 'file':
+            return import_file(arg, force)
+        if kind == 'types':
+            return normalize_types(force)
+        return normalize_groups(force)
     except Exception as e:
-        print('normalize_groups error:', e)
+        return {'name': arg if kind == 'file' else kind, 'error': str(e)}
+
+
+def import_all(workers=None, force=False, snapshot_path=SNAPSHOT_PATH):
+    """Import every *.jsonl file plus the normalized tables, in parallel on Postgres.
+
+    SQLite serializes writers, so it runs everything in-process one file at a time.
+    The types snapshot is rebuilt whenever sde_types_norm changed.
+    """
+    files = sorted(glob.glob(os.path.join(DATA_DIR, '*.jsonl')), key=os.path.getsize, reverse=True)
+    print(f"Found {len(files)} files to import")
+    jobs = [('file', fp, force) for fp in files] + [('types', None, force), ('groups', None, force)]
+
+    if engine.dialect.name != 'postgresql':
+        workers = 1
+    workers = workers or os.cpu_count() or 1
+
+    # create the state table up front so parallel workers don't race on its DDL
+    with engine.begin() as conn:
+        _ensure_state_table(conn)
+
+    start = time.perf_counter()
+    if workers == 1:
+        results = [_run(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            results = list(pool.map(_run, jobs))
+    results = [r for r in results if r]
+
+    for r in results:
+        if 'error' in r:
+            print(f"Error importing {r['name']}: {r['error']}")
+        elif r['skipped']:
+            print(f"  unchanged {r['name']}")
+        else:
+            print(f"  imported {r['name']}: {r['rows']} rows in {r['elapsed']}s")
+    types_norm = next((r for r in results if r.get('name') == 'norm:types'), None)
+    if types_norm and 'error' not in types_norm and (not types_norm['skipped'] or not os.path.exists(snapshot_path)):
+        build_snapshot(snapshot_path)
+    if any('error' not in r and not r['skipped'] for r in results):
+        # cached /data responses carry SDE names and rows; drop them
+        try:
+            api_cache.bump_sde()
+        except RedisError:
+            print('Could not invalidate cached API responses; they expire with API_CACHE_SDE_TTL')
+    print(f"SDE import finished in {time.perf_counter() - start:.1f}s")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import EVE SDE *.jsonl files')
+    parser.add_argument('--force', action='store_true', help='re-import files even if unchanged')
+    parser.add_argument('--workers', type=int, default=None, help='parallel import processes (Postgres only)')
+    args = parser.parse_args()
+    import_all(workers=args.workers, force=args.force)
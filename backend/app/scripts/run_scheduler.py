@@ -0,0 +1,31 @@
+"""Sync scheduler loop: enqueue every token/endpoint pair as it falls due.
+
+Usage (from backend/):  python -m app.scripts.run_scheduler [interval_seconds]
+Run with SYNC_SCHEDULER_BACKEND=redis so the workers' due times are visible here.
+Several copies can run side by side; each due pair is claimed by exactly one.
+"""
+import sys
+import time
+import logging
+
+from ..scheduler import scheduler
+
+log = logging.getLogger('scheduler')
+
+
+def main(interval=15.0):
+    while True:
+        try:
+            queued = scheduler.tick()
+        except Exception:
+            log.exception('scheduler tick failed')
+        else:
+            fresh = sum(1 for r in queued if not r['duplicate'])
+            if queued:
+                log.info('%d due, %d enqueued', len(queued), fresh)
+        time.sleep(interval)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main(*[float(a) for a in sys.argv[1:2]])
@@ -0,0 +1,38 @@
+"""Killmail ingester: follow ZKILL_SOURCE and count kills into the shared buckets.
+
+Usage (from backend/):  python -m app.scripts.run_zkill
+Run with ZKILL_BACKEND=redis so every API process reads what this one counts.
+Run exactly one copy: RedisQ hands each killmail to only one reader of a
+queue, so a second ingester would split the feed.
+"""
+import sys
+import asyncio
+import logging
+
+from ..services.http import close_client
+from ..services.zkill import ZKILL_BACKEND, ZKillIngester, make_source
+
+log = logging.getLogger('zkill')
+
+
+async def _run(ingester):
+    try:
+        await ingester.run()
+    finally:
+        await close_client()
+
+
+def main():
+    source = make_source()
+    if source is None:
+        log.info('ZKILL_SOURCE is not set; nothing to ingest')
+        return 0
+    if ZKILL_BACKEND != 'redis':
+        log.warning('ZKILL_BACKEND is %r; API processes will not see these counts', ZKILL_BACKEND)
+    asyncio.run(_run(ZKillIngester(source)))
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Synthetic SDE *.jsonl files at any scale, for benchmarks and load tests.
+
+Usage (from backend/):  python -m app.scripts.synth_sde OUT_DIR [--types N] [--blueprints N] [--systems N]
+
+Writes types, groups, blueprints and mapSolarSystems in the shape the SDE
+import and the engines read. Blueprints form a layered DAG: raw materials at
+the bottom, and each product built from raws and products made earlier, so
+BOM explosion goes several levels deep. Same seed, same files.
+"""
+import os
+import json
+import random
+import argparse
+
+TYPE_BASE = 1000
+BLUEPRINT_BASE = 900000
+SYSTEM_BASE = 30000001
+REGION_BASE = 10000001
+
+
+def _write(path, records):
+    n = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for obj in records:
+            f.write(json.dumps(obj))
+            f.write('\n')
+            n += 1
+    return n
+
+
+def generate(out_dir: str, types: int = 20000, groups: int = 500, blueprints: int = 5000,
+             systems: int = 5000, regions: int = 60, max_materials: int = 8, seed: int = 42) -> dict:
+    """Write the files into `out_dir`; returns counts plus the raw / manufactured type ids."""
+    rnd = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    type_ids = list(range(TYPE_BASE, TYPE_BASE + types))
+    n_raw = max(8, types // 50)
+    raw = type_ids[:n_raw]
+    products = type_ids[n_raw:n_raw + min(blueprints, types - n_raw)]
+
+    def type_records():
+        for t in type_ids:
+            yield {
+                '_key': t,
+                'typeID': t,
+                'name': f'Synthetic Type {t}',
+                'groupID': rnd.randint(1, groups),
+                'marketGroupID': rnd.randint(1, 2000),
+                'volume': round(rnd.uniform(0.01, 500.0), 2),
+                'portionSize': 1,
+                'basePrice': round(rnd.uniform(1.0, 5_000_000.0), 2),
+                'published': True,
+            }
+
+    def group_records():
+        for g in range(1, groups + 1):
+            yield {'_key': g, 'groupID': g, 'name': f'Synthetic Group {g}', 'categoryID': rnd.randint(1, 40)}
+
+    def blueprint_records():
+        for i, product in enumerate(products):
+            # inputs: raws plus anything manufactured before this product, so the graph stays acyclic
+            pool = raw + products[max(0, i - 200):i]
+            inputs = rnd.sample(pool, min(len(pool), rnd.randint(2, max_materials)))
+            bp = BLUEPRINT_BASE + i
+            yield {
+                '_key': bp,
+                'blueprintTypeID': bp,
+                'maxProductionLimit': rnd.choice((10, 100, 300, 1500)),
+                'activities': {
+                    'manufacturing': {
+                        'materials': [{'typeID': t, 'quantity': rnd.randint(1, 500) if t in raw_set else rnd.randint(1, 20)}
+                                      for t in inputs],
+                        'products': [{'typeID': product, 'quantity': rnd.choice((1, 1, 1, 10, 100))}],
+                        'time': rnd.randint(60, 36000),
+                    },
+                },
+            }
+
+    def system_records():
+        for s in range(systems):
+            sid = SYSTEM_BASE + s
+            yield {'_key': sid, 'solarSystemID': sid, 'regionID': REGION_BASE + s % regions,
+                   'security': round(rnd.uniform(-1.0, 1.0), 2)}
+
+    raw_set = set(raw)
+    counts = {
+        'types': _write(os.path.join(out_dir, 'types.jsonl'), type_records()),
+        'groups': _write(os.path.join(out_dir, 'groups.jsonl'), group_records()),
+        'blueprints': _write(os.path.join(out_dir, 'blueprints.jsonl'), blueprint_records()),
+        'mapSolarSystems': _write(os.path.join(out_dir, 'mapSolarSystems.jsonl'), system_records()),
+    }
+    return {'counts': counts, 'raw_type_ids': raw, 'product_type_ids': products}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic SDE *.jsonl files')
+    parser.add_argument('out_dir')
+    parser.add_argument('--types', type=int, default=20000)
+    parser.add_argument('--groups', type=int, default=500)
+    parser.add_argument('--blueprints', type=int, default=5000)
+    parser.add_argument('--systems', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    out = generate(args.out_dir, args.types, args.groups, args.blueprints, args.systems, seed=args.seed)
+    print(json.dumps(out['counts']))
@@ -0,0 +1,156 @@
+import os
+import time
+import threading
+
+from redis.exceptions import RedisError
+from sqlalchemy import text, bindparam
+from sqlalchemy.exc import SQLAlchemyError
+
+from .db import engine
+from .sde_snapshot import SNAPSHOT_PATH, open_snapshot
+from .services.api_cache import api_cache
+
+# Don't hammer a missing sde_types_norm table: retry a failed load at most this often.
+RELOAD_BACKOFF = 60
+# Seconds between reads of the shared SDE version that import_sde bumps.
+SDE_VERSION_CHECK = float(os.getenv('SDE_VERSION_CHECK', '5'))
+
+
+class SdeVersionWatch:
+    """Resets this process's SDE-derived caches when an import bumps the SDE version.
+
+    The version is the api_cache 'sde' counter (shared through Redis when the
+    API cache uses it). It is read at most every `interval` seconds, from the
+    lookups themselves, and whenever a cached route reads it anyway. Without
+    a shared version store an import in another process needs a restart.
+    """
+
+    def __init__(self, versions=None, interval: float = SDE_VERSION_CHECK):
+        self.versions = versions
+        self.interval = interval
+        self.version = None
+        self._checked_at = None
+        self._resets = []
+        self._lock = threading.Lock()
+
+    def register(self, reset):
+        """Call `reset()` whenever the SDE version changes."""
+        self._resets.append(reset)
+        return reset
+
+    def check(self):
+        """Re-read the version if `interval` has passed; returns the last version seen."""
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.interval:
+                return self.version
+            self._checked_at = now
+        versions = self.versions if self.versions is not None else api_cache.versions
+        try:
+            current = versions.get_many(['sde'])[0]
+        except RedisError:
+            # keep serving what is loaded; try again next interval
+            return self.version
+        self.observe(current)
+        return current
+
+    def observe(self, version):
+        with self._lock:
+            if version == self.version:
+                return
+            changed, self.version = self.version is not None, version
+        if changed:
+            for reset in self._resets:
+                reset()
+
+
+class TypeDictionary:
+    """Process-wide type_id -> SDE type row map, loaded once from sde_types_norm.
+
+    Rows are (name, group_id, volume, base_price). When a memory-mapped
+    snapshot (see sde_snapshot.py) is available it is used instead of the
+    table, so lookups don't touch the database at all. Ids that are not known
+    at load time are looked up in one batched IN query and remembered, so
+    enriching a page of rows never costs more than one extra query.
+    The shared instance is reset (and the snapshot reopened) when the SDE
+    version changes; see SdeVersionWatch.
+    """
+
+    def __init__(self, bind=None, snapshot_path=None):
+        self.bind = bind
+        self.snapshot_path = snapshot_path
+        self._snapshot = None
+        self._types = {}
+        self._loaded = False
+        self._failed_at = 0.0
+        self._lock = threading.Lock()
+
+    def _engine(self):
+        return self.bind if self.bind is not None else engine
+
+    def _load(self):
+        if self._loaded or time.monotonic() - self._failed_at < RELOAD_BACKOFF:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if self.snapshot_path:
+                self._snapshot = open_snapshot(self.snapshot_path)
+                if self._snapshot is not None:
+                    self._loaded = True
+                    return
+            try:
+                with self._engine().connect() as conn:
+                    rows = conn.execute(text("SELECT type_id, name, group_id, volume, base_price FROM sde_types_norm"))
+                    self._types = {r[0]: (r[1], r[2], r[3], r[4]) for r in rows}
+                self._loaded = True
+            except SQLAlchemyError:
+                # SDE not imported yet
+                self._failed_at = time.monotonic()
+
+    def _fetch_missing(self, type_ids):
+        missing = [t for t in type_ids if t not in self._types]
+        if self._snapshot is not None:
+            found = {t: self._snapshot.get(t) for t in missing}
+            with self._lock:
+                self._types.update((t, row) for t, row in found.items() if row is not None)
+            missing = [t for t, row in found.items() if row is None]
+        if not missing or not self._loaded:
+            return
+        stmt = text("SELECT type_id, name, group_id, volume, base_price FROM sde_types_norm WHERE type_id IN :ids")
+        stmt = stmt.bindparams(bindparam('ids', expanding=True))
+        with self._engine().connect() as conn:
+            found = {r[0]: (r[1], r[2], r[3], r[4]) for r in conn.execute(stmt, {'ids': missing})}
+        with self._lock:
+            for tid in missing:
+                self._types[tid] = found.get(tid)
+
+    def get_many(self, type_ids) -> dict:
+        """Return {type_id: (name, group_id, volume, base_price) or None}."""
+        ids = {t for t in type_ids if t is not None}
+        sde_watch.check()
+        self._load()
+        self._fetch_missing(ids)
+        return {t: self._types.get(t) for t in ids}
+
+    def names(self, type_ids) -> dict:
+        return {t: (row[0] if row else None) for t, row in self.get_many(type_ids).items()}
+
+    def get(self, type_id):
+        return self.get_many([type_id]).get(type_id)
+
+    def reset(self):
+        with self._lock:
+            # other threads may still be reading the old mapping; let GC unmap it
+            self._snapshot = None
+            self._types = {}
+            self._loaded = False
+            self._failed_at = 0.0
+
+
+# Shared by every route and engine in this process.
+sde_watch = SdeVersionWatch()
+sde_types = TypeDictionary(snapshot_path=SNAPSHOT_PATH)
+sde_watch.register(sde_types.reset)
+# cached routes read the version on every request; pick up a bump right away
+api_cache.on_sde_version = sde_watch.observe
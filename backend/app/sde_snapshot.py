@@ -0,0 +1,202 @@
+"""Compact, memory-mapped snapshot of the SDE types table.
+
+Layout (little endian, every section 8-byte aligned):
+
+    header      magic 'IETSDE01', count u32, capacity u32, names_len u32, reserved u32
+    type_ids    i64[count]     sorted
+    group_ids   i32[count]     -1 when unknown
+    volumes     f64[count]     NaN when unknown
+    base_prices f64[count]     NaN when unknown
+    name_offs   u32[count + 1] byte offsets into the string table
+    slots       i32[capacity]  open-addressing hash: row index or -1
+    names       utf-8 string table
+
+The file is opened read-only with mmap, so every API process and RQ worker
+on a host shares the same physical pages, and opening it costs a few
+syscalls rather than a table scan. import_sde renames a new file into place
+and then bumps the SDE version; each process keeps reading its old mapping
+until its SdeVersionWatch (sde.py) sees the bump and the next lookup reopens
+the path.
+"""
+import os
+import mmap
+import math
+import struct
+import tempfile
+
+SNAPSHOT_PATH = os.getenv(
+    'SDE_SNAPSHOT_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sde_snapshot.bin'),
+)
+
+MAGIC = b'IETSDE01'
+_HEADER = struct.Struct('<8sIIII')
+_GOLDEN = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def _capacity(count):
+    cap = 8
+    while cap < count * 2:
+        cap <<= 1
+    return cap
+
+
+def _hash(type_id, bits):
+    return ((type_id * _GOLDEN) & _MASK64) >> (64 - bits)
+
+
+def _layout(count, capacity):
+    """Return byte offsets of each section after the header."""
+    offs = {}
+    pos = _align(_HEADER.size)
+    for name, size in (
+        ('type_ids', 8 * count),
+        ('group_ids', 4 * count),
+        ('volumes', 8 * count),
+        ('base_prices', 8 * count),
+        ('name_offs', 4 * (count + 1)),
+        ('slots', 4 * capacity),
+    ):
+        offs[name] = pos
+        pos = _align(pos + size)
+    offs['names'] = pos
+    return offs
+
+
+def write_snapshot(rows, path: str = SNAPSHOT_PATH) -> int:
+    """Write (type_id, name, group_id, volume, base_price) rows to `path`.
+
+    The file is written next to the target and renamed into place, so
+    processes that already mapped the old snapshot keep reading it safely.
+    Returns the number of types written.
+    """
+    rows = sorted({int(r[0]): r for r in rows}.values(), key=lambda r: int(r[0]))
+    count = len(rows)
+    capacity = _capacity(count)
+    bits = capacity.bit_length() - 1
+
+    names = bytearray()
+    name_offs = [0]
+    for r in rows:
+        names += (r[1] or '').encode('utf-8')
+        name_offs.append(len(names))
+
+    slots = [-1] * capacity
+    for i, r in enumerate(rows):
+        h = _hash(int(r[0]), bits)
+        while slots[h] != -1:
+            h = (h + 1) & (capacity - 1)
+        slots[h] = i
+
+    def num(v):
+        return float('nan') if v is None else float(v)
+
+    offs = _layout(count, capacity)
+    buf = bytearray(offs['names'] + len(names))
+    _HEADER.pack_into(buf, 0, MAGIC, count, capacity, len(names), 0)
+    struct.pack_into(f'<{count}q', buf, offs['type_ids'], *(int(r[0]) for r in rows))
+    struct.pack_into(f'<{count}i', buf, offs['group_ids'], *(-1 if r[2] is None else int(r[2]) for r in rows))
+    struct.pack_into(f'<{count}d', buf, offs['volumes'], *(num(r[3]) for r in rows))
+    struct.pack_into(f'<{count}d', buf, offs['base_prices'], *(num(r[4]) for r in rows))
+    struct.pack_into(f'<{count + 1}I', buf, offs['name_offs'], *name_offs)
+    struct.pack_into(f'<{capacity}i', buf, offs['slots'], *slots)
+    buf[offs['names']:] = names
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.sde_snapshot.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(buf)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return count
+
+
+class SdeSnapshot:
+    """Read-only view over a snapshot file with O(1) lookup by type_id.
+
+    The column arrays (`type_ids`, `group_ids`, `volumes`, `base_prices`) are
+    memoryviews over the mapping and can be wrapped without copying, e.g. by
+    numpy.frombuffer.
+    """
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, capacity, names_len, _ = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f'{path} is not an SDE snapshot')
+        self.count = count
+        self.capacity = capacity
+        self._bits = capacity.bit_length() - 1
+        offs = _layout(count, capacity)
+        self._mv = mv = memoryview(self._mm)
+        self.type_ids = mv[offs['type_ids']:offs['type_ids'] + 8 * count].cast('q')
+        self.group_ids = mv[offs['group_ids']:offs['group_ids'] + 4 * count].cast('i')
+        self.volumes = mv[offs['volumes']:offs['volumes'] + 8 * count].cast('d')
+        self.base_prices = mv[offs['base_prices']:offs['base_prices'] + 8 * count].cast('d')
+        self._name_offs = mv[offs['name_offs']:offs['name_offs'] + 4 * (count + 1)].cast('I')
+        self._slots = mv[offs['slots']:offs['slots'] + 4 * capacity].cast('i')
+        self._names = mv[offs['names']:offs['names'] + names_len]
+
+    def __len__(self):
+        return self.count
+
+    def index(self, type_id: int) -> int:
+        """Row index of `type_id`, or -1."""
+        mask = self.capacity - 1
+        h = _hash(type_id, self._bits)
+        while True:
+            i = self._slots[h]
+            if i == -1 or self.type_ids[i] == type_id:
+                return i
+            h = (h + 1) & mask
+
+    def __contains__(self, type_id):
+        return self.index(type_id) != -1
+
+    def name(self, type_id: int):
+        i = self.index(type_id)
+        if i == -1:
+            return None
+        return bytes(self._names[self._name_offs[i]:self._name_offs[i + 1]]).decode('utf-8')
+
+    def get(self, type_id: int):
+        """Return (name, group_id, volume, base_price) or None, like TypeDictionary rows."""
+        i = self.index(type_id)
+        if i == -1:
+            return None
+        name = bytes(self._names[self._name_offs[i]:self._name_offs[i + 1]]).decode('utf-8')
+        group_id = self.group_ids[i]
+        volume = self.volumes[i]
+        base_price = self.base_prices[i]
+        return (
+            name,
+            None if group_id == -1 else group_id,
+            None if math.isnan(volume) else volume,
+            None if math.isnan(base_price) else base_price,
+        )
+
+    def close(self):
+        for view in (self.type_ids, self.group_ids, self.volumes, self.base_prices,
+                     self._name_offs, self._slots, self._names, self._mv):
+            view.release()
+        self._mm.close()
+
+
+def open_snapshot(path: str = SNAPSHOT_PATH):
+    """Open the snapshot at `path`, or return None if there isn't a usable one."""
+    try:
+        return SdeSnapshot(path)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,180 @@
+"""Response cache for read-only /data and /dashboard routes.
+
+Cache keys carry a version: one per character for synced data, one for the
+SDE. A sync that changed something bumps its character's version and an
+SDE import bumps the SDE one. Entries under an old version are simply
+never read again, and they drop out through the LRU or the TTL. Bodies
+carry an ETag, so a client that already has the current body gets a 304.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from redis.exceptions import RedisError
+
+from .cache import LRUBackend, RedisBackend
+
+# 'redis' shares entries and versions with workers, which is what lets a sync finishing
+# in a worker invalidate the API's entries. 'memory' is only correct when syncs and SDE
+# imports run in the API process itself; 'off' computes every response (ETags still work).
+# Default: 'redis' when REDIS_URL is set, otherwise 'off'.
+API_CACHE_BACKEND = os.getenv('API_CACHE_BACKEND', 'redis' if os.getenv('REDIS_URL') else 'off')
+API_CACHE_SIZE = int(os.getenv('API_CACHE_SIZE', '2048'))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379')
+# Seconds an entry lives if nothing invalidates it first.
+ROUTE_TTLS = {
+    'assets': int(os.getenv('API_CACHE_TTL', '600')),
+    'industry-jobs': int(os.getenv('API_CACHE_TTL', '600')),
+    'overview': int(os.getenv('API_CACHE_TTL', '600')),
+    'asset-locations': int(os.getenv('API_CACHE_TTL', '600')),
+    'asset-subtree': int(os.getenv('API_CACHE_TTL', '600')),
+    'asset-location-totals': int(os.getenv('API_CACHE_TTL', '600')),
+    'sde-type': int(os.getenv('API_CACHE_SDE_TTL', '86400')),
+    'sde-group': int(os.getenv('API_CACHE_SDE_TTL', '86400')),
+}
+# Version bumped on every character change, for views over all characters.
+ALL_CHARACTERS = 'all'
+
+
+class MemoryVersions:
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, names):
+        return [self._versions.get(n, 0) for n in names]
+
+    def bump(self, *names):
+        with self._lock:
+            for n in names:
+                self._versions[n] = self._versions.get(n, 0) + 1
+
+
+class RedisVersions:
+    def __init__(self, url: str = REDIS_URL, prefix: str = 'api:version:'):
+        from redis import Redis
+        self.redis = Redis.from_url(url, socket_timeout=1)
+        self.prefix = prefix
+
+    def get_many(self, names):
+        return [int(v or 0) for v in self.redis.mget([self.prefix + n for n in names])]
+
+    def bump(self, *names):
+        pipe = self.redis.pipeline()
+        for n in names:
+            pipe.incr(self.prefix + n)
+        pipe.execute()
+
+
+class NullBackend:
+    """Stores nothing: every response is computed."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, entry, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {t.strip().removeprefix('W/') for t in if_none_match.split(',')}
+    return etag in tags or '*' in tags
+
+
+class ApiCache:
+    def __init__(self, backend=None, versions=None):
+        self.backend = backend if backend is not None else LRUBackend(API_CACHE_SIZE)
+        self.versions = versions if versions is not None else MemoryVersions()
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'errors': 0}
+        # called with the 'sde' version each time a key reads it (see sde.SdeVersionWatch)
+        self.on_sde_version = None
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def key(self, route: str, params: dict, character_id=None, sde: bool = False) -> str:
+        scopes = []
+        if character_id is not None or route == 'overview':
+            scopes.append(f'char:{character_id if character_id is not None else ALL_CHARACTERS}')
+        if sde:
+            scopes.append('sde')
+        versions = self.versions.get_many(scopes) if scopes else []
+        if sde and self.on_sde_version is not None:
+            self.on_sde_version(versions[-1])
+        tag = ','.join(f'{s}={v}' for s, v in zip(scopes, versions))
+        query = '&'.join(f'{k}={params[k]}' for k in sorted(params) if params[k] is not None)
+        return f'{route}|{tag}|{query}'
+
+    def respond(self, request, route: str, params: dict, compute, character_id=None, sde: bool = False) -> Response:
+        """JSON response for `compute()`, served from the cache while its versions are unchanged.
+
+        Bodies are encoded the way FastAPI encodes an uncached return value (ISO
+        datetimes, Decimals as numbers), so caching never changes the wire format.
+        Exceptions from compute() (404s and the like) propagate and are not cached.
+        """
+        key = entry = None
+        try:
+            key = self.key(route, params, character_id, sde)
+            entry = self.backend.get(key)
+        except RedisError:
+            # serve uncached rather than fail the request
+            self._count('errors')
+        if entry is not None and entry['expires'] > time.time():
+            self._count('hits')
+        else:
+            self._count('misses')
+            body = json.dumps(jsonable_encoder(compute()), ensure_ascii=False, allow_nan=False,
+                              separators=(',', ':')).encode('utf-8')
+            ttl = ROUTE_TTLS.get(route, 600)
+            entry = {'body': body.decode('utf-8'), 'etag': etag_for(body), 'expires': time.time() + ttl}
+            if key is not None:
+                try:
+                    self.backend.set(key, entry, ttl)
+                except RedisError:
+                    self._count('errors')
+
+        headers = {'ETag': entry['etag'], 'Cache-Control': 'private, no-cache'}
+        if _matches(request.headers.get('if-none-match'), entry['etag']):
+            self._count('not_modified')
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry['body'], media_type='application/json', headers=headers)
+
+    def bump_character(self, character_id: int):
+        """Invalidate everything cached for one character (and the all-characters views)."""
+        self.versions.bump(f'char:{character_id}', f'char:{ALL_CHARACTERS}')
+
+    def bump_sde(self):
+        self.versions.bump('sde')
+
+    def clear(self):
+        self.backend.clear()
+
+
+def _make_cache():
+    if API_CACHE_BACKEND == 'redis':
+        return ApiCache(RedisBackend(REDIS_URL, prefix='api:cache:'), RedisVersions())
+    if API_CACHE_BACKEND == 'memory':
+        return ApiCache()
+    return ApiCache(NullBackend())
+
+
+# Shared by the /data and /dashboard routes, and bumped by sync tasks and the SDE import.
+api_cache = _make_cache()
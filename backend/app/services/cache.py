@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from .ratelimit import limiter
+from ..metrics import esi_endpoint, esi_request_seconds, esi_responses
+
+# 'memory' keeps an LRU per process; 'redis' shares entries across API processes and RQ workers.
+# RQ runs every job in a fresh process, so under 'memory' workers never revalidate with a 304.
+# Default: 'redis' when REDIS_URL is set, otherwise 'memory'.
+CACHE_BACKEND = os.getenv('ESI_CACHE_BACKEND', 'redis' if os.getenv('REDIS_URL') else 'memory')
+CACHE_SIZE = int(os.getenv('ESI_CACHE_SIZE', '4096'))
+# How long an expired entry is kept around for If-None-Match revalidation.
+STALE_TTL = int(os.getenv('ESI_CACHE_STALE_TTL', '86400'))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379')
+
+# Response headers worth keeping alongside the cached body.
+KEPT_HEADERS = ('ETag', 'Expires', 'Last-Modified', 'X-Pages')
+
+
+class LRUBackend:
+    """In-process LRU of cache entries."""
+
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, ttl=None):
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    """Cache entries stored as JSON in Redis, shared by every worker."""
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = 'esi:cache:'):
+        from redis import Redis
+        self.redis = Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.redis.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    def set(self, key, entry, ttl=None):
+        self.redis.set(self.prefix + key, json.dumps(entry), ex=max(int(ttl or STALE_TTL), 1))
+
+    def delete(self, key):
+        self.redis.delete(self.prefix + key)
+
+    def clear(self):
+        for k in self.redis.scan_iter(self.prefix + '*'):
+            self.redis.delete(k)
+
+
+class CachedResponse:
+    """Parsed body plus the headers callers care about.
+
+    `status` is 'hit' (fresh, no request made), 'not_modified' (revalidated
+    with a 304) or 'miss' (full body downloaded). `unchanged` is true for the
+    first two, so callers can skip re-processing data they already stored.
+    """
+
+    def __init__(self, data, headers: dict, status: str):
+        self.data = data
+        self.headers = headers
+        self.status = status
+
+    @property
+    def unchanged(self) -> bool:
+        return self.status != 'miss'
+
+    @property
+    def expires_at(self) -> float:
+        """ESI's Expires as epoch seconds (0.0 when absent)."""
+        return _expires_at(self.headers)
+
+
+def _expires_at(headers) -> float:
+    value = headers.get('Expires')
+    if not value:
+        return 0.0
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ResponseCache:
+    """ETag / Expires aware cache for GET requests against ESI.
+
+    get_async() reaches a shared (Redis) backend from a thread, so cache
+    round trips never block the event loop.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else LRUBackend()
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    @staticmethod
+    def key(url: str, params: dict = None) -> str:
+        # Authorization is deliberately not part of the key: authed ESI routes
+        # carry the character/corporation id in the path already.
+        if not params:
+            return url
+        return url + '?' + '&'.join(f'{k}={params[k]}' for k in sorted(params))
+
+    def _prepare(self, url, params, headers):
+        key = self.key(url, params)
+        entry = self.backend.get(key)
+        if entry is not None and entry['expires'] > time.time():
+            self._count('hits')
+            return key, entry, None
+        req_headers = dict(headers or {})
+        if entry is not None and entry.get('etag'):
+            req_headers['If-None-Match'] = entry['etag']
+        return key, entry, req_headers
+
+    def _finish(self, key, entry, r: httpx.Response, url: str, elapsed: float) -> CachedResponse:
+        endpoint = esi_endpoint(url)
+        esi_request_seconds.observe(elapsed, (endpoint,))
+        if r.status_code == 304 and entry is not None:
+            esi_responses.inc(1, (endpoint, '304', 'not_modified'))
+            self._count('not_modified')
+            kept = {**entry['headers'], **{h: r.headers[h] for h in KEPT_HEADERS if h in r.headers}}
+            entry = {**entry, 'headers': kept, 'expires': _expires_at(r.headers) or entry['expires']}
+            self._store(key, entry)
+            return CachedResponse(entry['data'], entry['headers'], 'not_modified')
+
+        esi_responses.inc(1, (endpoint, str(r.status_code), 'miss'))
+        r.raise_for_status()
+        self._count('misses')
+        data = r.json()
+        entry = {
+            'etag': r.headers.get('ETag'),
+            'expires': _expires_at(r.headers),
+            'headers': {h: r.headers[h] for h in KEPT_HEADERS if h in r.headers},
+            'data': data,
+        }
+        if entry['etag'] or entry['expires']:
+            self._store(key, entry)
+        return CachedResponse(data, entry['headers'], 'miss')
+
+    async def _offload(self, fn, *args):
+        if isinstance(self.backend, LRUBackend):
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    def _store(self, key, entry):
+        ttl = max(entry['expires'] - time.time(), 0) + STALE_TTL
+        self.backend.set(key, entry, ttl)
+
+    def get(self, client: httpx.Client, url: str, params: dict = None, headers: dict = None) -> CachedResponse:
+        key, entry, req_headers = self._prepare(url, params, headers)
+        if req_headers is None:
+            esi_responses.inc(1, (esi_endpoint(url), '200', 'hit'))
+            return CachedResponse(entry['data'], entry['headers'], 'hit')
+        limiter.acquire()
+        start = time.perf_counter()
+        r = client.get(url, params=params, headers=req_headers)
+        limiter.observe(r)
+        return self._finish(key, entry, r, url, time.perf_counter() - start)
+
+    async def get_async(self, client: httpx.AsyncClient, url: str, params: dict = None, headers: dict = None) -> CachedResponse:
+        key, entry, req_headers = await self._offload(self._prepare, url, params, headers)
+        if req_headers is None:
+            esi_responses.inc(1, (esi_endpoint(url), '200', 'hit'))
+            return CachedResponse(entry['data'], entry['headers'], 'hit')
+        await limiter.acquire_async()
+        start = time.perf_counter()
+        r = await client.get(url, params=params, headers=req_headers)
+        await limiter.observe_async(r)
+        return await self._offload(self._finish, key, entry, r, url, time.perf_counter() - start)
+
+    async def revalidate_async(self, client: httpx.AsyncClient, url: str, params: dict = None, headers: dict = None,
+                               etag: str = None) -> CachedResponse:
+        """GET that stores nothing, for callers that keep the parsed body themselves.
+
+        `etag` is sent as If-None-Match; a 304 comes back as 'not_modified'
+        with no data, anything else as a 'miss' carrying the new ETag.
+        """
+        req_headers = dict(headers or {})
+        if etag:
+            req_headers['If-None-Match'] = etag
+        await limiter.acquire_async()
+        start = time.perf_counter()
+        r = await client.get(url, params=params, headers=req_headers)
+        await limiter.observe_async(r)
+        endpoint = esi_endpoint(url)
+        esi_request_seconds.observe(time.perf_counter() - start, (endpoint,))
+        kept = {h: r.headers[h] for h in KEPT_HEADERS if h in r.headers}
+        if r.status_code == 304 and etag:
+            esi_responses.inc(1, (endpoint, '304', 'not_modified'))
+            self._count('not_modified')
+            return CachedResponse(None, kept, 'not_modified')
+        esi_responses.inc(1, (endpoint, str(r.status_code), 'miss'))
+        r.raise_for_status()
+        self._count('misses')
+        return CachedResponse(r.json(), kept, 'miss')
+
+
+def _make_backend():
+    if CACHE_BACKEND == 'redis':
+        return RedisBackend()
+    return LRUBackend()
+
+
+# Shared by every ESI / market service function in this process.
+response_cache = ResponseCache(_make_backend())
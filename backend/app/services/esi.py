@@ -1,101 +1,172 @@
+import os
+import asyncio
 import httpx
-from typing import Optional
-from ..crypto import decrypt
-from ..models import EsiToken
-from ..db import SessionLocal
+from .cache import response_cache, CachedResponse
+from .ratelimit import limiter
+from .tokens import token_provider, TokenError
+from .http import get_client, run_sync
+from ..metrics import esi_endpoint, esi_pages
 
 VERIFY_URL = 'https://login.eveonline.com/oauth/verify'
 ESI_BASE = 'https://esi.evetech.net/latest'
 
+# Max in-flight page requests per paginated fetch, and retries per page.
+PAGE_CONCURRENCY = int(os.getenv('ESI_PAGE_CONCURRENCY', '8'))
+PAGE_RETRIES = int(os.getenv('ESI_PAGE_RETRIES', '3'))
+RETRY_BACKOFF = 0.5
 
-def _get_access_from_token_obj(t: EsiToken) -> Optional[str]:
-    if t.access_token_enc:
-        return decrypt(t.access_token_enc)
-    return t.access_token
+
+def _load_token(token_id: int):
+    """Return (access_token, character_id) for a stored token from the in-memory provider.
+
+    A cold or expiring token costs a DB read and possibly an SSO refresh, so
+    the async fetchers run this in a thread rather than on the event loop.
+    """
+    access, char_id = token_provider.get(token_id)
+    if not char_id:
+        raise Exception('character_id not set on token')
+    return access, char_id
+
+
+async def verify_token_id_async(token_id: int):
+    try:
+        access, _ = await asyncio.to_thread(token_provider.get, token_id)
+    except TokenError as e:
+        if e.status_code == 404:
+            return None
+        raise
+    headers = {'Authorization': f'Bearer {access}'}
+    await limiter.acquire_async()
+    r = await get_client().get(VERIFY_URL, headers=headers)
+    await limiter.observe_async(r)
+    r.raise_for_status()
+    return r.json()
 
 
 def verify_token_id(token_id: int):
-    db = SessionLocal()
-    t = db.query(EsiToken).filter(EsiToken.id == token_id).first()
-    db.close()
-    if not t:
-        return None
-    access = _get_access_from_token_obj(t)
+    return run_sync(verify_token_id_async(token_id))
+
+
+async def fetch_assets_by_token_async(token_id: int):
+    access, char_id = await asyncio.to_thread(_load_token, token_id)
+
+    url = f"{ESI_BASE}/characters/{char_id}/assets/"
     headers = {'Authorization': f'Bearer {access}'}
-    with httpx.Client() as client:
-        r = client.get(VERIFY_URL, headers=headers)
-        r.raise_for_status()
-        return r.json()
+    params = {'datasource': 'tranquility'}
+    resp = await response_cache.get_async(get_client(), url, params=params, headers=headers)
+    return resp.data
 
 
 def fetch_assets_by_token(token_id: int):
-    db = SessionLocal()
-    t = db.query(EsiToken).filter(EsiToken.id == token_id).first()
-    if not t:
-        db.close()
-        raise Exception('token not found')
-    access = _get_access_from_token_obj(t)
-    char_id = t.character_id
-    db.close()
-    if not char_id:
-        raise Exception('character_id not set on token')
+    return run_sync(fetch_assets_by_token_async(token_id))
+
+
+async def _get_page(client: httpx.AsyncClient, url: str, headers: dict, params: dict, page: int, retries: int,
+                    etags: dict = None) -> CachedResponse:
+    """GET one page, retrying transport errors and 5xx with backoff.
+
+    Goes through the response cache, or only revalidates against `etags` when given.
+    """
+    attempt = 0
+    while True:
+        try:
+            if etags is not None:
+                return await response_cache.revalidate_async(client, url, params={**params, 'page': page},
+                                                             headers=headers, etag=etags.get(page))
+            return await response_cache.get_async(client, url, params={**params, 'page': page}, headers=headers)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code < 500 or attempt >= retries:
+                raise
+        except httpx.TransportError:
+            if attempt >= retries:
+                raise
+        await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
+        attempt += 1
+
+
+async def iter_pages_async(client: httpx.AsyncClient, url: str, headers: dict = None, params: dict = None,
+                           concurrency: int = None, retries: int = None, etags: dict = None):
+    """Yield (page, CachedResponse) for every page of a paginated ESI endpoint.
+
+    Page 1 is fetched first to read X-Pages; pages 2..N are then fetched
+    concurrently (at most `concurrency` in flight) and yielded as they land,
+    not in page order. Each page is retried on its own; a page that still
+    fails raises out of the generator. Pages served from cache or revalidated
+    with a 304 come back with `unchanged` set.
 
+    With `etags` ({page: etag} from the caller's last fetch) nothing is kept
+    in the response cache: pages are revalidated against those ETags and a
+    304 comes back with no data, for callers that hold the parsed pages.
+    """
+    headers = headers or {}
+    params = params or {}
+    concurrency = concurrency or PAGE_CONCURRENCY
+    retries = PAGE_RETRIES if retries is None else retries
+
+    first = await _get_page(client, url, headers, params, 1, retries, etags)
+    if 'X-Pages' in first.headers or not (etags and first.unchanged):
+        pages = int(first.headers.get('X-Pages', 1))
+    else:
+        # a 304 need not repeat X-Pages; the page count is what it was
+        pages = max(etags)
+    esi_pages.inc(pages, (esi_endpoint(url),))
+    yield 1, first
+    if pages <= 1:
+        return
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def fetch(page):
+        async with sem:
+            return page, await _get_page(client, url, headers, params, page, retries, etags)
+
+    pending = [asyncio.ensure_future(fetch(p)) for p in range(2, pages + 1)]
+    try:
+        for fut in asyncio.as_completed(pending):
+            yield await fut
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+
+async def iter_assets_pages(token_id: int, concurrency: int = None):
+    """Stream a character's asset pages as (page, CachedResponse) while the rest download."""
+    access, char_id = await asyncio.to_thread(_load_token, token_id)
     url = f"{ESI_BASE}/characters/{char_id}/assets/"
     headers = {'Authorization': f'Bearer {access}'}
     params = {'datasource': 'tranquility'}
-    with httpx.Client() as client:
-        r = client.get(url, headers=headers, params=params)
-        r.raise_for_status()
-        return r.json()
+    async for page, resp in iter_pages_async(get_client(), url, headers, params, concurrency=concurrency):
+        yield page, resp
 
 
 def fetch_assets_paginated(token_id: int):
-    """Fetch all asset pages and return full list."""
-    db = SessionLocal()
-    t = db.query(EsiToken).filter(EsiToken.id == token_id).first()
-    if not t:
-        db.close()
-        raise Exception('token not found')
-    access = _get_access_from_token_obj(t)
-    char_id = t.character_id
-    db.close()
-    if not char_id:
-        raise Exception('character_id not set on token')
+    """Fetch all asset pages concurrently and return the full list in page order."""
+    async def collect():
+        return [p async for p in iter_assets_pages(token_id)]
 
-    url = f"{ESI_BASE}/characters/{char_id}/assets/"
-    headers = {'Authorization': f'Bearer {access}'}
-    params = {'datasource': 'tranquility', 'page': 1}
+    pages = run_sync(collect())
     all_assets = []
-    with httpx.Client() as client:
-        while True:
-            r = client.get(url, headers=headers, params=params)
-            r.raise_for_status()
-            page_data = r.json()
-            all_assets.extend(page_data)
-            # check for X-Pages header
-            pages = int(r.headers.get('X-Pages', 1))
-            if params['page'] >= pages:
-                break
-            params['page'] += 1
+    for _, resp in sorted(pages, key=lambda p: p[0]):
+        all_assets.extend(resp.data)
     return all_assets
 
 
-def fetch_industry_jobs_by_token(token_id: int):
-    db = SessionLocal()
-    t = db.query(EsiToken).filter(EsiToken.id == token_id).first()
-    if not t:
-        db.close()
-        raise Exception('token not found')
-    access = _get_access_from_token_obj(t)
-    char_id = t.character_id
-    db.close()
-    if not char_id:
-        raise Exception('character_id not set on token')
+async def fetch_industry_jobs_response_async(token_id: int) -> CachedResponse:
+    access, char_id = await asyncio.to_thread(_load_token, token_id)
 
     url = f"{ESI_BASE}/characters/{char_id}/industry/jobs/"
     headers = {'Authorization': f'Bearer {access}'}
     params = {'datasource': 'tranquility'}
-    with httpx.Client() as client:
-        r = client.get(url, headers=headers, params=params)
-        r.raise_for_status()
-        return r.json()
+    return await response_cache.get_async(get_client(), url, params=params, headers=headers)
+
+
+def fetch_industry_jobs_response(token_id: int) -> CachedResponse:
+    return run_sync(fetch_industry_jobs_response_async(token_id))
+
+
+async def fetch_industry_jobs_async(token_id: int):
+    return (await fetch_industry_jobs_response_async(token_id)).data
+
+
+def fetch_industry_jobs_by_token(token_id: int):
+    return fetch_industry_jobs_response(token_id).data
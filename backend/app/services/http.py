@@ -0,0 +1,92 @@
+import os
+import asyncio
+import threading
+import weakref
+
+import httpx
+
+# One pooled AsyncClient per event loop: the app's loop (opened/closed in the
+# FastAPI lifespan) and a private background loop that backs the sync facade
+# used by RQ tasks and scripts.
+HTTP2 = os.getenv('ESI_HTTP2', '1') == '1'
+MAX_CONNECTIONS = int(os.getenv('ESI_MAX_CONNECTIONS', '100'))
+MAX_KEEPALIVE = int(os.getenv('ESI_MAX_KEEPALIVE', '20'))
+TIMEOUT = float(os.getenv('ESI_TIMEOUT', '30'))
+
+_clients = weakref.WeakKeyDictionary()
+_transport = None
+_sync = {'pid': None, 'loop': None, 'client': None, 'client_pid': None}
+_sync_lock = threading.Lock()
+
+
+def _new_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=HTTP2,
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE),
+        timeout=TIMEOUT,
+        transport=_transport,
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared AsyncClient for the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _clients[loop] = _new_client()
+    return client
+
+
+async def close_client():
+    """Close the running loop's client (called from the app lifespan on shutdown)."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def set_transport(transport):
+    """Route every shared client through `transport` (tests, benchmarks, fake ESI).
+
+    Existing clients are dropped so the next get_client() picks it up.
+    """
+    global _transport
+    _transport = transport
+    _clients.clear()
+
+
+def _sync_loop():
+    # re-create after fork: the parent's loop thread does not exist in the child
+    with _sync_lock:
+        if _sync['pid'] != os.getpid() or _sync['loop'] is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='esi-http-loop', daemon=True).start()
+            _sync['pid'] = os.getpid()
+            _sync['loop'] = loop
+        return _sync['loop']
+
+
+def run_sync(coro):
+    """Run a coroutine on the background loop and wait for its result.
+
+    This is the sync facade for RQ tasks: every call in the process shares that
+    loop's pooled client instead of opening a new connection per request.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _sync_loop()).result()
+
+
+def get_sync_client() -> httpx.Client:
+    """Process-wide pooled blocking client, for code that must not wait on an event loop.
+
+    The token provider uses it: it can be called from inside coroutines running on
+    the background loop, where blocking on run_sync() would deadlock.
+    """
+    with _sync_lock:
+        client = _sync['client']
+        if client is None or client.is_closed or _sync.get('client_pid') != os.getpid():
+            client = _sync['client'] = httpx.Client(
+                http2=HTTP2,
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE),
+                timeout=TIMEOUT,
+            )
+            _sync['client_pid'] = os.getpid()
+        return client
@@ -1,10 +1,254 @@
-import httpx
+import os
+import time
+import asyncio
+from email.utils import parsedate_to_datetime
+
+import numpy as np
+
+from .cache import response_cache
+from .http import get_client, run_sync
+from .esi import iter_pages_async
 
 MARKET_API = 'https://esi.evetech.net/latest/markets'
 
+# Max in-flight order pages per region refresh (The Forge is 300+ pages).
+ORDER_PAGE_CONCURRENCY = int(os.getenv('MARKET_ORDER_CONCURRENCY', '16'))
+# Refresh this long after ESI's Expires when no header is present.
+DEFAULT_ORDER_TTL = 300
+
+ORDER_COLUMNS = ('type_id', 'location_id', 'price', 'volume_remain', 'is_buy_order')
+
+
 async def get_price_history(region_id: int, type_id: int):
-    url = f"{MARKET_API}/{region_id}/history/?type_id={type_id}"
-    async with httpx.AsyncClient() as client:
-        r = await client.get(url)
-        r.raise_for_status()
-        return r.json()
+    url = f"{MARKET_API}/{region_id}/history/"
+    resp = await response_cache.get_async(get_client(), url, params={'type_id': type_id})
+    return resp.data
+
+
+async def get_market_prices():
+    """ESI's region-independent average/adjusted price for every type, as a list of dicts."""
+    resp = await response_cache.get_async(get_client(), f"{MARKET_API}/prices/")
+    return resp.data
+
+
+def _expires_at(headers) -> float:
+    try:
+        return parsedate_to_datetime(headers['Expires']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time() + DEFAULT_ORDER_TTL
+
+
+def _page_columns(orders) -> dict:
+    """Columnar arrays for one page of ESI orders."""
+    n = len(orders)
+    return {
+        'type_id': np.fromiter((o['type_id'] for o in orders), dtype=np.int64, count=n),
+        'location_id': np.fromiter((o['location_id'] for o in orders), dtype=np.int64, count=n),
+        'price': np.fromiter((o['price'] for o in orders), dtype=np.float64, count=n),
+        'volume_remain': np.fromiter((o['volume_remain'] for o in orders), dtype=np.int64, count=n),
+        'is_buy_order': np.fromiter((o['is_buy_order'] for o in orders), dtype=bool, count=n),
+    }
+
+
+def _aggregate(type_id, location_id, price, volume, is_buy) -> dict:
+    """Best bid/ask, depth and order counts per (type_id, location_id), sorted by both."""
+    if len(type_id) == 0:
+        empty_i = np.empty(0, dtype=np.int64)
+        empty_f = np.empty(0, dtype=np.float64)
+        return {'type_id': empty_i, 'location_id': empty_i, 'best_bid': empty_f, 'best_ask': empty_f,
+                'bid_volume': empty_i, 'ask_volume': empty_i, 'bid_orders': empty_i, 'ask_orders': empty_i}
+    order = np.lexsort((location_id, type_id))
+    t, loc, p, v, buy = type_id[order], location_id[order], price[order], volume[order], is_buy[order]
+    change = np.ones(len(t), dtype=bool)
+    change[1:] = (t[1:] != t[:-1]) | (loc[1:] != loc[:-1])
+    starts = np.flatnonzero(change)
+
+    best_bid = np.maximum.reduceat(np.where(buy, p, -np.inf), starts)
+    best_ask = np.minimum.reduceat(np.where(buy, np.inf, p), starts)
+    return {
+        'type_id': t[starts],
+        'location_id': loc[starts],
+        'best_bid': np.where(np.isfinite(best_bid), best_bid, np.nan),
+        'best_ask': np.where(np.isfinite(best_ask), best_ask, np.nan),
+        'bid_volume': np.add.reduceat(np.where(buy, v, 0), starts),
+        'ask_volume': np.add.reduceat(np.where(buy, 0, v), starts),
+        'bid_orders': np.add.reduceat(buy.astype(np.int64), starts),
+        'ask_orders': np.add.reduceat((~buy).astype(np.int64), starts),
+    }
+
+
+def _nan_none(x):
+    return None if x != x else x
+
+
+class OrderIndex:
+    """Columnar best bid/ask index for one region.
+
+    `by_location` has one row per (type_id, location_id) and `by_type` one
+    row per type across the whole region; both are sorted by type_id so a
+    batch of types is answered with a single searchsorted.
+    """
+
+    def __init__(self, by_location: dict, by_type: dict):
+        self.by_location = by_location
+        self.by_type = by_type
+
+    @classmethod
+    def build(cls, cols: dict):
+        t, loc = cols['type_id'], cols['location_id']
+        args = (cols['price'], cols['volume_remain'], cols['is_buy_order'])
+        return cls(_aggregate(t, loc, *args), _aggregate(t, np.zeros_like(loc), *args))
+
+    def __len__(self):
+        return len(self.by_type['type_id'])
+
+    @staticmethod
+    def _rows(table, i):
+        bid, ask = table['best_bid'][i], table['best_ask'][i]
+        return {
+            'best_bid': _nan_none(float(bid)),
+            'best_ask': _nan_none(float(ask)),
+            'spread': _nan_none(float(ask - bid)),
+            'bid_volume': int(table['bid_volume'][i]),
+            'ask_volume': int(table['ask_volume'][i]),
+            'bid_orders': int(table['bid_orders'][i]),
+            'ask_orders': int(table['ask_orders'][i]),
+        }
+
+    def _ranges(self, table, type_ids):
+        ids = np.asarray(list(type_ids), dtype=np.int64)
+        lo = np.searchsorted(table['type_id'], ids, side='left')
+        hi = np.searchsorted(table['type_id'], ids, side='right')
+        return zip(ids.tolist(), lo.tolist(), hi.tolist())
+
+    def best(self, type_ids) -> dict:
+        """Region-wide {type_id: quote} (None for types with no orders)."""
+        table = self.by_type
+        return {tid: (self._rows(table, lo) if hi > lo else None) for tid, lo, hi in self._ranges(table, type_ids)}
+
+    def quotes(self, type_ids, location_id: int = None) -> dict:
+        """{type_id: {location_id: quote}}, optionally limited to one location."""
+        table = self.by_location
+        out = {}
+        for tid, lo, hi in self._ranges(table, type_ids):
+            locs = table['location_id'][lo:hi]
+            rows = range(lo, hi)
+            if location_id is not None:
+                rows = (lo + i for i in np.flatnonzero(locs == location_id).tolist())
+            out[tid] = {int(table['location_id'][i]): self._rows(table, i) for i in rows}
+        return out
+
+
+def _build_index(pages: dict):
+    """(OrderIndex, order count) over {page: columns}, in page order."""
+    parts = [pages[p] for p in sorted(pages)] or [_page_columns([])]
+    cols = {c: np.concatenate([part[c] for part in parts]) for c in ORDER_COLUMNS}
+    return OrderIndex.build(cols), len(cols['type_id'])
+
+
+class RegionOrderBook:
+    """All live orders in one region, refreshed page by page.
+
+    Each page's ETag is kept next to its parsed arrays and sent back on the
+    next refresh. Pages ESI answers with a 304 keep their arrays, so a refresh
+    only re-parses pages whose ETag moved before the index is rebuilt. Raw
+    bodies are never kept in the response cache.
+    """
+
+    def __init__(self, region_id: int):
+        self.region_id = region_id
+        self.url = f"{MARKET_API}/{region_id}/orders/"
+        self.pages = {}
+        self.etags = {}
+        self.index = OrderIndex.build(_page_columns([]))
+        self.expires_at = 0.0
+        self.stats = {'refreshes': 0, 'pages_parsed': 0, 'pages_unchanged': 0, 'orders': 0}
+
+    def due(self, now: float = None) -> bool:
+        return (now or time.time()) >= self.expires_at
+
+    async def refresh(self, concurrency: int = None) -> dict:
+        """Fetch every page, then swap in the new pages, ETags, index and expiry together.
+
+        A page that fails leaves the book exactly as it was, so the next
+        refresh still revalidates against the ETags of the pages in use.
+        Parsing and the index build run in a thread, off the event loop.
+        """
+        seen, staged, etags = set(), {}, {}
+        expires_at = None
+        unchanged = 0
+        pages = iter_pages_async(get_client(), self.url, params={'order_type': 'all'},
+                                 concurrency=concurrency or ORDER_PAGE_CONCURRENCY, etags=dict(self.etags))
+        async for page, resp in pages:
+            seen.add(page)
+            if page == 1:
+                expires_at = _expires_at(resp.headers)
+            if resp.unchanged and page in self.pages:
+                unchanged += 1
+                if page in self.etags:
+                    etags[page] = self.etags[page]
+                continue
+            staged[page] = await asyncio.to_thread(_page_columns, resp.data)
+            if resp.headers.get('ETag'):
+                etags[page] = resp.headers['ETag']
+        # a page missing from `seen` means the region shrank by a page or more
+        dropped = set(self.pages) - seen
+        kept = {p: staged.get(p, self.pages.get(p)) for p in sorted(seen)}
+
+        if staged or dropped or not self.stats['refreshes']:
+            index, orders = await asyncio.to_thread(_build_index, kept)
+            self.index = index
+            self.stats['orders'] = orders
+        self.pages, self.etags = kept, etags
+        self.expires_at = expires_at if expires_at is not None else time.time() + DEFAULT_ORDER_TTL
+        self.stats['refreshes'] += 1
+        self.stats['pages_parsed'] += len(staged)
+        self.stats['pages_unchanged'] += unchanged
+        return {'region_id': self.region_id, 'pages': len(seen), 'parsed': len(staged),
+                'unchanged': unchanged, 'orders': self.stats['orders'], 'types': len(self.index)}
+
+
+class OrderBooks:
+    """Per-region order books, refreshed on demand once ESI's Expires has passed."""
+
+    def __init__(self):
+        self.books = {}
+        self._locks = {}
+
+    def _lock(self, region_id):
+        key = (region_id, asyncio.get_running_loop())
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def book(self, region_id: int) -> RegionOrderBook:
+        book = self.books.get(region_id)
+        if book is None:
+            book = self.books[region_id] = RegionOrderBook(region_id)
+        return book
+
+    async def get_async(self, region_id: int) -> OrderIndex:
+        book = self.book(region_id)
+        if book.due():
+            async with self._lock(region_id):
+                if book.due():
+                    await book.refresh()
+        return book.index
+
+    async def refresh_async(self, region_id: int) -> dict:
+        async with self._lock(region_id):
+            return await self.book(region_id).refresh()
+
+    def refresh(self, region_id: int) -> dict:
+        return run_sync(self.refresh_async(region_id))
+
+    async def quotes_async(self, region_id: int, type_ids, location_id: int = None) -> dict:
+        return (await self.get_async(region_id)).quotes(type_ids, location_id)
+
+    async def best_async(self, region_id: int, type_ids) -> dict:
+        return (await self.get_async(region_id)).best(type_ids)
+
+
+# Shared by routes and tasks in this process.
+order_books = OrderBooks()
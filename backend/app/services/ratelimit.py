@@ -0,0 +1,193 @@
+import os
+import time
+import asyncio
+import threading
+
+# Cluster-wide request budget for ESI (token bucket).
+ESI_RATE = float(os.getenv('ESI_RATE_LIMIT', '20'))
+ESI_BURST = float(os.getenv('ESI_RATE_BURST', '40'))
+# Below this many remaining errors every caller pauses until the window resets;
+# below twice this, requests are spread evenly over what is left of the window.
+ERROR_FLOOR = int(os.getenv('ESI_ERROR_LIMIT_FLOOR', '10'))
+# 'memory' limits per process; 'redis' shares the bucket and error budget across workers.
+# RQ runs every job in a fresh process, so only 'redis' limits anything across jobs.
+# Default: 'redis' when REDIS_URL is set, otherwise 'memory'.
+LIMITER_BACKEND = os.getenv('ESI_LIMITER_BACKEND', 'redis' if os.getenv('REDIS_URL') else 'memory')
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379')
+
+# Reserve one token; returns how long the caller must wait before using it.
+_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1]) or burst
+local ts = tonumber(b[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate) - 1
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+if tokens >= 0 then return '0' end
+return tostring(-tokens / rate)
+"""
+
+
+class LocalBucket:
+    """In-process token bucket with the same reservation semantics as the Redis one."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.ts = time.monotonic()
+        self.remain = None
+        self.reset_at = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.ts) * self.rate) - 1
+            self.ts = now
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def get_budget(self):
+        if self.remain is None or self.reset_at <= time.time():
+            return None, 0.0
+        return self.remain, self.reset_at
+
+    def set_budget(self, remain: int, reset_at: float):
+        self.remain = remain
+        self.reset_at = reset_at
+
+
+class RedisBucket:
+    def __init__(self, rate: float, burst: float, url: str = REDIS_URL, prefix: str = 'esi:limiter:'):
+        from redis import Redis
+        self.redis = Redis.from_url(url, socket_timeout=1)
+        self.rate = rate
+        self.burst = burst
+        self.bucket_key = prefix + 'bucket'
+        self.budget_key = prefix + 'errors'
+        self._script = self.redis.register_script(_BUCKET_LUA)
+
+    def reserve(self) -> float:
+        return float(self._script(keys=[self.bucket_key], args=[self.rate, self.burst]))
+
+    def get_budget(self):
+        remain, reset_at = self.redis.hmget(self.budget_key, 'remain', 'reset_at')
+        if remain is None:
+            return None, 0.0
+        return int(remain), float(reset_at)
+
+    def set_budget(self, remain: int, reset_at: float):
+        pipe = self.redis.pipeline()
+        pipe.hset(self.budget_key, mapping={'remain': remain, 'reset_at': reset_at})
+        pipe.expireat(self.budget_key, int(reset_at) + 1)
+        pipe.execute()
+
+
+class RateLimiter:
+    """Token-bucket limiter plus ESI error-budget governor.
+
+    Call acquire()/acquire_async() before every ESI request and
+    observe()/observe_async() on every response. The async variants run
+    shared-backend calls in a thread so Redis round trips never block the
+    event loop. If the shared (Redis) backend is unreachable the limiter
+    falls back to its in-process bucket rather than failing the request.
+    """
+
+    def __init__(self, backend=None, rate: float = ESI_RATE, burst: float = ESI_BURST, error_floor: int = ERROR_FLOOR):
+        self.local = LocalBucket(rate, burst)
+        self.backend = backend if backend is not None else self.local
+        self.error_floor = error_floor
+        self.stats = {
+            'requests': 0,
+            'waits': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'budget_pauses': 0,
+            'backend_errors': 0,
+            'error_limit_remain': None,
+        }
+        self._lock = threading.Lock()
+
+    def _call(self, name, *args):
+        try:
+            return getattr(self.backend, name)(*args)
+        except Exception:
+            if self.backend is self.local:
+                raise
+            with self._lock:
+                self.stats['backend_errors'] += 1
+            return getattr(self.local, name)(*args)
+
+    def _budget_delay(self) -> float:
+        remain, reset_at = self._call('get_budget')
+        if remain is None:
+            return 0.0
+        left = max(reset_at - time.time(), 0.0)
+        if remain <= self.error_floor:
+            with self._lock:
+                self.stats['budget_pauses'] += 1
+            return left
+        if remain <= 2 * self.error_floor:
+            return left / remain
+        return 0.0
+
+    def _wait_for(self) -> float:
+        return max(self._call('reserve'), self._budget_delay())
+
+    def _record(self, wait: float):
+        with self._lock:
+            self.stats['requests'] += 1
+            if wait > 0:
+                self.stats['waits'] += 1
+                self.stats['wait_seconds_total'] += wait
+                self.stats['wait_seconds_max'] = max(self.stats['wait_seconds_max'], wait)
+
+    def acquire(self) -> float:
+        """Block until a request may be sent; returns the time waited."""
+        wait = self._wait_for()
+        self._record(wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def _offload(self, fn, *args):
+        if self.backend is self.local:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    async def acquire_async(self) -> float:
+        wait = await self._offload(self._wait_for)
+        self._record(wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def observe(self, response):
+        """Record the error budget reported by an ESI response."""
+        remain = response.headers.get('X-ESI-Error-Limit-Remain')
+        reset = response.headers.get('X-ESI-Error-Limit-Reset')
+        if response.status_code == 420 and remain is None:
+            remain = 0
+        if remain is None:
+            return
+        reset_at = time.time() + float(reset or 60)
+        with self._lock:
+            self.stats['error_limit_remain'] = int(remain)
+        self._call('set_budget', int(remain), reset_at)
+
+    async def observe_async(self, response):
+        await self._offload(self.observe, response)
+
+
+def _make_limiter():
+    if LIMITER_BACKEND == 'redis':
+        return RateLimiter(RedisBucket(ESI_RATE, ESI_BURST))
+    return RateLimiter()
+
+
+# Shared by every outbound ESI / SSO call in this process.
+limiter = _make_limiter()
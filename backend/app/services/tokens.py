@@ -0,0 +1,260 @@
+import os
+import time
+import uuid
+import threading
+from datetime import datetime, timedelta, timezone
+
+from ..crypto import encrypt, decrypt
+from ..db import SessionLocal
+from ..models import EsiToken
+from .ratelimit import limiter
+from .http import get_sync_client
+
+CLIENT_ID = os.getenv('EVE_CLIENT_ID')
+CLIENT_SECRET = os.getenv('EVE_CLIENT_SECRET')
+TOKEN_URL = "https://login.eveonline.com/v2/oauth/token"
+
+# Refresh access tokens this many seconds before expires_at.
+REFRESH_MARGIN = int(os.getenv('ESI_TOKEN_REFRESH_MARGIN', '120'))
+# Re-read a cached token row at most this often (picks up refreshes done by other processes).
+CACHE_TTL = int(os.getenv('ESI_TOKEN_CACHE_TTL', '300'))
+# How often the background refresher looks for tokens about to expire.
+SCAN_INTERVAL = int(os.getenv('ESI_TOKEN_SCAN_INTERVAL', '30'))
+# 'redis' makes sure only one process refreshes a given token at a time; 'memory' only
+# coordinates threads of one process, and every RQ job runs in a process of its own.
+# Default: 'redis' when REDIS_URL is set, otherwise 'memory'.
+LOCK_BACKEND = os.getenv('ESI_TOKEN_LOCK_BACKEND', 'redis' if os.getenv('REDIS_URL') else 'memory')
+LOCK_TTL_MS = 30000
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379')
+
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+
+class TokenError(Exception):
+    """A token could not be loaded or refreshed; carries an HTTP-ish status for routes."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class LocalLocks:
+    def __init__(self):
+        self._held = set()
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        with self._lock:
+            if key in self._held:
+                return None
+            self._held.add(key)
+            return key
+
+    def release(self, key, handle):
+        with self._lock:
+            self._held.discard(key)
+
+
+class RedisLocks:
+    def __init__(self, url: str = REDIS_URL, prefix: str = 'esi:token-refresh:'):
+        from redis import Redis
+        self.redis = Redis.from_url(url, socket_timeout=1)
+        self.prefix = prefix
+        self._release = self.redis.register_script(_RELEASE_LUA)
+
+    def acquire(self, key):
+        handle = uuid.uuid4().hex
+        if self.redis.set(self.prefix + key, handle, nx=True, px=LOCK_TTL_MS):
+            return handle
+        return None
+
+    def release(self, key, handle):
+        self._release(keys=[self.prefix + key], args=[handle])
+
+
+def _epoch(dt):
+    if dt is None:
+        return None
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _sso_refresh(refresh: str) -> dict:
+    if not CLIENT_ID or not CLIENT_SECRET:
+        raise TokenError(500, 'EVE client credentials not configured')
+    data = {'grant_type': 'refresh_token', 'refresh_token': refresh}
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    limiter.acquire()
+    resp = get_sync_client().post(TOKEN_URL, auth=(CLIENT_ID, CLIENT_SECRET), data=data, headers=headers)
+    limiter.observe(resp)
+    if resp.status_code != 200:
+        raise TokenError(resp.status_code, resp.text)
+    return resp.json()
+
+
+class TokenProvider:
+    """Keeps decrypted access tokens in memory and refreshes them before they expire.
+
+    get() is the hot path for sync jobs: it answers from memory while the
+    token is valid, so there is no DB read or Fernet decrypt per ESI call. A
+    background thread refreshes cached tokens that are within REFRESH_MARGIN
+    of expiry. A per-token lock (Redis across processes, or in-process) makes
+    sure only one caller talks to SSO. Everyone else waits and re-reads the
+    row that caller stored.
+    """
+
+    def __init__(self, locks=None):
+        self.locks = locks if locks is not None else LocalLocks()
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.stats = {'hits': 0, 'loads': 0, 'refreshes': 0, 'lock_waits': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _load(self, token_id: int) -> dict:
+        db = SessionLocal()
+        try:
+            t = db.query(EsiToken).filter(EsiToken.id == token_id).first()
+            if not t:
+                raise TokenError(404, 'token not found')
+            entry = {
+                'access': decrypt(t.access_token_enc) if t.access_token_enc else t.access_token,
+                'character_id': t.character_id,
+                'expires_at': _epoch(t.expires_at),
+                'loaded_at': time.time(),
+            }
+        finally:
+            db.close()
+        self._count('loads')
+        with self._lock:
+            self._entries[token_id] = entry
+        return entry
+
+    @staticmethod
+    def _needs_refresh(entry, now) -> bool:
+        return entry['expires_at'] is not None and entry['expires_at'] - now <= REFRESH_MARGIN
+
+    def get(self, token_id: int):
+        """Return (access_token, character_id), refreshing first if the token has expired."""
+        self._ensure_refresher()
+        now = time.time()
+        entry = self._entries.get(token_id)
+        if entry is not None and now - entry['loaded_at'] < CACHE_TTL and not self._needs_refresh(entry, now):
+            self._count('hits')
+            return entry['access'], entry['character_id']
+
+        entry = self._load(token_id)
+        if self._needs_refresh(entry, now):
+            try:
+                entry = self.refresh(token_id)
+            except TokenError:
+                # still usable if it hasn't actually expired; the caller's request decides
+                if entry['expires_at'] <= now:
+                    raise
+        return entry['access'], entry['character_id']
+
+    def _acquire(self, key):
+        handle = self.locks.acquire(key)
+        if handle is not None:
+            return handle
+        # someone else is refreshing this token; wait for them to finish
+        self._count('lock_waits')
+        deadline = time.time() + LOCK_TTL_MS / 1000
+        while time.time() < deadline:
+            time.sleep(0.1)
+            handle = self.locks.acquire(key)
+            if handle is not None:
+                return handle
+        return None
+
+    def _refresh_row(self, token_id: int, force: bool):
+        db = SessionLocal()
+        try:
+            t = db.query(EsiToken).filter(EsiToken.id == token_id).first()
+            if not t:
+                raise TokenError(404, 'token not found')
+            if not force and t.expires_at is not None and _epoch(t.expires_at) - time.time() > REFRESH_MARGIN:
+                # another process refreshed it while we waited for the lock
+                return
+            refresh = decrypt(t.refresh_token_enc) if t.refresh_token_enc else t.refresh_token
+            if not refresh:
+                raise TokenError(400, 'no refresh token available')
+            token_data = _sso_refresh(refresh)
+            access_token = token_data.get('access_token')
+            refresh_token = token_data.get('refresh_token')
+            expires_in = token_data.get('expires_in')
+
+            t.access_token_enc = encrypt(access_token)
+            t.refresh_token_enc = encrypt(refresh_token) if refresh_token else t.refresh_token_enc
+            t.access_token = access_token
+            t.refresh_token = refresh_token
+            t.expires_at = datetime.utcnow() + timedelta(seconds=int(expires_in)) if expires_in else None
+            db.add(t)
+            db.commit()
+            self._count('refreshes')
+        finally:
+            db.close()
+
+    def refresh(self, token_id: int, force: bool = False) -> dict:
+        """Refresh one token through SSO under the per-token lock and return the new entry.
+
+        Without `force`, a token another process already refreshed is just re-read.
+        """
+        key = str(token_id)
+        handle = self._acquire(key)
+        if handle is None:
+            return self._load(token_id)
+        try:
+            self._refresh_row(token_id, force)
+        finally:
+            self.locks.release(key, handle)
+        return self._load(token_id)
+
+    def invalidate(self, token_id: int):
+        with self._lock:
+            self._entries.pop(token_id, None)
+
+    def refresh_due(self):
+        """Refresh every cached token that is about to expire. Called by the background thread."""
+        now = time.time()
+        due = [tid for tid, e in list(self._entries.items()) if self._needs_refresh(e, now)]
+        for tid in due:
+            try:
+                self.refresh(tid)
+            except Exception:
+                # leave it for the next scan; get() will retry on demand
+                self.invalidate(tid)
+        return due
+
+    def _run(self):
+        while not self._stop.wait(SCAN_INTERVAL):
+            self.refresh_due()
+
+    def _ensure_refresher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='esi-token-refresher', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def _make_provider():
+    if LOCK_BACKEND == 'redis':
+        return TokenProvider(RedisLocks())
+    return TokenProvider()
+
+
+# Shared by every ESI service function in this process.
+token_provider = _make_provider()
@@ -1,10 +1,374 @@
-import httpx
+"""Killmail ingestion with rolling per-region / per-type destruction counters.
+
+A source yields killmails (zKillboard RedisQ in production, a file or a fake
+list elsewhere). The ingester feeds them into a ring of fixed-width time
+buckets keyed by killmail time, so "what died in region X over the last N
+hours" sums at most N hours' worth of buckets instead of going back to
+zKillboard.
+
+Exactly one ingester may read a RedisQ queue, or the feed is split between
+readers. With ZKILL_BACKEND=redis the buckets live in Redis and the
+ingester runs on its own (app.scripts.run_zkill), so every API process reads
+the same counts. With 'memory' the API process ingests for itself, which is
+only correct when there is a single API process.
+"""
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..db import engine
+from .http import get_client
 
 ZKILL_API = 'https://zkillboard.com/api'
+REDISQ_URL = os.getenv('ZKILL_REDISQ_URL', 'https://zkillredisq.stream/listen.php')
+# 'redisq', 'file:/path/to/killmails.ndjson' or 'none' (nothing is ingested).
+ZKILL_SOURCE = os.getenv('ZKILL_SOURCE', 'none')
+# 'memory' keeps the buckets in the ingesting process; 'redis' shares them with every API process.
+ZKILL_BACKEND = os.getenv('ZKILL_BACKEND', 'memory')
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379')
+ZKILL_QUEUE_ID = os.getenv('ZKILL_QUEUE_ID', 'i-eve-tits')
+BUCKET_SECONDS = int(os.getenv('ZKILL_BUCKET_SECONDS', '300'))
+WINDOW_HOURS = int(os.getenv('ZKILL_WINDOW_HOURS', '24'))
+IDLE_SLEEP = 1.0
+ERROR_BACKOFF = 5.0
+SEEN_SIZE = 100000
+
+
+def _epoch(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def normalize(package: dict) -> dict:
+    """Flatten a RedisQ package / zKillboard / ESI killmail into the fields we count."""
+    km = package.get('killmail') or package
+    zkb = package.get('zkb') or km.get('zkb') or {}
+    victim = km.get('victim') or {}
+    return {
+        'killmail_id': package.get('killID') or km.get('killmail_id'),
+        'time': _epoch(km.get('killmail_time') or km.get('time')),
+        'solar_system_id': km.get('solar_system_id'),
+        'region_id': km.get('region_id'),
+        'type_id': victim.get('ship_type_id') or km.get('type_id'),
+        'value': float(zkb.get('totalValue') or km.get('value') or 0.0),
+    }
+
+
+class RedisQSource:
+    """zKillboard RedisQ long-poll; each poll returns at most one killmail."""
+
+    def __init__(self, queue_id: str = ZKILL_QUEUE_ID, url: str = REDISQ_URL, ttw: int = 10):
+        self.url = url
+        self.params = {'queueID': queue_id, 'ttw': ttw}
+
+    async def poll(self) -> list:
+        r = await get_client().get(self.url, params=self.params, timeout=self.params['ttw'] + 20)
+        r.raise_for_status()
+        package = r.json().get('package')
+        return [package] if package else []
+
+
+class FileSource:
+    """Follows an NDJSON file of killmails, returning the lines appended since the last poll.
+
+    A line that isn't valid JSON is counted under stats['malformed'] and skipped.
+    """
+
+    def __init__(self, path: str, batch: int = 1000):
+        self.path = path
+        self.batch = batch
+        self._offset = 0
+        self.stats = {'malformed': 0}
+
+    async def poll(self) -> list:
+        out = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                f.seek(self._offset)
+                while len(out) < self.batch:
+                    line = f.readline()
+                    if not line or not line.endswith('\n'):
+                        break
+                    self._offset = f.tell()
+                    if not line.strip():
+                        continue
+                    try:
+                        out.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        self.stats['malformed'] += 1
+        except FileNotFoundError:
+            pass
+        return out
+
+
+class FakeSource:
+    """Hands out a fixed list of killmails, `batch` per poll (tests, benchmarks)."""
+
+    def __init__(self, killmails, batch: int = 100):
+        self._pending = deque(killmails)
+        self.batch = batch
+
+    async def poll(self) -> list:
+        return [self._pending.popleft() for _ in range(min(self.batch, len(self._pending)))]
+
+
+class KillAggregator:
+    """Ring of time buckets, each {region_id: {type_id: [kills, value]}}.
+
+    Kills older than the window, or already counted, are dropped.
+    """
+
+    def __init__(self, bucket_seconds: int = BUCKET_SECONDS, window_hours: int = WINDOW_HOURS):
+        self.bucket_seconds = bucket_seconds
+        self.size = max(1, window_hours * 3600 // bucket_seconds)
+        self._ids = [None] * self.size
+        self._buckets = [None] * self.size
+        self._seen = set()
+        self._seen_order = deque()
+        self._lock = threading.Lock()
+        self.stats = {'added': 0, 'duplicates': 0, 'expired': 0, 'unlocated': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def add(self, kill: dict, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        kid = kill.get('killmail_id')
+        bucket = int(kill['time'] // self.bucket_seconds)
+        with self._lock:
+            if kid is not None and kid in self._seen:
+                self.stats['duplicates'] += 1
+                return False
+            if bucket <= int(now // self.bucket_seconds) - self.size:
+                self.stats['expired'] += 1
+                return False
+            if kill.get('region_id') is None:
+                self.stats['unlocated'] += 1
+                return False
+            slot = bucket % self.size
+            if self._ids[slot] != bucket:
+                if self._ids[slot] is not None and self._ids[slot] > bucket:
+                    # the slot already holds a newer bucket
+                    self.stats['expired'] += 1
+                    return False
+                self._ids[slot] = bucket
+                self._buckets[slot] = {}
+            counts = self._buckets[slot].setdefault(kill['region_id'], {})
+            entry = counts.setdefault(kill.get('type_id'), [0, 0.0])
+            entry[0] += 1
+            entry[1] += kill.get('value') or 0.0
+            if kid is not None:
+                self._seen.add(kid)
+                self._seen_order.append(kid)
+                if len(self._seen_order) > SEEN_SIZE:
+                    self._seen.discard(self._seen_order.popleft())
+            self.stats['added'] += 1
+            return True
+
+    def _window(self, region_id, hours, now):
+        """{type_id: [kills, value]} summed over the buckets covering the last `hours`."""
+        now = time.time() if now is None else now
+        last = int(now // self.bucket_seconds)
+        n = min(self.size, max(1, int(hours * 3600 // self.bucket_seconds)))
+        out = {}
+        with self._lock:
+            for bucket in range(last - n + 1, last + 1):
+                slot = bucket % self.size
+                if self._ids[slot] != bucket:
+                    continue
+                for type_id, (kills, value) in self._buckets[slot].get(region_id, {}).items():
+                    e = out.setdefault(type_id, [0, 0.0])
+                    e[0] += kills
+                    e[1] += value
+        return out
+
+    def top_types(self, region_id: int, hours: float = 24, limit: int = 10, by: str = 'kills', now: float = None):
+        """[{type_id, kills, value}] for the region's most destroyed types over the last `hours`."""
+        idx = 0 if by == 'kills' else 1
+        counts = self._window(region_id, hours, now)
+        ranked = sorted(counts.items(), key=lambda kv: (-kv[1][idx], kv[0] or 0))[:limit]
+        return [{'type_id': t, 'kills': k, 'value': v} for t, (k, v) in ranked]
+
+    def totals(self, region_id: int, hours: float = 24, now: float = None) -> dict:
+        counts = self._window(region_id, hours, now)
+        return {'kills': sum(k for k, _ in counts.values()), 'value': sum(v for _, v in counts.values())}
+
+
+class RedisKillAggregator(KillAggregator):
+    """The same ring kept in Redis, written by one ingester and read by every API process.
+
+    One hash per (bucket, region) holds `type_id` -> kills and `type_id:v` ->
+    value, and expires once its bucket has left the window. Killmail ids are
+    deduplicated with SET NX.
+    """
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = 'zkill:', bucket_seconds: int = BUCKET_SECONDS,
+                 window_hours: int = WINDOW_HOURS, redis=None):
+        super().__init__(bucket_seconds, window_hours)
+        if redis is None:
+            from redis import Redis
+            redis = Redis.from_url(url)
+        self.redis = redis
+        self.prefix = prefix
+
+    def _key(self, bucket, region_id):
+        return f'{self.prefix}{bucket}:{region_id}'
+
+    def add(self, kill: dict, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        bucket = int(kill['time'] // self.bucket_seconds)
+        if bucket <= int(now // self.bucket_seconds) - self.size:
+            self._count('expired')
+            return False
+        if kill.get('region_id') is None:
+            self._count('unlocated')
+            return False
+        window = (self.size + 1) * self.bucket_seconds
+        kid = kill.get('killmail_id')
+        if kid is not None and not self.redis.set(f'{self.prefix}seen:{kid}', 1, nx=True, ex=window):
+            self._count('duplicates')
+            return False
+        key = self._key(bucket, kill['region_id'])
+        field = '' if kill.get('type_id') is None else str(kill['type_id'])
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hincrby(key, field, 1)
+        pipe.hincrbyfloat(key, field + ':v', kill.get('value') or 0.0)
+        pipe.expireat(key, int((bucket + self.size + 1) * self.bucket_seconds))
+        pipe.execute()
+        self._count('added')
+        return True
+
+    def _window(self, region_id, hours, now):
+        now = time.time() if now is None else now
+        last = int(now // self.bucket_seconds)
+        n = min(self.size, max(1, int(hours * 3600 // self.bucket_seconds)))
+        pipe = self.redis.pipeline(transaction=False)
+        for bucket in range(last - n + 1, last + 1):
+            pipe.hgetall(self._key(bucket, region_id))
+        out = {}
+        for counts in pipe.execute():
+            for field, raw in counts.items():
+                field = field.decode() if isinstance(field, bytes) else field
+                type_id, _, kind = field.partition(':')
+                e = out.setdefault(int(type_id) if type_id else None, [0, 0.0])
+                if kind == 'v':
+                    e[1] += float(raw)
+                else:
+                    e[0] += int(raw)
+        return out
+
+
+def load_system_regions(bind=None) -> dict:
+    """solar_system_id -> region_id from the raw sde_mapSolarSystems table ({} if not imported)."""
+    try:
+        with (bind if bind is not None else engine).connect() as conn:
+            rows = conn.execute(text('SELECT data FROM "sde_mapSolarSystems"')).fetchall()
+    except SQLAlchemyError:
+        return {}
+    out = {}
+    for (data,) in rows:
+        obj = json.loads(data) if isinstance(data, str) else data
+        system_id = obj.get('solarSystemID', obj.get('_key'))
+        region_id = obj.get('regionID')
+        if system_id is not None and region_id is not None:
+            out[int(system_id)] = int(region_id)
+    return out
+
+
+class ZKillIngester:
+    """Polls a source forever and feeds the aggregator."""
+
+    def __init__(self, source, aggregator: KillAggregator = None, system_regions: dict = None):
+        self.source = source
+        self.aggregator = aggregator if aggregator is not None else kill_stats
+        self._regions = system_regions
+        self.stats = {'polls': 0, 'killmails': 0, 'errors': 0, 'malformed': 0}
+        self._stop = asyncio.Event()
+
+    @property
+    def system_regions(self) -> dict:
+        if self._regions is None:
+            self._regions = load_system_regions()
+        return self._regions
+
+    async def step(self) -> int:
+        """Poll once and count what came back; returns the number of killmails received.
+
+        A package that can't be normalized is counted under stats['malformed']
+        and skipped; the rest of the batch is still counted.
+        """
+        packages = await self.source.poll()
+        self.stats['polls'] += 1
+        for package in packages:
+            try:
+                kill = normalize(package)
+            except (AttributeError, KeyError, TypeError, ValueError):
+                self.stats['malformed'] += 1
+                continue
+            if kill['region_id'] is None:
+                kill['region_id'] = self.system_regions.get(kill['solar_system_id'])
+            self.aggregator.add(kill)
+        self.stats['killmails'] += len(packages)
+        return len(packages)
+
+    async def run(self):
+        while not self._stop.is_set():
+            try:
+                got = await self.step()
+            except Exception:
+                # feed hiccup; keep the counters and try again shortly
+                self.stats['errors'] += 1
+                await asyncio.sleep(ERROR_BACKOFF)
+                continue
+            if not got:
+                await asyncio.sleep(IDLE_SLEEP)
+
+    def stop(self):
+        self._stop.set()
+
+
+def make_source(spec: str = ZKILL_SOURCE):
+    """Build the source named by ZKILL_SOURCE, or None when ingestion is off."""
+    if spec == 'redisq':
+        return RedisQSource()
+    if spec.startswith('file:'):
+        return FileSource(spec[len('file:'):])
+    return None
+
+
+def _make_aggregator():
+    if ZKILL_BACKEND == 'redis':
+        return RedisKillAggregator()
+    return KillAggregator()
+
+
+# Shared by the ingester and routes in this process.
+kill_stats = _make_aggregator()
+
+
+def _losses(region_id, hours, limit):
+    return {
+        'region_id': region_id,
+        'hours': hours,
+        **kill_stats.totals(region_id, hours),
+        'top_types': kill_stats.top_types(region_id, hours, limit),
+    }
+
+
+async def recent_losses(region_id: int, hours: int = 24, limit: int = 10):
+    """Destruction in a region over the last `hours`, answered from the rolling buckets.
 
-async def recent_losses(region_id: int, hours: int = 24):
-    # This is a placeholder; zKillboard API requires query formatting
-    url = f"{ZKILL_API}/regionID/{region_id}/losses/"
-    async with httpx.AsyncClient() as client:
-        r = await client.get(url)
-        return r.text
+    The shared aggregator's Redis reads run in a thread, off the event loop.
+    """
+    if isinstance(kill_stats, RedisKillAggregator):
+        return await asyncio.to_thread(_losses, region_id, hours, limit)
+    return _losses(region_id, hours, limit)
@@ -1,9 +1,21 @@
 from .engines.mining import compute_mining_yield
 from .engines.pi import compute_pi_output
-from .services.esi import fetch_assets_by_token, fetch_industry_jobs_by_token, fetch_assets_paginated
+from .services.esi import fetch_assets_by_token, fetch_industry_jobs_response, fetch_assets_paginated, iter_assets_pages
+from .services.http import run_sync
+from .services.market import get_market_prices
+from .engines.valuation import PriceTable, refresh_character_valuation
+from .engines.asset_tree import refresh_asset_tree
+from .scheduler import scheduler
+from .services.api_cache import api_cache
+from .metrics import timed_job
 from .db import engine
+from .bulk import bulk_upsert, BulkWriter
 from sqlalchemy import text
+import httpx
 import json
+import asyncio
+import time
+from redis.exceptions import RedisError
 from datetime import datetime
 
 
@@ -12,69 +24,212 @@ def task_sync_character_assets(character_id: int):
     return {"status": "queued", "character_id": character_id}
 
 
-def task_sync_assets(token_id: int):
-    """Fetch all paginated assets and store in DB."""
-    data = fetch_assets_paginated(token_id)  # use paginated version
+ASSET_COLUMNS = ['character_id', 'item_id', 'type_id', 'location_id', 'quantity', 'synced_at', 'data']
+JOB_COLUMNS = ['character_id', 'job_id', 'type_id', 'output_location_id', 'status', 'synced_at', 'data']
+SYNC_PAGE_COLUMNS = ['character_id', 'kind', 'page', 'etag', 'synced_at']
+
+
+def _ensure_assets_table(conn, dialect):
     table = 'esi_assets'
+    if dialect == 'postgresql':
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (id serial PRIMARY KEY, character_id bigint, item_id bigint UNIQUE, type_id integer, location_id bigint, quantity integer, synced_at timestamp, data jsonb);"))
+    else:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY AUTOINCREMENT, character_id bigint, item_id bigint UNIQUE, type_id integer, location_id bigint, quantity integer, synced_at timestamp, data TEXT);"))
+    # covering index for keyset pages on (character_id, item_id)
+    if dialect == 'postgresql':
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_char_item ON {table} (character_id, item_id) INCLUDE (type_id, location_id, quantity, synced_at);"))
+    else:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_char_item ON {table} (character_id, item_id, type_id, location_id, quantity, synced_at);"))
+
+
+def _ensure_industry_table(conn, dialect):
+    table = 'esi_industry_jobs'
+    if dialect == 'postgresql':
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (id serial PRIMARY KEY, character_id bigint, job_id bigint UNIQUE, type_id integer, output_location_id bigint, status text, synced_at timestamp, data jsonb);"))
+    else:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY AUTOINCREMENT, character_id bigint, job_id bigint UNIQUE, type_id integer, output_location_id bigint, status text, synced_at timestamp, data TEXT);"))
+    # covering index for keyset pages on (character_id, job_id)
+    if dialect == 'postgresql':
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_char_job ON {table} (character_id, job_id) INCLUDE (type_id, output_location_id, status, synced_at);"))
+    else:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_char_job ON {table} (character_id, job_id, type_id, output_location_id, status, synced_at);"))
+
+
+def _ensure_sync_pages_table(conn):
+    # ETag of every ESI page whose rows are committed, written in the same transaction as the rows
+    conn.execute(text("CREATE TABLE IF NOT EXISTS esi_sync_pages (character_id bigint NOT NULL, kind text NOT NULL, page integer NOT NULL, etag text, synced_at timestamp, PRIMARY KEY (character_id, kind, page));"))
+
+
+def _stored_etags(conn, character_id, kind) -> dict:
+    rows = conn.execute(text("SELECT page, etag FROM esi_sync_pages WHERE character_id = :c AND kind = :k"),
+                        {'c': character_id, 'k': kind})
+    return {r[0]: r[1] for r in rows}
+
+
+def _record_etags(conn, character_id, kind, etags: dict, synced_at):
+    conn.execute(text("DELETE FROM esi_sync_pages WHERE character_id = :c AND kind = :k"), {'c': character_id, 'k': kind})
+    rows = [{'character_id': character_id, 'kind': kind, 'page': page, 'etag': etag, 'synced_at': synced_at}
+            for page, etag in etags.items() if etag]
+    bulk_upsert(conn, 'esi_sync_pages', SYNC_PAGE_COLUMNS, rows, key='character_id, kind, page',
+                update_columns=['etag', 'synced_at'])
+
+
+def _asset_rows(data, token_id, synced_at):
+    return [
+        {
+            'character_id': item.get('character_id') or token_id,
+            'item_id': item.get('item_id'),
+            'type_id': item.get('type_id'),
+            'location_id': item.get('location_id'),
+            'quantity': item.get('quantity'),
+            'synced_at': synced_at,
+            'data': json.dumps(item),
+        }
+        for item in data
+    ]
+
+
+def _job_rows(data, token_id, synced_at):
+    return [
+        {
+            'character_id': item.get('character_id') or token_id,
+            'job_id': item.get('job_id'),
+            'type_id': item.get('product_type_id'),
+            'output_location_id': item.get('output_location_id'),
+            'status': item.get('status'),
+            'synced_at': synced_at,
+            'data': json.dumps(item),
+        }
+        for item in data
+    ]
+
+
+async def _stream_assets(token_id: int, batch_size: int = None):
     dialect = engine.dialect.name
-    
+    synced_at = datetime.utcnow().isoformat()
+    pages = unchanged = 0
+    expires = None
     with engine.begin() as conn:
-        if dialect == 'postgresql':
-            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (id serial PRIMARY KEY, character_id bigint, item_id bigint UNIQUE, type_id integer, location_id bigint, quantity integer, synced_at timestamp, data jsonb);"))
-        else:
-            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY AUTOINCREMENT, character_id bigint, item_id bigint UNIQUE, type_id integer, location_id bigint, quantity integer, synced_at timestamp, data TEXT);"))
-        
-        synced_at = datetime.utcnow().isoformat()
-        for item in data:
-            char_id = item.get('character_id') or token_id
-            item_id = item.get('item_id')
-            type_id = item.get('type_id')
-            location_id = item.get('location_id')
-            quantity = item.get('quantity')
-            
-            if dialect == 'postgresql':
-                conn.execute(
-                    text(f"INSERT INTO {table} (character_id, item_id, type_id, location_id, quantity, synced_at, data) VALUES (:cid, :iid, :tid, :lid, :qty, :sa, CAST(:data AS jsonb)) ON CONFLICT (item_id) DO UPDATE SET quantity=:qty, data=CAST(:data AS jsonb), synced_at=:sa"),
-                    {'cid': char_id, 'iid': item_id, 'tid': type_id, 'lid': location_id, 'qty': quantity, 'sa': synced_at, 'data': json.dumps(item)}
-                )
-            else:
-                conn.execute(
-                    text(f"INSERT OR REPLACE INTO {table} (character_id, item_id, type_id, location_id, quantity, synced_at, data) VALUES (:cid, :iid, :tid, :lid, :qty, :sa, :data)"),
-                    {'cid': char_id, 'iid': item_id, 'tid': type_id, 'lid': location_id, 'qty': quantity, 'sa': synced_at, 'data': json.dumps(item)}
-                )
-    
-    return {'inserted': len(data), 'character_id': token_id}
-
-
-def task_sync_industry(token_id: int):
-    """Fetch industry jobs and store in DB."""
-    data = fetch_industry_jobs_by_token(token_id)
-    table = 'esi_industry_jobs'
+        _ensure_assets_table(conn, dialect)
+        _ensure_sync_pages_table(conn)
+        stored = _stored_etags(conn, token_id, 'assets')
+        etags = {}
+        writer = BulkWriter(conn, 'esi_assets', ASSET_COLUMNS, key='item_id',
+                            batch_size=batch_size, casts={'data': 'jsonb'})
+        # pages arrive in completion order; write each as soon as it lands
+        async for page, resp in iter_assets_pages(token_id):
+            pages += 1
+            if resp.expires_at:
+                expires = resp.expires_at if expires is None else min(expires, resp.expires_at)
+            etags[page] = resp.headers.get('ETag')
+            if etags[page] and stored.get(page) == etags[page]:
+                # this exact page was committed by an earlier sync. A cache hit or 304 alone
+                # proves nothing: the sync that cached it may have rolled back.
+                unchanged += 1
+                continue
+            # a full batch flushes inside add(); run it off the loop so page fetches keep going
+            await asyncio.to_thread(writer.add, _asset_rows(resp.data, token_id, synced_at))
+        stats = await asyncio.to_thread(writer.close)
+        _record_etags(conn, token_id, 'assets', etags, synced_at)
+    return pages, unchanged, stats, expires
+
+
+def _market_prices():
+    try:
+        return PriceTable.from_market(run_sync(get_market_prices()))
+    except httpx.HTTPError:
+        # value with SDE base prices only
+        return None
+
+
+def _schedule_next(kind, token_id, expires_at):
+    try:
+        return scheduler.mark_synced(kind, token_id, expires_at)
+    except RedisError:
+        # the scheduler's lease retries the pair if its next due time isn't recorded
+        return None
+
+
+def _publish_change(character_id):
+    try:
+        api_cache.bump_character(character_id)
+    except RedisError:
+        # cached responses for this character age out with their TTL instead
+        pass
+
+
+@timed_job
+def task_sync_assets(token_id: int, batch_size: int = None):
+    """Stream all asset pages from ESI and bulk upsert the ones that changed as they arrive.
+
+    When anything changed, the character's rows in asset_valuations and its
+    resolved location tree (esi_asset_locations / esi_asset_closure) are rebuilt.
+    The next sync is scheduled for when ESI's copy of the asset pages expires.
+    """
+    pages, unchanged, stats, expires = run_sync(_stream_assets(token_id, batch_size))
+    valuation = tree = None
+    if stats['rows']:
+        prices = _market_prices()
+        with engine.begin() as conn:
+            valuation = refresh_character_valuation(conn, token_id, prices)
+            tree = refresh_asset_tree(conn, token_id, prices)
+        _publish_change(token_id)
+    next_due = _schedule_next('assets', token_id, expires)
+    return {'inserted': stats['rows'], 'pages': pages, 'unchanged_pages': unchanged,
+            'character_id': token_id, 'write': stats, 'valuation': valuation, 'tree': tree, 'next_due': next_due}
+
+
+@timed_job
+def task_sync_industry(token_id: int, batch_size: int = None):
+    """Fetch industry jobs and bulk upsert them into the DB."""
+    resp = fetch_industry_jobs_response(token_id)
+    data = resp.data
+    etag = resp.headers.get('ETag')
     dialect = engine.dialect.name
-    
+    synced_at = datetime.utcnow().isoformat()
+
     with engine.begin() as conn:
-        if dialect == 'postgresql':
-            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (id serial PRIMARY KEY, character_id bigint, job_id bigint UNIQUE, type_id integer, output_location_id bigint, status text, synced_at timestamp, data jsonb);"))
-        else:
-            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY AUTOINCREMENT, character_id bigint, job_id bigint UNIQUE, type_id integer, output_location_id bigint, status text, synced_at timestamp, data TEXT);"))
-        
-        synced_at = datetime.utcnow().isoformat()
-        for item in data:
-            char_id = item.get('character_id') or token_id
-            job_id = item.get('job_id')
-            type_id = item.get('product_type_id')
-            output_loc = item.get('output_location_id')
-            status = item.get('status')
-            
-            if dialect == 'postgresql':
-                conn.execute(
-                    text(f"INSERT INTO {table} (character_id, job_id, type_id, output_location_id, status, synced_at, data) VALUES (:cid, :jid, :tid, :oloc, :st, :sa, CAST(:data AS jsonb)) ON CONFLICT (job_id) DO UPDATE SET status=:st, data=CAST(:data AS jsonb), synced_at=:sa"),
-                    {'cid': char_id, 'jid': job_id, 'tid': type_id, 'oloc': output_loc, 'st': status, 'sa': synced_at, 'data': json.dumps(item)}
-                )
-            else:
-                conn.execute(
-                    text(f"INSERT OR REPLACE INTO {table} (character_id, job_id, type_id, output_location_id, status, synced_at, data) VALUES (:cid, :jid, :tid, :oloc, :st, :sa, :data)"),
-                    {'cid': char_id, 'jid': job_id, 'tid': type_id, 'oloc': output_loc, 'st': status, 'sa': synced_at, 'data': json.dumps(item)}
-                )
-    
-    return {'inserted': len(data), 'character_id': token_id}
+        _ensure_industry_table(conn, dialect)
+        _ensure_sync_pages_table(conn)
+        # skip only when these exact jobs were committed before, not merely cached
+        unchanged = bool(etag) and _stored_etags(conn, token_id, 'industry').get(1) == etag
+        if not unchanged:
+            rows = _job_rows(data, token_id, synced_at)
+            stats = bulk_upsert(conn, 'esi_industry_jobs', JOB_COLUMNS, rows, key='job_id',
+                                batch_size=batch_size, casts={'data': 'jsonb'})
+            _record_etags(conn, token_id, 'industry', {1: etag}, synced_at)
+    next_due = _schedule_next('industry', token_id, resp.expires_at)
+    if unchanged:
+        return {'inserted': 0, 'unchanged': True, 'character_id': token_id, 'next_due': next_due}
+    _publish_change(token_id)
+    return {'inserted': len(data), 'unchanged': False, 'character_id': token_id, 'write': stats, 'next_due': next_due}
+
+
+SYNC_TASKS = {'assets': task_sync_assets, 'industry': task_sync_industry}
+
+
+@timed_job
+def task_sync_tokens(token_ids, kinds=('assets', 'industry'), batch_size=None):
+    """Sync several tokens in one job.
+
+    Worker startup, the ESI connection pool and the DB pool are paid for
+    once per batch instead of once per token. A token that fails is
+    reported under `errors` and the rest of the batch carries on.
+    """
+    start = time.perf_counter()
+    results, errors = {}, {}
+    for token_id in token_ids:
+        for kind in kinds:
+            try:
+                results.setdefault(token_id, {})[kind] = SYNC_TASKS[kind](token_id, batch_size)
+            except Exception as e:
+                errors.setdefault(token_id, {})[kind] = f'{type(e).__name__}: {e}'
+    return {'tokens': len(token_ids), 'results': results, 'errors': errors,
+            'elapsed': round(time.perf_counter() - start, 4)}
+
+
+@timed_job
+def task_import_sde(force: bool = False, workers: int = None):
+    """SDE import for the cpu queue; returns the per-file results."""
+    from .scripts.import_sde import import_all
+    return import_all(workers=workers, force=force)
@@ -1,12 +1,149 @@
+"""RQ worker supervisor.
+
+Runs a pool of worker processes for ESI-bound jobs (syncs: mostly waiting on
+the network) and a pool for CPU-bound jobs (SDE import, engine batches), so
+a long import never holds up character syncs. Dead workers are respawned.
+SIGTERM/SIGINT stop every worker after its current job; SIGHUP restarts them
+the same way (e.g. after a deploy), with replacements started as the old
+ones finish.
+
+Usage (from backend/):  python worker.py [--processes N] [--cpu-processes M]
+"""
 import os
+import time
+import signal
+import argparse
+import logging
+import multiprocessing
+
 from redis import Redis
-from rq import Worker, Queue, Connection
 
-listen = ['default']
+log = logging.getLogger('worker')
+
 redis_url = os.getenv('REDIS_URL', 'redis://redis:6379')
-conn = Redis.from_url(redis_url)
+# Total worker processes; defaults to the core count.
+PROCESSES = int(os.getenv('WORKER_PROCESSES', '0')) or os.cpu_count() or 1
+# How many of them take CPU-bound work; defaults to a quarter (at least one).
+CPU_PROCESSES = os.getenv('WORKER_CPU_PROCESSES')
+# Interactive syncs first, then scheduled ones; 'default' keeps older enqueued jobs draining.
+ESI_QUEUES = ['sync-interactive', 'default', 'sync-background']
+CPU_QUEUES = ['cpu']
+# A worker that crashes sooner than this after starting isn't respawned until this long after its start.
+MIN_UPTIME = 5.0
+
+
+def plan_pools(processes: int = PROCESSES, cpu_processes: int = None) -> dict:
+    """{pool: (queues, process count)}; both pools always get at least one process."""
+    processes = max(2, processes)
+    if cpu_processes is None:
+        cpu_processes = int(CPU_PROCESSES) if CPU_PROCESSES else max(1, processes // 4)
+    cpu_processes = min(max(1, cpu_processes), processes - 1)
+    return {'esi': (ESI_QUEUES, processes - cpu_processes), 'cpu': (CPU_QUEUES, cpu_processes)}
+
+
+def run_worker(queues, name=None):
+    """Child process body: one rq.Worker listening on `queues` in priority order."""
+    from rq import Worker, Queue
+    from app.db import engine
+
+    # drop the supervisor's handlers: SIGHUP is for it alone, rq installs its own INT/TERM ones
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    # never share pooled DB connections inherited over fork
+    engine.dispose(close=False)
+    conn = Redis.from_url(redis_url)
+    Worker([Queue(q, connection=conn) for q in queues], connection=conn, name=name).work()
+
+
+class Supervisor:
+    def __init__(self, pools: dict, target=run_worker):
+        self.pools = pools
+        self.target = target
+        self.procs = {}
+        self.stats = {'spawned': 0, 'respawned': 0, 'restarts': 0}
+        self._stopping = False
+        self._ctx = multiprocessing.get_context('fork')
+
+    def _spawn(self, pool, slot):
+        queues, _ = self.pools[pool]
+        name = f'{os.uname().nodename}.{os.getpid()}.{pool}-{slot}.{self.stats["spawned"]}'
+        proc = self._ctx.Process(target=self.target, args=(queues, name), name=f'{pool}-{slot}', daemon=False)
+        proc.start()
+        self.procs[(pool, slot)] = (proc, time.monotonic())
+        self.stats['spawned'] += 1
+        return proc
+
+    def start(self):
+        for pool, (_, count) in self.pools.items():
+            for slot in range(count):
+                self._spawn(pool, slot)
+
+    def reap(self, now: float = None) -> int:
+        """Respawn every worker that exited; returns how many were replaced."""
+        now = time.monotonic() if now is None else now
+        replaced = 0
+        for key, (proc, started) in list(self.procs.items()):
+            if proc.is_alive() or self._stopping:
+                continue
+            proc.join()
+            if proc.exitcode != 0 and now - started < MIN_UPTIME:
+                # crashing on startup (Redis down, bad import): don't spin
+                continue
+            log.info('worker %s exited with %s; respawning', proc.name, proc.exitcode)
+            self._spawn(*key)
+            self.stats['respawned'] += 1
+            replaced += 1
+        return replaced
+
+    def signal_all(self, signum=signal.SIGTERM):
+        for proc, _ in self.procs.values():
+            if proc.is_alive():
+                os.kill(proc.pid, signum)
+
+    def restart(self):
+        """Warm-stop every worker; reap() starts a replacement as each one finishes its job."""
+        self.stats['restarts'] += 1
+        self.signal_all(signal.SIGTERM)
+
+    def stop(self, timeout: float = None):
+        self._stopping = True
+        self.signal_all(signal.SIGTERM)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for proc, _ in self.procs.values():
+            proc.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        for proc, _ in self.procs.values():
+            if proc.is_alive():
+                proc.kill()
+                proc.join()
+
+    def alive(self) -> int:
+        return sum(1 for proc, _ in self.procs.values() if proc.is_alive())
+
+    def run(self, interval: float = 1.0):
+        signals = []
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, lambda s, _frame: signals.append(s))
+        self.start()
+        log.info('supervising %s', {p: n for p, (_, n) in self.pools.items()})
+        while True:
+            while signals:
+                s = signals.pop(0)
+                if s == signal.SIGHUP:
+                    log.info('SIGHUP: restarting workers')
+                    self.restart()
+                else:
+                    log.info('stopping workers after their current jobs')
+                    self.stop()
+                    return
+            self.reap()
+            time.sleep(interval)
+
 
 if __name__ == '__main__':
-    with Connection(conn):
-        worker = Worker(list(map(Queue, listen)))
-        worker.work()
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Run a supervised pool of RQ workers')
+    parser.add_argument('--processes', type=int, default=PROCESSES, help='total worker processes (default: core count)')
+    parser.add_argument('--cpu-processes', type=int, default=None, help='how many of them serve the cpu queue')
+    args = parser.parse_args()
+    Supervisor(plan_pools(args.processes, args.cpu_processes)).run()
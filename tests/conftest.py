@@ -1,2 +1,25 @@
 # pytest configuration
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
 pytest_plugins = []
+
+
+@pytest.fixture
+def sqlite_engine():
+    """Factory for throwaway in-memory SQLite engines; call it once per database a test needs.
+
+    StaticPool keeps one shared connection, so every session sees the same
+    database. Sync tasks write from the HTTP loop thread, hence check_same_thread.
+    """
+    engines = []
+
+    def make():
+        eng = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+        engines.append(eng)
+        return eng
+
+    yield make
+    for eng in engines:
+        eng.dispose()
@@ -0,0 +1,141 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+
+def _client(monkeypatch, sqlite_engine):
+    from backend.app.main import app
+    from backend.app.routes import data
+    from backend.app.sde import TypeDictionary
+    from backend.app.services.api_cache import ApiCache
+    from backend.app import tasks
+
+    eng = sqlite_engine()
+    with eng.begin() as conn:
+        tasks._ensure_assets_table(conn, 'sqlite')
+        conn.execute(text("CREATE TABLE sde_types_norm (type_id INTEGER PRIMARY KEY, name TEXT, group_id INTEGER, market_group_id INTEGER, volume REAL, portion_size INTEGER, base_price REAL)"))
+        conn.execute(text("INSERT INTO sde_types_norm VALUES (34, 'Tritanium', 18, 1857, 0.01, 1, 2.0)"))
+        conn.execute(text("INSERT INTO esi_assets (character_id, item_id, type_id, location_id, quantity) VALUES (1, 1, 34, 60003760, 10), (2, 2, 34, 60003760, 5)"))
+    cache = ApiCache()
+    monkeypatch.setattr(data, 'SessionLocal', sessionmaker(bind=eng))
+    monkeypatch.setattr(data, 'sde_types', TypeDictionary(bind=eng))
+    monkeypatch.setattr(data, 'api_cache', cache)
+    return TestClient(app), eng, cache
+
+
+def test_assets_served_from_cache_until_character_bumped(monkeypatch, sqlite_engine):
+    client, eng, cache = _client(monkeypatch, sqlite_engine)
+
+    first = client.get('/data/assets/1')
+    with eng.begin() as conn:
+        conn.execute(text("UPDATE esi_assets SET quantity = 99"))
+    assert client.get('/data/assets/1').json() == first.json()
+    assert cache.stats['hits'] == 1
+
+    # another character's sync leaves this entry alone
+    cache.bump_character(2)
+    assert client.get('/data/assets/1').json()['assets'][0]['quantity'] == 10
+    assert client.get('/data/assets/2').json()['assets'][0]['quantity'] == 99
+
+    cache.bump_character(1)
+    assert client.get('/data/assets/1').json()['assets'][0]['quantity'] == 99
+
+
+def test_query_params_are_part_of_the_key(monkeypatch, sqlite_engine):
+    client, _, _ = _client(monkeypatch, sqlite_engine)
+
+    assert len(client.get('/data/assets/1', params={'limit': 1}).json()['assets']) == 1
+    assert client.get('/data/assets/1', params={'limit': 1, 'offset': 1}).json()['assets'] == []
+
+
+def test_etag_revalidation_returns_304(monkeypatch, sqlite_engine):
+    client, _, cache = _client(monkeypatch, sqlite_engine)
+
+    r = client.get('/data/sde-type/34')
+    etag = r.headers['etag']
+    assert r.json()['name'] == 'Tritanium'
+    assert r.headers['cache-control'] == 'private, no-cache'
+
+    again = client.get('/data/sde-type/34', headers={'If-None-Match': etag})
+    assert again.status_code == 304 and again.content == b''
+    assert cache.stats['not_modified'] == 1
+
+    # same body under a new SDE version: still the same ETag
+    cache.bump_sde()
+    assert client.get('/data/sde-type/34', headers={'If-None-Match': etag}).status_code == 304
+    assert cache.stats['misses'] == 2
+
+
+def test_sde_entries_invalidated_by_sde_bump_only(monkeypatch, sqlite_engine):
+    client, eng, cache = _client(monkeypatch, sqlite_engine)
+
+    client.get('/data/sde-type/34')
+    with eng.begin() as conn:
+        conn.execute(text("UPDATE sde_types_norm SET name = 'Trit'"))
+    cache.bump_character(1)
+    assert client.get('/data/sde-type/34').json()['name'] == 'Tritanium'
+    cache.bump_sde()
+    assert client.get('/data/sde-type/34').json()['name'] == 'Trit'
+
+
+def test_errors_are_not_cached(monkeypatch, sqlite_engine):
+    client, eng, _ = _client(monkeypatch, sqlite_engine)
+
+    assert client.get('/data/sde-type/35').status_code == 404
+    with eng.begin() as conn:
+        conn.execute(text("INSERT INTO sde_types_norm VALUES (35, 'Pyerite', 18, 1857, 0.01, 1, 5.0)"))
+    assert client.get('/data/sde-type/35').status_code == 200
+
+
+def test_sync_publishes_character_change(monkeypatch, sqlite_engine):
+    from backend.app import tasks
+    from backend.app.services.api_cache import ApiCache
+    from backend.app.services.cache import CachedResponse
+
+    eng = sqlite_engine()
+    cache = ApiCache()
+    monkeypatch.setattr(tasks, 'engine', eng)
+    monkeypatch.setattr(tasks, 'api_cache', cache)
+    responses = iter([CachedResponse([{'job_id': 1, 'product_type_id': 34}], {'ETag': '"j1"'}, 'miss'),
+                      CachedResponse([{'job_id': 1, 'product_type_id': 34}], {'ETag': '"j1"'}, 'not_modified')])
+    monkeypatch.setattr(tasks, 'fetch_industry_jobs_response', lambda token_id: next(responses))
+
+    tasks.task_sync_industry(5)
+    assert cache.versions.get_many(['char:5', 'char:all', 'char:6']) == [1, 1, 0]
+    # nothing changed: cached responses stay valid
+    tasks.task_sync_industry(5)
+    assert cache.versions.get_many(['char:5']) == [1]
+
+
+def test_null_backend_computes_every_response_but_keeps_etags(monkeypatch, sqlite_engine):
+    from backend.app.services.api_cache import ApiCache, NullBackend
+    from backend.app.routes import data
+
+    client, eng, _ = _client(monkeypatch, sqlite_engine)
+    cache = ApiCache(NullBackend())
+    monkeypatch.setattr(data, 'api_cache', cache)
+
+    first = client.get('/data/assets/1')
+    with eng.begin() as conn:
+        conn.execute(text("UPDATE esi_assets SET quantity = 99"))
+    assert client.get('/data/assets/1').json()['assets'][0]['quantity'] == 99
+    assert cache.stats['hits'] == 0
+    assert client.get('/data/assets/1', headers={'If-None-Match': first.headers['etag']}).status_code == 200
+
+
+def test_cached_body_matches_fastapi_encoding():
+    from datetime import datetime
+    from decimal import Decimal
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from starlette.requests import Request
+    from backend.app.services.api_cache import ApiCache
+
+    # Postgres numeric and timestamp columns come back as Decimal and datetime
+    row = {'type_id': 34, 'volume': Decimal('0.01'), 'base_price': Decimal('2'),
+           'synced_at': datetime(2024, 1, 1, 12, 0, 0), 'name': 'Tritanium'}
+    request = Request({'type': 'http', 'headers': []})
+    cached = ApiCache().respond(request, 'sde-type', {'type_id': 34}, lambda: row, sde=True)
+    assert cached.body == JSONResponse(jsonable_encoder(row)).body
+    assert b'"synced_at":"2024-01-01T12:00:00"' in cached.body
+    assert b'"volume":0.01' in cached.body
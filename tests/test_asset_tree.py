@@ -0,0 +1,105 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from backend.app.engines import asset_tree, valuation
+from backend.app.sde import TypeDictionary
+
+STATION, OTHER = 60003760, 60008494
+# ship 10 in STATION holds container 11, which holds 12 and 13; 14 is loose in STATION; 20 is in OTHER
+ASSETS = [
+    (1, 10, 34, STATION, 1), (1, 11, 35, 10, 1), (1, 12, 34, 11, 100), (1, 13, 99, 11, 5),
+    (1, 14, 35, STATION, 7), (1, 20, 34, OTHER, 3), (2, 30, 34, STATION, 1),
+]
+
+
+def _types_engine(sqlite_engine):
+    eng = sqlite_engine()
+    with eng.begin() as conn:
+        conn.execute(text("CREATE TABLE sde_types_norm (type_id INTEGER PRIMARY KEY, name TEXT, group_id INTEGER, volume REAL, base_price REAL)"))
+        conn.execute(text("INSERT INTO sde_types_norm VALUES (34, 'Tritanium', 18, 0.01, 2.0), (35, 'Pyerite', 18, 0.01, 8.0)"))
+    return eng
+
+
+def _built(monkeypatch, sqlite_engine):
+    from backend.app import tasks
+
+    # separate engine: with StaticPool, SDE lookups would roll back the tree transaction
+    monkeypatch.setattr(valuation, 'sde_types', TypeDictionary(bind=_types_engine(sqlite_engine)))
+    eng = _types_engine(sqlite_engine)
+    with eng.begin() as conn:
+        tasks._ensure_assets_table(conn, 'sqlite')
+        conn.execute(text("INSERT INTO esi_assets (character_id, item_id, type_id, location_id, quantity) VALUES (:c, :i, :t, :l, :q)"),
+                     [dict(zip('citlq', a)) for a in ASSETS])
+        stats = asset_tree.refresh_asset_tree(conn, 1)
+        asset_tree.refresh_asset_tree(conn, 2)
+    return eng, stats
+
+
+def test_resolve_locations_roots_depth_and_path():
+    tree = asset_tree.resolve_locations([(12, 11), (11, 10), (10, STATION), (14, STATION), (40, 41), (41, 40)])
+    assert tree[10] == (STATION, 1, (STATION,))
+    assert tree[12] == (STATION, 3, (STATION, 10, 11))
+    assert tree[14] == (STATION, 1, (STATION,))
+    # a location cycle ends the walk instead of looping forever
+    assert {tree[40][0], tree[41][0]} <= {40, 41}
+
+
+def test_refresh_builds_locations_and_closure(monkeypatch, sqlite_engine):
+    eng, stats = _built(monkeypatch, sqlite_engine)
+    assert stats == {'character_id': 1, 'items': 6, 'roots': 2, 'max_depth': 3}
+    with eng.connect() as conn:
+        row = conn.execute(text("SELECT root_location_id, depth, path, value FROM esi_asset_locations WHERE item_id = 12")).first()
+        assert tuple(row) == (STATION, 3, f'{STATION}/10/11', 200.0)
+        ancestors = conn.execute(text("SELECT ancestor_id, distance FROM esi_asset_closure WHERE item_id = 13 ORDER BY distance")).fetchall()
+        assert [tuple(a) for a in ancestors] == [(11, 1), (10, 2), (STATION, 3)]
+
+        roots = asset_tree.root_totals(conn, 1)
+        assert roots[0] == {'location_id': STATION, 'items': 5, 'quantity': 114, 'value': 2 + 8 + 200 + 56.0,
+                            'unpriced': 1, 'max_depth': 3}
+        assert roots[1]['location_id'] == OTHER
+        assert asset_tree.location_totals(conn, 1, 10)['items'] == 3
+        assert asset_tree.location_totals(conn, 1, 99999)['items'] == 0
+
+        assert [r[0] for r in asset_tree.subtree(conn, 1, STATION)] == [10, 11, 12, 13, 14]
+        assert [r[0] for r in asset_tree.subtree(conn, 1, STATION, max_depth=1)] == [10, 14]
+        assert [r[0] for r in asset_tree.subtree(conn, 1, STATION, limit=2, after=11)] == [12, 13]
+        # another character's items in the same station stay separate
+        assert [r[0] for r in asset_tree.subtree(conn, 2, STATION)] == [30]
+
+    # a rebuild replaces the character's rows
+    with eng.begin() as conn:
+        conn.execute(text("UPDATE esi_assets SET location_id = :s WHERE item_id = 12"), {'s': OTHER})
+        asset_tree.refresh_asset_tree(conn, 1)
+        assert asset_tree.location_totals(conn, 1, 11)['items'] == 1
+        assert asset_tree.location_totals(conn, 1, OTHER)['items'] == 2
+
+
+def test_location_routes(monkeypatch, sqlite_engine):
+    from backend.app.main import app
+    from backend.app.routes import data
+    from backend.app.services.api_cache import ApiCache
+
+    eng, _ = _built(monkeypatch, sqlite_engine)
+    monkeypatch.setattr(data, 'engine', eng)
+    monkeypatch.setattr(data, 'sde_types', TypeDictionary(bind=_types_engine(sqlite_engine)))
+    monkeypatch.setattr(data, 'api_cache', ApiCache())
+    client = TestClient(app)
+
+    locations = client.get('/data/assets/1/locations').json()['locations']
+    assert [l['location_id'] for l in locations] == [STATION, OTHER]
+
+    page = client.get(f'/data/assets/1/locations/{STATION}', params={'limit': 3}).json()
+    assert [a['item_id'] for a in page['assets']] == [10, 11, 12]
+    assert page['assets'][2]['path'] == [STATION, 10, 11]
+    assert page['assets'][2]['type_name'] == 'Tritanium'
+    rest = client.get(f'/data/assets/1/locations/{STATION}', params={'limit': 3, 'cursor': page['next_cursor']}).json()
+    assert [a['item_id'] for a in rest['assets']] == [13, 14]
+    assert rest['next_cursor'] is None
+
+    totals = client.get('/data/assets/1/locations/11/totals').json()
+    assert totals == {'location_id': 11, 'items': 2, 'quantity': 105, 'value': 200.0, 'unpriced': 1, 'max_depth': 1}
+    # before any tree is built the routes answer empty rather than failing
+    monkeypatch.setattr(data, 'engine', _types_engine(sqlite_engine))
+    monkeypatch.setattr(data, 'api_cache', ApiCache())
+    assert client.get('/data/assets/1/locations').json()['locations'] == []
+    assert client.get(f'/data/assets/1/locations/{STATION}').json()['assets'] == []
@@ -0,0 +1,62 @@
+import json
+
+import httpx
+
+from backend.app import tasks
+from backend.app.services import cache
+from backend.app.scripts import bench_suite, synth_sde
+from backend.app.scripts.fake_esi import FakeEsi, PAGE_SIZE
+
+
+def test_fake_esi_pages_etags_and_304():
+    fake = FakeEsi(assets_per_character=2500)
+    with httpx.Client(transport=fake.transport()) as client:
+        url = 'https://esi.evetech.net/latest/characters/7/assets/'
+        r = client.get(url, params={'page': 1})
+        assert r.status_code == 200
+        assert r.headers['X-Pages'] == '3'
+        assert all(h in r.headers for h in ('ETag', 'Expires', 'Last-Modified', 'X-ESI-Error-Limit-Remain'))
+        assert len(r.json()) == PAGE_SIZE
+        assert len(client.get(url, params={'page': 3}).json()) == 500
+        assert client.get(url, params={'page': 4}).status_code == 404
+
+        again = client.get(url, params={'page': 1}, headers={'If-None-Match': r.headers['ETag']})
+        assert again.status_code == 304
+        assert fake.stats['not_modified'] == 1
+        # deterministic: same seed, same bodies
+        assert FakeEsi(assets_per_character=2500).assets(7) == r.json() + client.get(url, params={'page': 2}).json() + \
+            client.get(url, params={'page': 3}).json()
+
+
+def test_synth_sde_blueprints_form_a_dag(tmp_path):
+    out = synth_sde.generate(str(tmp_path), types=300, groups=10, blueprints=50, systems=20)
+    assert out['counts'] == {'types': 300, 'groups': 10, 'blueprints': 50, 'mapSolarSystems': 20}
+    position = {t: i for i, t in enumerate(out['product_type_ids'])}
+    with open(tmp_path / 'blueprints.jsonl') as f:
+        for line in f:
+            bp = json.loads(line)['activities']['manufacturing']
+            product = bp['products'][0]['typeID']
+            for m in bp['materials']:
+                assert m['typeID'] in out['raw_type_ids'] or position[m['typeID']] < position[product]
+
+
+def test_bench_suite_runs_offline_and_restores_globals():
+    engine, response_cache_backend = tasks.engine, cache.response_cache.backend
+    report = bench_suite.run('small', characters=1, assets=1200, jobs=5, types=200, blueprints=30, systems=20,
+                             orders=500, history_types=5, requests=2)
+
+    results = report['results']
+    assert set(results) == {'sde', 'sync', 'data', 'engines'}
+    assert results['sde']['import']['rows'] > 0
+    assert results['sync']['cold']['rows'] == 1205
+    assert results['sync']['warm']['esi_requests'] == 0
+    assert results['sync']['revalidated']['not_modified'] == results['sync']['revalidated']['esi_requests']
+    assert results['data']['assets_first_page']['cached']['n'] == 2
+    assert report['meta']['params']['assets'] == 1200
+    json.dumps(report)
+
+    assert tasks.engine is engine
+    assert cache.response_cache.backend is response_cache_backend
+
+    rows = bench_suite.compare(report, report)
+    assert rows and all(change in (0.0, None) for _, _, _, change in rows)
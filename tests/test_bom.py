@@ -0,0 +1,117 @@
+from fastapi.testclient import TestClient
+
+from backend.app.engines import blueprints
+from backend.app.engines.bom import BomEngine, StructureProfile
+
+# ship 600 <- component 500 (x2) + 34; component 500 <- 34, 35; composite 16670 via reaction
+BLUEPRINTS = [
+    {'_key': 601, 'activities': {'manufacturing': {'materials': [{'typeID': 500, 'quantity': 10}, {'typeID': 34, 'quantity': 1000}],
+                                                  'products': [{'typeID': 600, 'quantity': 1}], 'time': 6000}}},
+    {'_key': 602, 'activities': {'manufacturing': {'materials': [{'typeID': 500, 'quantity': 4}, {'typeID': 16670, 'quantity': 20}],
+                                                  'products': [{'typeID': 610, 'quantity': 1}], 'time': 6000}}},
+    {'_key': 501, 'activities': {'manufacturing': {'materials': [{'typeID': 34, 'quantity': 100}, {'typeID': 35, 'quantity': 33}],
+                                                  'products': [{'typeID': 500, 'quantity': 10}], 'time': 600}}},
+    {'_key': 46204, 'activities': {'reaction': {'materials': [{'typeID': 16633, 'quantity': 100}],
+                                               'products': [{'typeID': 16670, 'quantity': 10000}], 'time': 10800}}},
+]
+
+
+def _engine(**kw):
+    graph = blueprints.RecipeGraph(r for b in BLUEPRINTS for r in blueprints.recipes_from_sde(b))
+    return BomEngine(graph, component_me=0, component_te=0, **kw)
+
+
+def test_explode_is_memoized_per_type_me_profile():
+    bom = _engine()
+    ship = bom.explode(600, me=0)
+    assert ship['depth'] == 2
+    assert ship['components'] == {500: 10.0}
+    assert ship['materials'] == {34: 1000 + 10 * 10.0, 35: 10 * 3.3}
+
+    misses = bom.stats['misses']
+    bom.explode(610, me=0)
+    # component 500 and raw 34/35 subtrees were reused
+    assert bom.stats['misses'] == misses + 3
+    bom.explode(600, me=10)
+    assert bom.stats['misses'] == misses + 4
+    bom.explode(600, me=0, profile=StructureProfile(0.01))
+    assert bom.stats['misses'] > misses + 4
+
+
+def test_build_shares_components_across_lines():
+    bom = _engine()
+    plan = bom.build([{'type_id': 600, 'quantity': 3}, {'type_id': 610, 'quantity': 2, 'me': 10}])
+    lines = {l['type_id']: l for l in plan['lines']}
+    assert lines[600]['materials'] == {500: 30, 34: 3000}
+    assert lines[610]['materials'] == {500: 8, 16670: 36}
+
+    comps = {c['type_id']: c for c in plan['components']}
+    # 38 components from both lines -> one job of 4 runs
+    assert comps[500]['runs'] == 4 and comps[500]['surplus'] == 2
+    assert comps[16670]['activity'] == 'reaction' and comps[16670]['runs'] == 1
+    assert plan['materials'] == {34: 3000 + 400, 35: 132, 16633: 100}
+
+
+def test_structure_profile_and_without_reactions():
+    profile = StructureProfile.for_structure('raitaru', 't2', 'null')
+    assert abs(profile.material_bonus - (1 - 0.99 * (1 - 0.024 * 2.1))) < 1e-12
+    plan = _engine(include_reactions=False).build([{'type_id': 610, 'quantity': 1, 'me': 10}], profile)
+    assert 16670 in plan['materials']
+    assert all(c['activity'] == 'manufacturing' for c in plan['components'])
+
+
+def test_bom_endpoint(monkeypatch):
+    from backend.app.main import app
+    from backend.app.routes import dashboard
+
+    bom = _engine()
+    loader = blueprints._GraphLoader()
+    monkeypatch.setattr(loader, 'get', lambda: bom.graph)
+    monkeypatch.setattr(dashboard, 'recipe_graph', loader)
+    monkeypatch.setattr(dashboard, 'bom_engine', bom)
+
+    client = TestClient(app)
+    r = client.post('/dashboard/industry/bom', json={'lines': [{'type_id': 600, 'quantity': 1}], 'structure': 'azbel'})
+    assert r.status_code == 200
+    assert r.json()['lines'][0]['runs'] == 1
+    assert client.post('/dashboard/industry/bom', json={'lines': [{'type_id': 34, 'quantity': 1}]}).status_code == 400
+
+
+def test_memo_is_cleared_on_sde_version_bump(monkeypatch):
+    from backend.app.engines import bom as bom_module
+    from backend.app.sde import SdeVersionWatch
+    from backend.app.services.api_cache import MemoryVersions
+
+    versions = MemoryVersions()
+    watch = SdeVersionWatch(versions, interval=0)
+    monkeypatch.setattr(bom_module, 'sde_watch', watch)
+    bom = _engine()
+    watch.register(bom.clear)
+
+    bom.explode(600, me=0)
+    misses = bom.stats['misses']
+    bom.explode(600, me=0)
+    assert bom.stats['misses'] == misses
+    versions.bump('sde')
+    bom.explode(600, me=0)
+    assert bom.stats['misses'] == 2 * misses
+
+
+def test_build_is_cached_per_lines_profile_and_sde_version(monkeypatch):
+    from backend.app.engines import bom as bom_module
+    from backend.app.sde import SdeVersionWatch
+    from backend.app.services.api_cache import MemoryVersions
+
+    versions = MemoryVersions()
+    monkeypatch.setattr(bom_module, 'sde_watch', SdeVersionWatch(versions, interval=0))
+    bom = _engine()
+    lines = [{'type_id': 600, 'quantity': 3}, {'type_id': 610, 'quantity': 2, 'me': 10}]
+
+    first = bom.build(lines)
+    # an explicit default ME is the same line
+    assert bom.build([{'type_id': 600, 'quantity': 3, 'me': 0}, lines[1]]) is first
+    assert bom.stats['build_hits'] == 1
+    assert bom.build(lines, StructureProfile(0.01)) is not first
+    versions.bump('sde')
+    assert bom.build(lines) is not first
+    assert bom.stats['build_misses'] == 3
@@ -0,0 +1,205 @@
+from sqlalchemy import text
+
+
+def _sde_off_default_engine(monkeypatch, sqlite_engine):
+    from backend.app.engines import valuation
+    from backend.app.sde import TypeDictionary
+
+    # separate engine: with StaticPool, SDE lookups would roll back the sync's transaction
+    monkeypatch.setattr(valuation, 'sde_types', TypeDictionary(bind=sqlite_engine()))
+
+
+def test_bulk_upsert_sqlite_batches_and_replaces(sqlite_engine):
+    from backend.app.bulk import bulk_upsert
+
+    eng = sqlite_engine()
+    with eng.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY AUTOINCREMENT, k bigint UNIQUE, v integer)"))
+        rows = [{'k': i, 'v': i * 2} for i in range(25)]
+        stats = bulk_upsert(conn, 't', ['k', 'v'], rows, key='k', batch_size=10)
+        assert stats['rows'] == 25
+        assert stats['batches'] == 3
+        assert stats['method'] == 'sqlite'
+
+        bulk_upsert(conn, 't', ['k', 'v'], [{'k': 3, 'v': 99}], key='k')
+        assert conn.execute(text("SELECT count(*) FROM t")).scalar() == 25
+        assert conn.execute(text("SELECT v FROM t WHERE k = 3")).scalar() == 99
+
+
+def test_bulk_upsert_values_sends_one_statement_per_batch(sqlite_engine):
+    from sqlalchemy import event
+    from backend.app.bulk import bulk_upsert
+
+    eng = sqlite_engine()
+    with eng.begin() as conn:
+        conn.execute(text("CREATE TABLE t (a bigint, b bigint, v integer, PRIMARY KEY (a, b))"))
+        statements = []
+        event.listen(eng, 'before_cursor_execute', lambda *args: statements.append(args[5]))
+        # the repeated (1, 1) row would hit the same key twice in one statement; the last one wins
+        rows = [{'a': i // 5, 'b': i % 5, 'v': i} for i in range(25)] + [{'a': 0, 'b': 1, 'v': -1}]
+        stats = bulk_upsert(conn, 't', ['a', 'b', 'v'], rows, key='a, b', update_columns=['v'],
+                            batch_size=10, method='values')
+        assert stats['method'] == 'values' and stats['batches'] == 3
+        assert len(statements) == 3 and not any(statements)
+        assert conn.execute(text("SELECT count(*) FROM t")).scalar() == 25
+        assert conn.execute(text("SELECT v FROM t WHERE a = 0 AND b = 1")).scalar() == -1
+
+        bulk_upsert(conn, 't', ['a', 'b', 'v'], [{'a': 4, 'b': 4, 'v': 99}], key='a, b', update_columns=['v'],
+                    method='values')
+        assert conn.execute(text("SELECT v FROM t WHERE a = 4 AND b = 4")).scalar() == 99
+
+
+def test_bulk_upsert_empty(sqlite_engine):
+    from backend.app.bulk import bulk_upsert
+
+    eng = sqlite_engine()
+    with eng.begin() as conn:
+        conn.execute(text("CREATE TABLE t (k bigint UNIQUE, v integer)"))
+        stats = bulk_upsert(conn, 't', ['k', 'v'], [], key='k')
+    assert stats['rows'] == 0
+    assert stats['batches'] == 0
+
+
+
+def test_copy_path_keeps_the_last_row_per_key_and_applies_casts():
+    from types import SimpleNamespace
+    from backend.app.bulk import bulk_upsert
+
+    class Cursor:
+        def __init__(self, copied):
+            self.copied = copied
+
+        def copy_expert(self, sql, buf):
+            self.copied.append(buf.getvalue())
+
+        def close(self):
+            pass
+
+    class Conn:
+        """The slice of a Postgres Connection the COPY path uses."""
+
+        def __init__(self):
+            self.statements, self.copied = [], []
+            self.connection = self
+            self.dialect = SimpleNamespace(name='postgresql')
+
+        def execute(self, statement, params=None):
+            self.statements.append(str(statement))
+
+        def cursor(self):
+            return Cursor(self.copied)
+
+    conn = Conn()
+    rows = [{'k': 1, 'v': 'a'}, {'k': 2, 'v': 'b'}, {'k': 1, 'v': 'c'}]
+    stats = bulk_upsert(conn, 't', ['k', 'v'], rows, key='k', method='copy', casts={'v': 'jsonb'})
+
+    assert stats['batches'] == 1
+    assert conn.copied == ['1\tc\n2\tb\n']
+    merge = conn.statements[-1]
+    assert 'DISTINCT' not in merge and 'SELECT k, CAST(v AS jsonb) FROM _stage_t' in merge
+
+def test_copy_value_escaping():
+    from backend.app.bulk import _copy_value
+
+    assert _copy_value(None) == '\\N'
+    assert _copy_value('a\tb\nc\\d') == 'a\\tb\\nc\\\\d'
+    assert _copy_value(12) == '12'
+
+
+def test_task_sync_assets_reports_throughput(monkeypatch, sqlite_engine):
+    from backend.app import tasks
+    from backend.app.services.cache import CachedResponse
+
+    eng = sqlite_engine()
+    items = [{'item_id': i, 'type_id': 34, 'location_id': 60003760, 'quantity': i} for i in range(1, 51)]
+
+    async def pages(token_id, concurrency=None):
+        yield 1, CachedResponse(items[:25], {'ETag': '"p1"'}, 'miss')
+        yield 2, CachedResponse(items[25:], {'ETag': '"p2"'}, 'miss')
+
+    monkeypatch.setattr(tasks, 'engine', eng)
+    monkeypatch.setattr(tasks, 'iter_assets_pages', pages)
+    monkeypatch.setattr(tasks, '_market_prices', lambda: None)
+    _sde_off_default_engine(monkeypatch, sqlite_engine)
+
+    result = tasks.task_sync_assets(7, batch_size=20)
+
+    assert result['inserted'] == 50
+    assert result['pages'] == 2
+    assert result['unchanged_pages'] == 0
+    assert result['write']['flushes'] == 2
+    assert 'rows_per_sec' in result['write']
+    assert result['valuation']['locations'] == 1
+    assert result['tree'] == {'character_id': 7, 'items': 50, 'roots': 1, 'max_depth': 1}
+    with eng.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM esi_assets WHERE character_id = 7")).scalar() == 50
+
+    # same ETags as the committed pages: nothing is rewritten
+    again = tasks.task_sync_assets(7, batch_size=20)
+    assert again['inserted'] == 0
+    assert again['unchanged_pages'] == 2
+
+
+def test_task_sync_assets_rewrites_cached_pages_after_a_failed_sync(monkeypatch, sqlite_engine):
+    from backend.app import tasks
+    from backend.app.services.cache import CachedResponse
+
+    eng = sqlite_engine()
+    items = [{'item_id': i, 'type_id': 34, 'location_id': 60003760, 'quantity': 1} for i in range(1, 204)]
+
+    async def failing(token_id, concurrency=None):
+        yield 1, CachedResponse(items[:200], {'ETag': '"p1"'}, 'miss')
+        raise RuntimeError('page 2 failed')
+
+    async def retry(token_id, concurrency=None):
+        # page 1 now comes from the response cache, as it would after the failure
+        yield 1, CachedResponse(items[:200], {'ETag': '"p1"'}, 'hit')
+        yield 2, CachedResponse(items[200:], {'ETag': '"p2"'}, 'miss')
+
+    monkeypatch.setattr(tasks, 'engine', eng)
+    monkeypatch.setattr(tasks, '_market_prices', lambda: None)
+    _sde_off_default_engine(monkeypatch, sqlite_engine)
+    monkeypatch.setattr(tasks, 'iter_assets_pages', failing)
+    try:
+        tasks.task_sync_assets(7)
+    except RuntimeError:
+        pass
+    with eng.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM esi_assets")).scalar() == 0
+
+    monkeypatch.setattr(tasks, 'iter_assets_pages', retry)
+    result = tasks.task_sync_assets(7)
+    assert result['inserted'] == 203
+    assert result['unchanged_pages'] == 0
+    with eng.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM esi_assets WHERE character_id = 7")).scalar() == 203
+
+
+def test_task_sync_assets_flushes_off_the_event_loop(monkeypatch, sqlite_engine):
+    import threading
+    from sqlalchemy import event
+    from backend.app import tasks
+    from backend.app.services.cache import CachedResponse
+
+    eng = sqlite_engine()
+    items = [{'item_id': i, 'type_id': 34, 'location_id': 60003760, 'quantity': 1} for i in range(1, 41)]
+    loop_threads, write_threads = set(), set()
+
+    async def pages(token_id, concurrency=None):
+        loop_threads.add(threading.get_ident())
+        yield 1, CachedResponse(items[:20], {'ETag': '"p1"'}, 'miss')
+        yield 2, CachedResponse(items[20:], {'ETag': '"p2"'}, 'miss')
+
+    def on_execute(conn, cursor, statement, *args):
+        if 'INTO esi_assets ' in statement:
+            write_threads.add(threading.get_ident())
+
+    event.listen(eng, 'before_cursor_execute', on_execute)
+    monkeypatch.setattr(tasks, 'engine', eng)
+    monkeypatch.setattr(tasks, 'iter_assets_pages', pages)
+    monkeypatch.setattr(tasks, '_market_prices', lambda: None)
+    _sde_off_default_engine(monkeypatch, sqlite_engine)
+
+    result = tasks.task_sync_assets(7, batch_size=20)
+    assert result['inserted'] == 40
+    assert write_threads and not write_threads & loop_threads
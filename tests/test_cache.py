@@ -0,0 +1,105 @@
+import time
+from email.utils import formatdate
+
+import httpx
+
+
+def _client(handler):
+    return httpx.Client(transport=httpx.MockTransport(handler))
+
+
+def test_fresh_entry_served_without_request():
+    from backend.app.services.cache import ResponseCache
+
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json=[1, 2], headers={'ETag': '"a"', 'Expires': formatdate(time.time() + 60, usegmt=True)})
+
+    cache = ResponseCache()
+    with _client(handler) as client:
+        first = cache.get(client, 'https://esi.test/x/', params={'page': 1})
+        second = cache.get(client, 'https://esi.test/x/', params={'page': 1})
+
+    assert first.status == 'miss'
+    assert second.status == 'hit'
+    assert second.unchanged
+    assert second.data == [1, 2]
+    assert len(calls) == 1
+    assert cache.stats == {'hits': 1, 'misses': 1, 'not_modified': 0}
+
+
+def test_expired_entry_revalidates_with_etag():
+    from backend.app.services.cache import ResponseCache
+
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get('If-None-Match'))
+        if request.headers.get('If-None-Match') == '"v1"':
+            return httpx.Response(304, headers={'ETag': '"v1"'})
+        return httpx.Response(200, json={'v': 1}, headers={'ETag': '"v1"', 'Expires': formatdate(time.time() - 1, usegmt=True), 'X-Pages': '3'})
+
+    cache = ResponseCache()
+    with _client(handler) as client:
+        cache.get(client, 'https://esi.test/y/')
+        again = cache.get(client, 'https://esi.test/y/')
+
+    assert seen == [None, '"v1"']
+    assert again.status == 'not_modified'
+    assert again.data == {'v': 1}
+    assert again.headers['X-Pages'] == '3'
+    assert cache.stats['not_modified'] == 1
+
+
+def test_lru_backend_evicts_oldest():
+    from backend.app.services.cache import LRUBackend
+
+    lru = LRUBackend(maxsize=2)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.get('a')
+    lru.set('c', 3)
+    assert lru.get('b') is None
+    assert lru.get('a') == 1
+
+
+
+def test_async_get_reaches_a_shared_backend_off_the_event_loop():
+    import asyncio
+    import threading
+    from backend.app.services.cache import ResponseCache
+
+    class SharedBackend:
+        """Stands in for RedisBackend: any backend but the in-process LRU is called from a thread."""
+
+        def __init__(self):
+            self.data = {}
+            self.threads = set()
+
+        def get(self, key):
+            self.threads.add(threading.get_ident())
+            return self.data.get(key)
+
+        def set(self, key, entry, ttl=None):
+            self.threads.add(threading.get_ident())
+            self.data[key] = entry
+
+    def handler(request):
+        if request.headers.get('If-None-Match') == '"v1"':
+            return httpx.Response(304, headers={'ETag': '"v1"'})
+        return httpx.Response(200, json=[1], headers={'ETag': '"v1"', 'Expires': formatdate(time.time() - 1, usegmt=True)})
+
+    backend = SharedBackend()
+    cache = ResponseCache(backend)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            await cache.get_async(client, 'https://esi.test/z/')
+            again = await cache.get_async(client, 'https://esi.test/z/')
+        return threading.get_ident(), again
+
+    loop_thread, again = asyncio.run(run())
+    assert again.status == 'not_modified' and again.data == [1]
+    assert backend.threads and loop_thread not in backend.threads
@@ -0,0 +1,90 @@
+import json
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+
+def _client(monkeypatch, sqlite_engine):
+    from backend.app.main import app
+    from backend.app.routes import data
+    from backend.app.sde import TypeDictionary
+    from backend.app.services.api_cache import ApiCache
+    from backend.app import tasks
+
+    eng = sqlite_engine()
+    with eng.begin() as conn:
+        tasks._ensure_assets_table(conn, 'sqlite')
+        conn.execute(text("INSERT INTO esi_assets (character_id, item_id, type_id, location_id, quantity) VALUES (1, :i, 34, 60003760, :i)"),
+                     [{'i': i} for i in range(1, 26)])
+        conn.execute(text("INSERT INTO esi_assets (character_id, item_id, type_id, location_id, quantity) VALUES (2, 1000, 34, 60003760, 1)"))
+    monkeypatch.setattr(data, 'SessionLocal', sessionmaker(bind=eng))
+    monkeypatch.setattr(data, 'engine', eng)
+    monkeypatch.setattr(data, 'sde_types', TypeDictionary(bind=eng))
+    monkeypatch.setattr(data, 'api_cache', ApiCache())
+    return TestClient(app), eng
+
+
+def test_assets_keyset_pages_cover_every_row(monkeypatch, sqlite_engine):
+    client, _ = _client(monkeypatch, sqlite_engine)
+
+    seen, cursor = [], None
+    while True:
+        params = {'limit': 10}
+        if cursor:
+            params['cursor'] = cursor
+        body = client.get('/data/assets/1', params=params).json()
+        seen.extend(a['item_id'] for a in body['assets'])
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+
+    assert seen == list(range(1, 26))
+
+
+def test_assets_last_page_has_no_cursor(monkeypatch, sqlite_engine):
+    client, _ = _client(monkeypatch, sqlite_engine)
+    body = client.get('/data/assets/1', params={'limit': 25}).json()
+    assert len(body['assets']) == 25
+    assert body['next_cursor'] is None
+
+
+def test_assets_invalid_cursor(monkeypatch, sqlite_engine):
+    client, _ = _client(monkeypatch, sqlite_engine)
+    assert client.get('/data/assets/1', params={'cursor': '!!!'}).status_code == 400
+
+
+def test_assets_table_has_covering_index(monkeypatch, sqlite_engine):
+    _, eng = _client(monkeypatch, sqlite_engine)
+    with eng.connect() as conn:
+        plan = conn.execute(text("EXPLAIN QUERY PLAN SELECT item_id, type_id, location_id, quantity, synced_at FROM esi_assets WHERE character_id = 1 AND item_id > 5 ORDER BY item_id LIMIT 10")).fetchall()
+    assert 'COVERING INDEX ix_esi_assets_char_item' in ' '.join(str(r[-1]) for r in plan)
+
+
+def test_export_assets_ndjson_streams_every_row(monkeypatch, sqlite_engine):
+    from backend.app.routes import data
+
+    monkeypatch.setattr(data, 'EXPORT_CHUNK', 7)
+    client, _ = _client(monkeypatch, sqlite_engine)
+    r = client.get('/data/export/assets/1', headers={'Accept-Encoding': 'identity'})
+
+    assert r.status_code == 200
+    assert r.headers['content-type'].startswith('application/x-ndjson')
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [row['item_id'] for row in rows] == list(range(1, 26))
+    assert set(rows[0]) == {'item_id', 'type_id', 'location_id', 'quantity', 'synced_at', 'type_name'}
+
+
+def test_export_assets_csv_gzip(monkeypatch, sqlite_engine):
+    client, _ = _client(monkeypatch, sqlite_engine)
+    r = client.get('/data/export/assets/1', params={'format': 'csv'}, headers={'Accept-Encoding': 'gzip'})
+
+    assert r.headers['content-encoding'] == 'gzip'
+    lines = r.text.strip().splitlines()
+    assert lines[0] == 'item_id,type_id,location_id,quantity,synced_at,type_name'
+    assert len(lines) == 26
+
+
+def test_export_unknown_kind(monkeypatch, sqlite_engine):
+    client, _ = _client(monkeypatch, sqlite_engine)
+    assert client.get('/data/export/ships/1').status_code == 404
@@ -0,0 +1,76 @@
+import asyncio
+
+import httpx
+
+
+def _paged_transport(pages, fail_once=()):
+    calls = []
+    failed = set()
+
+    def handler(request):
+        page = int(request.url.params.get('page', 1))
+        calls.append(page)
+        if page in fail_once and page not in failed:
+            failed.add(page)
+            return httpx.Response(502)
+        return httpx.Response(200, json=[{'item_id': page}], headers={'X-Pages': str(pages)})
+
+    return httpx.MockTransport(handler), calls
+
+
+def test_iter_pages_async_fetches_every_page_once():
+    from backend.app.services import esi
+
+    transport, calls = _paged_transport(12)
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return [p async for p in esi.iter_pages_async(client, 'https://esi.test/assets/', concurrency=4)]
+
+    pages = asyncio.run(run())
+    assert pages[0][0] == 1
+    assert pages[0][1].data == [{'item_id': 1}]
+    assert sorted(p for p, _ in pages) == list(range(1, 13))
+    assert sorted(calls) == list(range(1, 13))
+
+
+def test_iter_pages_async_retries_per_page(monkeypatch):
+    from backend.app.services import esi
+
+    monkeypatch.setattr(esi, 'RETRY_BACKOFF', 0)
+    transport, calls = _paged_transport(3, fail_once={2})
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return dict([p async for p in esi.iter_pages_async(client, 'https://esi.test/assets/')])
+
+    pages = asyncio.run(run())
+    assert pages[2].data == [{'item_id': 2}]
+    assert calls.count(2) == 2
+    assert calls.count(3) == 1
+
+
+def test_token_loads_run_off_the_event_loop(monkeypatch):
+    import threading
+    from backend.app.services import esi
+
+    threads = []
+
+    def load_token(token_id):
+        threads.append(threading.get_ident())
+        return 'access', 90000001
+
+    async def fake_get(client, url, params=None, headers=None):
+        return url
+
+    monkeypatch.setattr(esi, '_load_token', load_token)
+    monkeypatch.setattr(esi.response_cache, 'get_async', fake_get)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        url = await esi.fetch_industry_jobs_response_async(7)
+        return loop_thread, url
+
+    loop_thread, url = asyncio.run(run())
+    assert url.endswith('/characters/90000001/industry/jobs/')
+    assert threads and threads[0] != loop_thread
@@ -13,7 +13,11 @@ def test_root():
     assert r.status_code == 200
     assert 'I-EVE-TITS' in r.json().get('message', '')
 
-def test_dashboard_overview():
+def test_dashboard_overview(monkeypatch, sqlite_engine):
+    from backend.app.routes import dashboard
+
+    # never open the default DATABASE_URL (a test.db file) from tests
+    monkeypatch.setattr(dashboard, 'engine', sqlite_engine())
     r = client.get('/dashboard/overview')
     assert r.status_code == 200
     data = r.json()
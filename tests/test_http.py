@@ -0,0 +1,45 @@
+import asyncio
+import threading
+
+import httpx
+
+from backend.app.services import http
+
+
+def test_run_sync_shares_one_client(monkeypatch):
+    seen = []
+
+    def handler(request):
+        seen.append(request.url.path)
+        return httpx.Response(200, json={'ok': True})
+
+    http.set_transport(httpx.MockTransport(handler))
+    try:
+        async def fetch(path):
+            return id(http.get_client()), (await http.get_client().get(f'https://esi.test{path}')).json()
+
+        first = http.run_sync(fetch('/a'))
+        second = http.run_sync(fetch('/b'))
+        assert first[1] == {'ok': True}
+        assert first[0] == second[0]
+        assert seen == ['/a', '/b']
+    finally:
+        http.set_transport(None)
+
+
+def test_run_sync_from_threads():
+    async def square(x):
+        await asyncio.sleep(0)
+        return x * x
+
+    results = {}
+
+    def work(x):
+        results[x] = http.run_sync(square(x))
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == {i: i * i for i in range(8)}
@@ -0,0 +1,46 @@
+import json
+
+from sqlalchemy import create_engine, text
+
+
+def _write(path, rows):
+    path.write_text('\n'.join(json.dumps(r) for r in rows) + '\n', encoding='utf-8')
+
+
+def test_import_all_skips_unchanged_files(tmp_path, monkeypatch):
+    from backend.app.scripts import import_sde
+
+    eng = create_engine(f"sqlite:///{tmp_path / 'sde.db'}")
+    monkeypatch.setattr(import_sde, 'engine', eng)
+    monkeypatch.setattr(import_sde, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(import_sde, 'BATCH_SIZE', 2)
+
+    _write(tmp_path / 'types.jsonl', [
+        {'_key': 'sde', 'buildNumber': 1},
+        {'typeID': 34, 'name': 'Tritanium', 'groupID': 18, 'volume': 0.01, 'basePrice': 2.0},
+        {'typeID': 35, 'name': 'Pyerite', 'groupID': 18, 'volume': 0.01},
+        {'typeID': 36, 'name': 'Mexallon', 'groupID': 18, 'volume': 0.01},
+    ])
+    _write(tmp_path / 'groups.jsonl', [{'groupID': 18, 'name': 'Mineral', 'categoryID': 4}])
+
+    snap = tmp_path / 'sde_snapshot.bin'
+    first = {r['name']: r for r in import_sde.import_all(snapshot_path=str(snap))}
+    assert first['types']['rows'] == 3
+    assert first['norm:types']['rows'] == 3
+    assert first['norm:groups']['rows'] == 1
+
+    assert snap.exists()
+
+    second = import_sde.import_all(snapshot_path=str(snap))
+    assert all(r['skipped'] for r in second)
+
+    _write(tmp_path / 'groups.jsonl', [{'groupID': 18, 'name': 'Minerals', 'categoryID': 4}])
+    third = {r['name']: r for r in import_sde.import_all(snapshot_path=str(snap))}
+    assert third['types']['skipped']
+    assert not third['groups']['skipped']
+    assert not third['norm:groups']['skipped']
+
+    with eng.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM sde_groups")).scalar() == 1
+        assert conn.execute(text("SELECT name FROM sde_groups_norm WHERE group_id = 18")).scalar() == 'Minerals'
+        assert conn.execute(text("SELECT name FROM sde_types_norm WHERE type_id = 35")).scalar() == 'Pyerite'
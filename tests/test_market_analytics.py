@@ -0,0 +1,93 @@
+import json
+import math
+
+import httpx
+import numpy as np
+
+from backend.app.engines import market_analytics as ma
+from backend.app.services import http
+from backend.app.services.cache import LRUBackend, response_cache
+
+
+def _history(prices, end='2024-03-31', volume=100):
+    end = np.datetime64(end)
+    n = len(prices)
+    return [
+        {'date': str(end - (n - 1 - i)), 'average': p, 'highest': p * 1.1, 'lowest': p * 0.9,
+         'volume': volume, 'order_count': 10}
+        for i, p in enumerate(prices)
+    ]
+
+
+def test_rolling_mean_matches_naive_with_gaps():
+    x = np.array([[1.0, np.nan, 3.0, 4.0, np.nan, 6.0], [np.nan] * 6])
+    out = ma.rolling_mean(x, 3)
+    for j in range(6):
+        window = [v for v in x[0, max(0, j - 2):j + 1] if not math.isnan(v)]
+        assert out[0, j] == sum(window) / len(window)
+    assert np.isnan(out[1]).all()
+
+
+def test_matrix_aligns_dates_and_drops_out_of_range():
+    hist = {34: _history([1.0, 2.0, 3.0]), 35: _history([9.0], end='2024-03-29'), 36: []}
+    m = ma.HistoryMatrix.from_histories(hist, end='2024-03-31', days=5)
+    assert m.average.shape == (3, 5)
+    assert m.average[0, -3:].tolist() == [1.0, 2.0, 3.0]
+    assert m.average[1, 2] == 9.0 and np.isnan(m.average[1, 3])
+    assert np.isnan(m.average[2]).all() and m.volume[2].sum() == 0
+
+
+def test_indicators_match_per_type_reference():
+    up = [100 * 1.01 ** i for i in range(40)]
+    down = [100 * 0.98 ** i for i in range(40)]
+    flat = [50.0] * 40
+    hist = {1: _history(up), 2: _history(down), 3: _history(flat), 4: []}
+    hist[3][-1]['volume'] = 300
+    m = ma.HistoryMatrix.from_histories(hist, end='2024-03-31', days=60)
+    ind = ma.compute_indicators(m)
+
+    assert ind['signal'].tolist() == [1, -1, 0, 0]
+    assert abs(ind['trend'][0] - 0.01) < 1e-9
+    assert abs(ind['trend'][1] + 0.02) < 1e-9
+    assert abs(ind['volatility'][0]) < 1e-9
+    assert ind['last_price'][0] == up[-1]
+    assert abs(ind['sma_short'][0] - sum(up[-7:]) / 7) < 1e-9
+    expected_vwap = sum(p * (300 if i == 29 else 100) for i, p in enumerate(flat[-30:])) / (29 * 100 + 300)
+    assert abs(ind['vwap'][2] - expected_vwap) < 1e-9
+    assert np.isnan(ind['last_price'][3]) and np.isnan(ind['vwap'][3])
+
+
+def test_analyze_fetches_once_per_region_type_day():
+    calls = []
+
+    def handler(request):
+        tid = int(request.url.params['type_id'])
+        calls.append(tid)
+        if tid == 99:
+            return httpx.Response(404, json={'error': 'Type not found!'})
+        return httpx.Response(200, content=json.dumps(_history([10.0, 11.0, 12.0], end='2024-03-31')))
+
+    response_cache.backend.clear()
+    http.set_transport(httpx.MockTransport(handler))
+    try:
+        engine = ma.MarketAnalytics(LRUBackend(), days=30)
+        first = engine.analyze(10000002, [34, 35, 99], day='2024-03-31')
+        again = engine.analyze(10000002, [35, 34], day='2024-03-31')
+    finally:
+        http.set_transport(None)
+        response_cache.backend.clear()
+
+    assert sorted(calls) == [34, 35, 99]
+    assert first[34]['last_price'] == 12.0
+    assert first[99]['last_price'] is None
+    assert again == {35: first[35], 34: first[34]}
+    assert engine.stats == {'hits': 2, 'computed': 3}
+
+
+def test_batch_of_thousands_is_vectorized():
+    rng = np.random.default_rng(1)
+    hist = {tid: _history(list(100 + rng.standard_normal(90).cumsum())) for tid in range(3000)}
+    engine = ma.MarketAnalytics(LRUBackend(maxsize=10000), days=90)
+    out = engine.compute(10000002, hist, day='2024-03-31')
+    assert len(out) == 3000
+    assert all(v['sma_long'] is not None for v in out.values())
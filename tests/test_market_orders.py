@@ -0,0 +1,140 @@
+import asyncio
+
+import httpx
+
+from backend.app.services import http
+from backend.app.services import market
+from backend.app.services.cache import response_cache
+
+
+def _order(type_id, location_id, price, volume, buy):
+    return {'type_id': type_id, 'location_id': location_id, 'price': price,
+            'volume_remain': volume, 'is_buy_order': buy}
+
+
+PAGES = {
+    1: [_order(34, 1, 5.0, 100, True), _order(34, 1, 5.5, 50, False), _order(34, 2, 4.8, 10, True)],
+    2: [_order(34, 1, 5.2, 70, False), _order(35, 1, 9.0, 5, False)],
+    3: [_order(34, 2, 6.0, 20, False)],
+}
+
+
+def _serve(pages, calls):
+    def handler(request):
+        page = int(request.url.params['page'])
+        etag = f'"{page}-{hash(str(pages[page]))}"'
+        calls.append((page, request.headers.get('If-None-Match') == etag))
+        if request.headers.get('If-None-Match') == etag:
+            return httpx.Response(304, headers={'ETag': etag})
+        headers = {'ETag': etag, 'X-Pages': str(len(pages)), 'Expires': 'Thu, 01 Jan 2015 00:00:00 GMT'}
+        return httpx.Response(200, json=pages[page], headers=headers)
+    return handler
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_order_index_best_bid_ask_and_depth():
+    calls = []
+    response_cache.backend.clear()
+    http.set_transport(httpx.MockTransport(_serve(PAGES, calls)))
+    try:
+        book = market.RegionOrderBook(10000002)
+        stats = _run(book.refresh())
+    finally:
+        http.set_transport(None)
+
+    assert stats['pages'] == 3 and stats['parsed'] == 3 and stats['orders'] == 6
+    best = book.index.best([34, 35, 36])
+    assert best[34] == {'best_bid': 5.0, 'best_ask': 5.2, 'spread': 5.2 - 5.0, 'bid_volume': 110,
+                        'ask_volume': 140, 'bid_orders': 2, 'ask_orders': 3}
+    assert best[35]['best_bid'] is None and best[35]['spread'] is None and best[35]['ask_volume'] == 5
+    assert best[36] is None
+
+    quotes = book.index.quotes([34, 36])
+    assert set(quotes[34]) == {1, 2} and quotes[36] == {}
+    assert quotes[34][2]['best_bid'] == 4.8 and quotes[34][2]['best_ask'] == 6.0
+    assert set(book.index.quotes([34], location_id=2)[34]) == {2}
+
+
+def test_refresh_reparses_only_changed_pages():
+    calls = []
+    pages = {k: list(v) for k, v in PAGES.items()}
+    response_cache.backend.clear()
+    http.set_transport(httpx.MockTransport(_serve(pages, calls)))
+    try:
+        book = market.RegionOrderBook(10000002)
+        _run(book.refresh())
+        pages[2] = [_order(34, 1, 5.1, 1, False)]
+        stats = _run(book.refresh())
+        # parsed pages live on the book only, not a second time as raw bodies
+        assert response_cache.backend.get(response_cache.key(book.url, {'order_type': 'all', 'page': 1})) is None
+    finally:
+        http.set_transport(None)
+        response_cache.backend.clear()
+
+    # the 304 for page 1 carries no X-Pages; the book's page count is kept
+    assert stats['pages'] == 3
+    assert stats['parsed'] == 1 and stats['unchanged'] == 2
+    assert book.index.best([34])[34]['best_ask'] == 5.1
+    assert book.index.best([35])[35] is None
+    assert sorted(c for c in calls[3:] if c[1]) == [(1, True), (3, True)]
+
+
+def test_failed_refresh_leaves_the_book_unchanged(monkeypatch):
+    import pytest
+    from backend.app.services import esi
+
+    monkeypatch.setattr(esi, 'RETRY_BACKOFF', 0.0)
+
+    calls = []
+    pages = {k: list(v) for k, v in PAGES.items()}
+    serve = _serve(pages, calls)
+
+    def handler(request):
+        if failing and request.url.params['page'] == '3':
+            return httpx.Response(500)
+        return serve(request)
+
+    failing = False
+    http.set_transport(httpx.MockTransport(handler))
+    try:
+        book = market.RegionOrderBook(10000002)
+        _run(book.refresh())
+        before = (dict(book.pages), dict(book.etags), book.index, book.expires_at)
+        book.expires_at = 0.0
+        pages[2] = [_order(34, 1, 5.1, 1, False)]
+        failing = True
+        with pytest.raises(httpx.HTTPStatusError):
+            _run(book.refresh())
+        # nothing from the half-finished refresh is kept, not even the fresh expiry
+        assert (book.pages, book.etags, book.index) == before[:3] and book.expires_at == 0.0
+
+        failing = False
+        stats = _run(book.refresh())
+    finally:
+        http.set_transport(None)
+
+    # the retry still sees page 2 as changed and rebuilds the index
+    assert stats['parsed'] == 1 and stats['unchanged'] == 2
+    assert book.index.best([34])[34]['best_ask'] == 5.1
+
+
+def test_order_books_refresh_only_when_expired(monkeypatch):
+    books = market.OrderBooks()
+    refreshed = []
+
+    async def fake_refresh(self, concurrency=None):
+        refreshed.append(self.region_id)
+        self.expires_at = 10**12
+
+    monkeypatch.setattr(market.RegionOrderBook, 'refresh', fake_refresh)
+
+    async def go():
+        await books.get_async(1)
+        await books.get_async(1)
+        await books.get_async(2)
+
+    _run(go())
+    assert refreshed == [1, 2]
@@ -0,0 +1,128 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+
+class FakeShared:
+    """In-memory stand-in for the Redis hash jobs push into."""
+
+    def __init__(self):
+        self.values = {}
+
+    def add(self, samples):
+        for name, suffix, names, key, value in samples:
+            k = (suffix, tuple(names), tuple(key))
+            self.values.setdefault(name, {})[k] = self.values.get(name, {}).get(k, 0.0) + value
+
+    def read(self):
+        return {name: dict(v) for name, v in self.values.items()}
+
+
+def test_histogram_renders_cumulative_buckets_in_order():
+    from backend.app.metrics import Registry
+
+    reg = Registry()
+    h = reg.histogram('op_seconds', 'Op latency.', ('op',), buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 0.5, 3.0):
+        h.observe(v, ('a',))
+    out = reg.render()
+
+    assert '# TYPE op_seconds histogram' in out
+    lines = [l for l in out.splitlines() if l.startswith('op_seconds')]
+    assert lines == [
+        'op_seconds_bucket{op="a",le="0.1"} 1',
+        'op_seconds_bucket{op="a",le="1"} 3',
+        'op_seconds_bucket{op="a",le="+Inf"} 4',
+        'op_seconds_sum{op="a"} 4.05',
+        'op_seconds_count{op="a"} 4',
+    ]
+
+
+def test_push_moves_samples_to_shared_store():
+    from backend.app.metrics import Registry
+
+    worker = Registry(FakeShared())
+    c = worker.counter('rows_total', 'Rows.', ('task',))
+    c.inc(10, ('sync',))
+    worker.push()
+    c.inc(5, ('sync',))
+    worker.push()
+    # drained locally, summed in the shared store
+    assert c.samples() == []
+
+    api = Registry(worker.shared)
+    api_c = api.counter('rows_total', 'Rows.', ('task',))
+    api_c.inc(1, ('sync',))
+    assert 'rows_total{task="sync"} 16' in api.render()
+
+
+def test_timed_job_records_outcome_and_rows():
+    from backend.app import metrics
+
+    @metrics.timed_job
+    def task_fake(n):
+        if n < 0:
+            raise ValueError('bad')
+        return {'inserted': n}
+
+    before = {k: v for _, _, k, v in metrics.job_rows.samples()}
+    assert task_fake(7) == {'inserted': 7}
+    try:
+        task_fake(-1)
+    except ValueError:
+        pass
+    rows = {k: v for _, _, k, v in metrics.job_rows.samples()}
+    outcomes = {k: v for _, _, k, v in metrics.jobs.samples()}
+    assert rows[('task_fake',)] - before.get(('task_fake',), 0) == 7
+    assert outcomes[('task_fake', 'finished')] >= 1 and outcomes[('task_fake', 'failed')] >= 1
+    assert task_fake.__name__ == 'task_fake'
+
+
+def test_engine_events_time_queries_by_verb():
+    from backend.app.metrics import instrument_engine, db_query_seconds
+
+    def count(verb):
+        return sum(v for suffix, _, k, v in db_query_seconds.samples() if suffix == '_count' and k == (verb,))
+
+    eng = instrument_engine(create_engine('sqlite://'))
+    before = count('SELECT')
+    with eng.connect() as conn:
+        conn.execute(text('SELECT 1'))
+        conn.execute(text('select 2'))
+    assert count('SELECT') == before + 2
+
+    # a failing statement is timed and leaves no state on the pooled connection
+    with eng.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text('SELECT * FROM missing_table'))
+        assert 'query_start' not in conn.info
+        conn.rollback()
+        conn.execute(text('SELECT 3'))
+    assert count('SELECT') == before + 4
+
+
+def test_esi_endpoint_folds_ids():
+    from backend.app.metrics import esi_endpoint, sql_verb
+
+    assert esi_endpoint('https://esi.evetech.net/latest/characters/90000001/assets/?page=2') == \
+        '/latest/characters/{id}/assets/'
+    assert sql_verb('  insert into x values (1)') == 'INSERT'
+    assert sql_verb('PRAGMA foo') == 'OTHER'
+
+
+def test_metrics_endpoint_labels_routes_by_template():
+    from backend.app.main import app
+
+    client = TestClient(app)
+    client.get('/health')
+    client.get('/nowhere')
+    r = client.get('/metrics')
+
+    assert r.status_code == 200
+    assert r.headers['content-type'].startswith('text/plain; version=0.0.4')
+    body = r.text
+    assert 'http_responses_total{method="GET",route="/health",status="200"}' in body
+    assert 'route="<unmatched>",status="404"' in body
+    assert '# TYPE esi_limiter gauge' in body
+    assert 'esi_limiter{stat="requests"}' in body
@@ -0,0 +1,42 @@
+import numpy as np
+from fastapi.testclient import TestClient
+
+from backend.app.engines.mining import compute_mining_yield, compute_mining_yield_batch
+
+
+def test_batch_matches_scalar_for_every_combination():
+    skills, ships, boosts = [0, 3, 5], [100.0, 250.0], [0.0, 0.1, 0.25, 0.4]
+    batch = compute_mining_yield_batch(skills, ships, boosts)
+    assert batch.shape == (3, 2, 4) and len(batch) == 24
+    for i, s in enumerate(skills):
+        for j, b in enumerate(ships):
+            for k, f in enumerate(boosts):
+                expected = compute_mining_yield({'mining': s}, {'base_yield': b}, {'fleet_bonus': f})
+                assert batch.yield_per_hour[i, j, k] == expected['yield_per_hour']
+
+
+def test_zipped_rows_and_ore_axis():
+    batch = compute_mining_yield_batch([5, 4], [100.0, 200.0], [0.1], ore_volumes=[0.1, 16.0, 0.0], cross=False)
+    assert batch.shape == (2, 3) and batch.axes == ('pilot', 'ore')
+    assert np.allclose(batch.units_per_hour[:, 0], batch.yield_per_hour[:, 0] / 0.1)
+    assert np.isnan(batch.units_per_hour[:, 2]).all()
+    cols = batch.columns()
+    assert len(cols['yield_per_hour']) == 6 and cols['units_per_hour'][2] == 0.0
+    assert batch.summary()['best_index']['pilot'] == 1
+
+
+def test_mining_batch_endpoint():
+    from backend.app.main import app
+
+    client = TestClient(app)
+    r = client.post('/dashboard/mining/batch', json={'mining_skills': [0, 5], 'base_yields': [100],
+                                                      'fleet_bonuses': [0, 0.1]})
+    assert r.status_code == 200
+    body = r.json()
+    assert body['shape'] == [2, 1, 2] and body['axes'] == ['skill', 'ship', 'boost']
+    assert body['summary']['max'] == 100 * 1.1 * 1.1
+    assert len(body['columns']['yield_per_hour']) == 4
+
+    bad = client.post('/dashboard/mining/batch', json={'mining_skills': [1, 2], 'base_yields': [1, 2, 3],
+                                                       'fleet_bonuses': [0], 'cross': False})
+    assert bad.status_code == 400
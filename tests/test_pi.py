@@ -0,0 +1,118 @@
+import json
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from backend.app.engines import pi
+
+# P0 1,2 -> P1 11 (schematic 101), 12 (102) -> P2 21 (201)
+SCHEMATICS = [
+    {'_key': 101, 'cycleTime': 1800, 'name': {'en': 'X'}, 'types': {'1': {'isInput': True, 'quantity': 3000}, '11': {'isInput': False, 'quantity': 20}}},
+    {'_key': 102, 'cycleTime': 1800, 'types': [{'_key': 2, 'isInput': True, 'quantity': 3000}, {'_key': 12, 'isInput': False, 'quantity': 20}]},
+    {'_key': 201, 'cycleTime': 3600, 'types': {'11': {'isInput': True, 'quantity': 40}, '12': {'isInput': True, 'quantity': 40}, '21': {'isInput': False, 'quantity': 5}}},
+]
+
+
+def _graph():
+    return pi.SchematicGraph([pi.Schematic.from_sde(s) for s in SCHEMATICS])
+
+
+def _colony():
+    return [
+        {'planet_id': 1, 'extractors': [{'type_id': 1, 'units_per_hour': 12000}], 'factories': [{'schematic_id': 101, 'count': 2}]},
+        {'planet_id': 2, 'extractors': [{'type_id': 2, 'units_per_hour': 6000}], 'factories': [{'schematic_id': 102, 'count': 2}]},
+        {'planet_id': 3, 'factories': [{'schematic_id': 201, 'count': 2}]},
+    ]
+
+
+def test_graph_tiers_and_requirements():
+    g = _graph()
+    assert g.tier(1) == 0 and g.tier(11) == 1 and g.tier(21) == 2
+    assert [s.schematic_id for s in g.order] == [101, 102, 201]
+    assert g.requirements(21) == {1: 40 * 3000 / 20 / 5, 2: 40 * 3000 / 20 / 5}
+
+
+def test_planet_throughput_and_bottleneck():
+    g = _graph()
+    r = pi.evaluate_planet(g, {'extractors': [{'type_id': 1, 'qty_per_cycle': 1500, 'cycle_time': 900}],
+                               'factories': [{'schematic_id': 101, 'count': 2}]})
+    # 6000/h of P0 against 2 factories wanting 12000/h
+    assert r['factories'][0]['utilization'] == 0.5
+    assert r['factories'][0]['bottleneck'] == 1
+    assert r['produced'] == {11: 40.0}
+    assert r['surplus'] == {11: 40.0}
+
+
+def test_colony_chains_planets_and_finds_bottleneck():
+    out = pi.evaluate_colony(_graph(), _colony(), pi.PIMemo())
+    p1, p2, p3 = out['planets']
+    assert p1['surplus'] == {11: 80.0}
+    assert p2['surplus'] == {12: 40.0} and p2['bottlenecks'] == [2]
+    # the P2 planet is starved of 12 (40/h available, 80/h wanted)
+    assert p3['imported'] == {11: 40.0, 12: 40.0}
+    assert p3['factories'][0]['bottleneck'] == 12
+    assert out['final_products'] == {21: 5.0}
+    assert out['exports_per_hour'] == {11: 40.0, 21: 5.0}
+
+
+def test_memo_recomputes_only_affected_planets():
+    g, memo = _graph(), pi.PIMemo()
+    colony = _colony() + [{'planet_id': 4, 'extractors': [{'type_id': 1, 'units_per_hour': 100}]}]
+    pi.evaluate_colony(g, colony, memo)
+    assert memo.stats == {'hits': 0, 'misses': 4}
+
+    pi.evaluate_colony(g, colony, memo)
+    assert memo.stats == {'hits': 4, 'misses': 4}
+
+    # more P0 on planet 2 changes planet 2 and the P2 planet that imports from it
+    variant = {1: dict(colony[1], extractors=[{'type_id': 2, 'units_per_hour': 12000}])}
+    fixed = pi.sweep(g, colony, [variant], memo)[0]
+    assert memo.stats == {'hits': 6, 'misses': 6}
+    assert fixed['final_products'] == {21: 10.0} and fixed['bottlenecks'] == []
+
+
+def test_legacy_summary_and_endpoint(monkeypatch, sqlite_engine):
+    from backend.app.main import app
+
+    assert pi.compute_pi_output([{'base_output': 10}], {}) == {'output_per_day': 10, 'planet_count': 1}
+
+    eng = sqlite_engine()
+    with eng.begin() as conn:
+        conn.execute(text('CREATE TABLE "sde_planetSchematics" (id INTEGER PRIMARY KEY, data TEXT)'))
+        conn.execute(text('INSERT INTO "sde_planetSchematics" (data) VALUES (:d)'), [{'d': json.dumps(s)} for s in SCHEMATICS])
+    loader = pi._GraphLoader()
+    monkeypatch.setattr(loader, 'get', lambda: pi.load_schematic_graph(eng))
+    monkeypatch.setattr('backend.app.routes.dashboard.schematic_graph', loader)
+
+    colony = _colony()
+    extractors = {1: colony[0].pop('extractors')}
+    r = TestClient(app).post('/dashboard/pi', json={'planets': colony, 'extractors': extractors,
+                                                    'variants': [{'2': {'planet_id': 3}}]})
+    assert r.status_code == 200
+    body = r.json()
+    assert body['output_per_day'] == 24 * 5.0
+    assert body['colony']['final_products'] == {'21': 5.0}
+    assert body['variants'][0]['final_products'] == {'11': 80.0, '12': 40.0}
+
+
+def test_graph_loader_reloads_after_sde_version_bump(monkeypatch, sqlite_engine):
+    from backend.app.sde import SdeVersionWatch
+    from backend.app.services.api_cache import MemoryVersions
+
+    eng = sqlite_engine()
+    with eng.begin() as conn:
+        conn.execute(text('CREATE TABLE "sde_planetSchematics" (id INTEGER PRIMARY KEY, data TEXT)'))
+        conn.execute(text('INSERT INTO "sde_planetSchematics" (data) VALUES (:d)'), [{'d': json.dumps(s)} for s in SCHEMATICS[:2]])
+    versions = MemoryVersions()
+    watch = SdeVersionWatch(versions, interval=0)
+    loader = pi._GraphLoader()
+    watch.register(loader.reset)
+    monkeypatch.setattr(pi, 'engine', eng)
+    monkeypatch.setattr(pi, 'sde_watch', watch)
+
+    assert len(loader.get().schematics) == 2
+    with eng.begin() as conn:
+        conn.execute(text('INSERT INTO "sde_planetSchematics" (data) VALUES (:d)'), {'d': json.dumps(SCHEMATICS[2])})
+    assert len(loader.get().schematics) == 2
+    versions.bump('sde')
+    assert len(loader.get().schematics) == 3
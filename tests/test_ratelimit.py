@@ -0,0 +1,73 @@
+import httpx
+
+
+def test_bucket_reserves_beyond_burst():
+    from backend.app.services.ratelimit import RateLimiter
+
+    lim = RateLimiter(rate=10, burst=2)
+    assert lim._wait_for() == 0
+    assert lim._wait_for() == 0
+    wait = lim._wait_for()
+    assert 0.05 < wait <= 0.1
+
+
+def test_error_budget_pauses_until_reset():
+    from backend.app.services.ratelimit import RateLimiter
+
+    lim = RateLimiter(rate=1000, burst=1000, error_floor=10)
+    lim.observe(httpx.Response(200, headers={'X-ESI-Error-Limit-Remain': '5', 'X-ESI-Error-Limit-Reset': '30'}))
+    wait = lim._wait_for()
+    assert 29 < wait <= 30
+    assert lim.stats['budget_pauses'] == 1
+    assert lim.stats['error_limit_remain'] == 5
+
+    lim.observe(httpx.Response(200, headers={'X-ESI-Error-Limit-Remain': '100', 'X-ESI-Error-Limit-Reset': '30'}))
+    assert lim._wait_for() == 0
+
+
+def test_falls_back_to_local_bucket_when_backend_fails():
+    from backend.app.services.ratelimit import RateLimiter
+
+    class Broken:
+        def reserve(self):
+            raise ConnectionError('redis down')
+
+        def get_budget(self):
+            raise ConnectionError('redis down')
+
+    lim = RateLimiter(backend=Broken(), rate=1000, burst=10)
+    assert lim.acquire() == 0
+    assert lim.stats['backend_errors'] == 2
+    assert lim.stats['requests'] == 1
+
+
+def test_async_calls_reach_a_shared_backend_off_the_event_loop():
+    import asyncio
+    import threading
+    from backend.app.services.ratelimit import RateLimiter
+
+    class Recording:
+        def __init__(self):
+            self.threads = set()
+
+        def reserve(self):
+            self.threads.add(threading.get_ident())
+            return 0.0
+
+        def get_budget(self):
+            return None, 0.0
+
+        def set_budget(self, remain, reset_at):
+            self.threads.add(threading.get_ident())
+
+    backend = Recording()
+    lim = RateLimiter(backend=backend, rate=1000, burst=10)
+
+    async def call():
+        await lim.acquire_async()
+        await lim.observe_async(httpx.Response(200, headers={'X-ESI-Error-Limit-Remain': '90'}))
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(call())
+    assert backend.threads and loop_thread not in backend.threads
+    assert lim.stats['error_limit_remain'] == 90
@@ -0,0 +1,136 @@
+import json
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from backend.app.engines import blueprints
+from backend.app.engines.reaction import ReactionPlanner, ReactionProfile
+
+# moon goo 16633/16634 + fuel 4051 -> intermediate 16654 -> composite 16670 (+ goo 16635)
+BLUEPRINTS = [
+    {'_key': 46166, 'activities': {'reaction': {
+        'materials': [{'typeID': 16633, 'quantity': 100}, {'typeID': 16634, 'quantity': 100}, {'typeID': 4051, 'quantity': 5}],
+        'products': [{'typeID': 16654, 'quantity': 200}], 'time': 10800}}},
+    {'_key': 46204, 'activities': {'reaction': {
+        'materials': [{'typeID': 16654, 'quantity': 100}, {'typeID': 16635, 'quantity': 100}, {'typeID': 4051, 'quantity': 5}],
+        'products': [{'typeID': 16670, 'quantity': 10000}], 'time': 10800}}},
+    {'blueprintTypeID': 1, 'activities': [{'_key': 'manufacturing', 'materials': [{'typeID': 34, 'quantity': 10}],
+                                           'products': [{'typeID': 4051, 'quantity': 40}], 'time': 60}]},
+]
+
+
+def _graph():
+    return blueprints.RecipeGraph(r for b in BLUEPRINTS for r in blueprints.recipes_from_sde(b))
+
+
+def test_graph_levels():
+    g = _graph()
+    # fuel blocks are manufactured, so they sit a level above raw materials
+    assert g.level(16633) == 0 and g.level(4051) == 1 and g.level(16654) == 2 and g.level(16670) == 3
+    assert g.recipe(4051).activity == 'manufacturing'
+    assert g.recipe(4051, ('reaction',)) is None
+
+
+def test_plan_resolves_chain_with_fuel_and_runs():
+    plan = ReactionPlanner(_graph()).plan({16670: 20000})
+    jobs = {j['type_id']: j for j in plan['jobs']}
+    assert [j['type_id'] for j in plan['jobs']] == [16670, 16654]
+    assert jobs[16670]['runs'] == 2
+    # 200 intermediate needed -> one run of 200
+    assert jobs[16654]['runs'] == 1 and jobs[16654]['surplus'] == 0
+    assert plan['inputs'] == {16635: 200, 16633: 100, 16634: 100}
+    assert plan['fuel_blocks'] == {4051: 15}
+    assert plan['intermediates'] == {16654: 200}
+    assert plan['total_runs'] == 3
+
+
+def test_rig_bonus_and_rounding():
+    profile = ReactionProfile.for_structure('tatara', 't2', 'null')
+    assert abs(profile.material_bonus - 0.0264) < 1e-12
+    plan = ReactionPlanner(_graph()).plan({16654: 2000}, profile)
+    job = plan['jobs'][0]
+    assert job['runs'] == 10
+    assert job['materials'] == {16633: 974, 16634: 974, 4051: 49}
+    assert job['time_seconds'] < 10 * 10800 * 0.75
+
+
+def test_batch_shares_cached_sub_plans():
+    planner = ReactionPlanner(_graph())
+    together = planner.plan({16670: 10000, 16654: 200})
+    # the shared intermediate is planned once across both targets
+    assert [j['runs'] for j in together['jobs'] if j['type_id'] == 16654] == [2]
+
+    planner.plan_each({16670: 10000, 16654: 300})
+    first = dict(planner.stats)
+    planner.plan_each({16670: 10000, 16654: 300})
+    assert planner.stats['plan_hits'] == first['plan_hits'] + 2
+    assert planner.stats['job_misses'] == first['job_misses']
+
+
+def test_reaction_plan_endpoint(monkeypatch, sqlite_engine):
+    from backend.app.main import app
+    from backend.app.routes import dashboard
+
+    eng = sqlite_engine()
+    with eng.begin() as conn:
+        conn.execute(text("CREATE TABLE sde_blueprints (id INTEGER PRIMARY KEY, data TEXT)"))
+        conn.execute(text("INSERT INTO sde_blueprints (data) VALUES (:d)"), [{'d': json.dumps(b)} for b in BLUEPRINTS])
+    graph = blueprints.load_recipe_graph(eng)
+    loader = blueprints._GraphLoader()
+    monkeypatch.setattr(loader, 'get', lambda: graph)
+    monkeypatch.setattr(dashboard, 'recipe_graph', loader)
+    monkeypatch.setattr(dashboard, 'reaction_planner', ReactionPlanner(graph))
+
+    client = TestClient(app)
+    r = client.post('/dashboard/reactions/plan', json={'targets': {'16670': 10000}, 'rig': 't1', 'security': 'low'})
+    assert r.status_code == 200
+    assert r.json()['fuel_blocks'] == {'4051': 10}
+    assert client.post('/dashboard/reactions/plan', json={'targets': {'16670': 1}, 'rig': 't9'}).status_code == 400
+
+
+def test_planner_replans_after_sde_version_bump(monkeypatch, sqlite_engine):
+    from backend.app.engines import reaction
+    from backend.app.sde import SdeVersionWatch
+    from backend.app.services.api_cache import MemoryVersions
+
+    eng = sqlite_engine()
+    with eng.begin() as conn:
+        conn.execute(text("CREATE TABLE sde_blueprints (id INTEGER PRIMARY KEY, data TEXT)"))
+        conn.execute(text("INSERT INTO sde_blueprints (id, data) VALUES (:i, :d)"), [{'i': i, 'd': json.dumps(b)} for i, b in enumerate(BLUEPRINTS)])
+    versions = MemoryVersions()
+    watch = SdeVersionWatch(versions, interval=0)
+    loader, planner = blueprints._GraphLoader(), ReactionPlanner()
+    watch.register(loader.reset)
+    watch.register(planner.clear)
+    monkeypatch.setattr(blueprints, 'engine', eng)
+    monkeypatch.setattr(blueprints, 'sde_watch', watch)
+    monkeypatch.setattr(reaction, 'sde_watch', watch)
+    monkeypatch.setattr(reaction, 'recipe_graph', loader)
+
+    assert planner.plan_each({16654: 200})[16654]['total_runs'] == 1
+    # the import halves the intermediate's output per run
+    changed = json.loads(json.dumps(BLUEPRINTS[0]))
+    changed['activities']['reaction']['products'][0]['quantity'] = 100
+    with eng.begin() as conn:
+        conn.execute(text("UPDATE sde_blueprints SET data = :d WHERE id = 0"), {'d': json.dumps(changed)})
+    assert planner.plan_each({16654: 200})[16654]['total_runs'] == 1
+    versions.bump('sde')
+    assert planner.plan_each({16654: 200})[16654]['total_runs'] == 2
+
+
+def test_whole_plans_are_cached_per_targets_profile_and_sde_version(monkeypatch):
+    from backend.app.engines import reaction
+    from backend.app.sde import SdeVersionWatch
+    from backend.app.services.api_cache import MemoryVersions
+
+    versions = MemoryVersions()
+    monkeypatch.setattr(reaction, 'sde_watch', SdeVersionWatch(versions, interval=0))
+    planner = ReactionPlanner(_graph())
+
+    first = planner.plan({16670: 10000, 16654: 200})
+    assert planner.plan({16654: 200, 16670: 10000}) is first
+    assert planner.stats['result_hits'] == 1
+    assert planner.plan({16670: 10000, 16654: 200}, ReactionProfile(0.02)) is not first
+    versions.bump('sde')
+    assert planner.plan({16670: 10000, 16654: 200}) is not first
+    assert planner.stats['result_misses'] == 3
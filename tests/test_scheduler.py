@@ -0,0 +1,276 @@
+import time
+from email.utils import formatdate
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+
+class FakeJob:
+    def __init__(self, queue, func, args, job_id):
+        self.queue = queue
+        self.func = func
+        self.args = args
+        self.id = job_id
+        self.status = 'queued'
+
+    def get_id(self):
+        return self.id
+
+    def get_status(self):
+        return self.status
+
+
+class FakeQueue:
+    """The slice of rq.Queue the scheduler uses."""
+
+    def __init__(self, name):
+        self.name = name
+        self.jobs = {}
+
+    def enqueue(self, func, *args, job_id=None, **kwargs):
+        job_id = job_id or f'{self.name}-{len(self.jobs)}'
+        job = self.jobs[job_id] = FakeJob(self, func, args, job_id)
+        return job
+
+    def fetch_job(self, job_id):
+        return self.jobs.get(job_id)
+
+    def remove(self, job):
+        # like LREM: only a job still waiting in the queue comes off it
+        if job.status != 'queued' or self.jobs.get(job.id) is not job:
+            return 0
+        del self.jobs[job.id]
+        return 1
+
+
+def _scheduler(jitter=0.0):
+    from backend.app.scheduler import SyncScheduler, MemoryDueStore
+
+    queues = {'interactive': FakeQueue('sync-interactive'), 'background': FakeQueue('sync-background')}
+    return SyncScheduler(store=MemoryDueStore(), queues=queues, jitter=jitter), queues
+
+
+def test_next_due_follows_expires_with_floor_and_jitter():
+    from backend.app.scheduler import MIN_INTERVAL
+
+    sched, _ = _scheduler()
+    now = 1_000_000.0
+    assert sched.next_due('assets', now + 1800, now) == now + 1800
+    # no Expires: the kind's default interval
+    assert sched.next_due('industry', None, now) == now + 300
+    # already-expired or too-soon Expires never schedules a tight loop
+    assert sched.next_due('assets', now + 5, now) == now + MIN_INTERVAL
+
+    jittered, _ = _scheduler(jitter=0.1)
+    dues = {jittered.next_due('assets', now + 1800, now) for _ in range(50)}
+    assert all(now + 1800 <= d <= now + 1800 + 360 for d in dues)
+    assert len(dues) > 1
+
+
+def test_enqueue_dedups_active_jobs():
+    sched, queues = _scheduler()
+
+    first = sched.enqueue('assets', 7, priority='interactive')
+    again = sched.enqueue('assets', 7, priority='interactive')
+    assert first == {'status': 'queued', 'job_id': 'sync-assets-7', 'duplicate': False, 'priority': 'interactive'}
+    assert again['duplicate'] and again['job_id'] == 'sync-assets-7'
+    assert len(queues['interactive'].jobs) == 1
+
+    queues['interactive'].jobs['sync-assets-7'].status = 'started'
+    assert sched.enqueue('assets', 7, priority='background')['duplicate']
+
+    queues['interactive'].jobs['sync-assets-7'].status = 'finished'
+    assert not sched.enqueue('assets', 7, priority='background')['duplicate']
+    assert sched.stats['enqueued'] == 2 and sched.stats['duplicates'] == 2
+
+
+def test_interactive_request_promotes_background_job():
+    sched, queues = _scheduler()
+
+    sched.enqueue('industry', 3, priority='background')
+    result = sched.enqueue('industry', 3, priority='interactive')
+
+    assert result['priority'] == 'interactive' and not result['duplicate']
+    assert 'sync-industry-3' not in queues['background'].jobs
+    assert queues['interactive'].jobs['sync-industry-3'].args == (3,)
+    assert sched.stats['promoted'] == 1
+
+
+def test_promotion_yields_to_a_worker_that_took_the_job():
+    sched, queues = _scheduler()
+
+    sched.enqueue('industry', 3, priority='background')
+    taken = queues['background'].jobs['sync-industry-3']
+    remove = queues['background'].remove
+
+    def dequeued_first(job):
+        # a background worker picks the job up between the status check and the removal
+        taken.status = 'started'
+        return remove(job)
+
+    queues['background'].remove = dequeued_first
+    result = sched.enqueue('industry', 3, priority='interactive')
+
+    assert result['duplicate'] and result['priority'] == 'background' and result['status'] == 'started'
+    assert 'sync-industry-3' not in queues['interactive'].jobs
+    assert sched.store.holder('industry:3') == 'sync-industry-3|background'
+    assert sched.stats['promoted'] == 0
+
+
+def test_run_due_claims_only_due_pairs_once():
+    sched, queues = _scheduler()
+    now = 1_000_000.0
+    sched.mark_synced('assets', 1, now - 10, now - 3600)
+    sched.mark_synced('assets', 2, now + 600, now)
+    sched.mark_synced('industry', 1, None, now - 400)
+
+    results = sched.run_due(now, batch_size=1)
+
+    assert sorted(r['job_id'] for r in results) == ['sync-assets-1', 'sync-industry-1']
+    assert set(queues['background'].jobs) == {'sync-assets-1', 'sync-industry-1'}
+    assert queues['background'].jobs['sync-assets-1'].func.endswith('tasks.task_sync_assets')
+    # claimed pairs are leased, so the next tick doesn't pick them up again
+    assert sched.run_due(now + 1, batch_size=1) == []
+
+
+def test_run_due_batches_tokens_per_kind():
+    sched, queues = _scheduler()
+    now = 1_000_000.0
+    for token_id in range(1, 6):
+        sched.mark_synced('assets', token_id, None, now - 4000)
+    # token 5 already has its own job waiting
+    sched.enqueue('assets', 5, priority='interactive')
+
+    results = sched.run_due(now, batch_size=2)
+
+    batches = [r for r in results if not r['duplicate']]
+    assert [r['token_ids'] for r in batches] == [[1, 2], [3, 4]]
+    assert [r['job_id'] for r in results if r['duplicate']] == ['sync-assets-5']
+    jobs = [j for j in queues['background'].jobs.values()]
+    assert all(j.func.endswith('tasks.task_sync_tokens') for j in jobs)
+    assert jobs[0].args == ([1, 2], ('assets',))
+
+
+def test_lease_dedups_across_processes_and_batches():
+    from backend.app.scheduler import SyncScheduler
+
+    sched, queues = _scheduler()
+    # a second API process sharing the store and queues
+    other = SyncScheduler(store=sched.store, queues=queues, jitter=0.0)
+    now = 1_000_000.0
+    for token_id in (1, 2, 3):
+        sched.mark_synced('assets', token_id, None, now - 4000)
+
+    assert not other.enqueue('assets', 3, priority='background')['duplicate']
+    batches = sched.run_due(now, batch_size=5)
+    assert [r['token_ids'] for r in batches if not r['duplicate']] == [[1, 2]]
+    batch_id = batches[-1]['job_id']
+    assert batch_id.startswith('sync-batch-assets-')
+
+    # a pair inside a queued batch is not queued on its own, from either lane
+    dup = other.enqueue('assets', 1, priority='interactive')
+    assert dup['duplicate'] and dup['job_id'] == batch_id
+    assert 'sync-assets-1' not in queues['interactive'].jobs
+
+    # the batch syncs token 1, which releases its lease
+    sched.mark_synced('assets', 1)
+    assert not other.enqueue('assets', 1, priority='interactive')['duplicate']
+
+    # a job that failed without reporting back no longer holds its pair
+    queues['background'].jobs['sync-assets-3'].status = 'failed'
+    assert not sched.enqueue('assets', 3, priority='background')['duplicate']
+    assert sched.store.holder('assets:3') == 'sync-assets-3|background'
+
+
+def test_sync_tokens_runs_every_token_and_reports_failures(monkeypatch):
+    from backend.app import tasks
+
+    def assets(token_id, batch_size=None):
+        if token_id == 2:
+            raise RuntimeError('token revoked')
+        return {'inserted': token_id}
+
+    monkeypatch.setattr(tasks, 'SYNC_TASKS', {'assets': assets, 'industry': lambda t, b=None: {'inserted': 0}})
+
+    result = tasks.task_sync_tokens([1, 2, 3])
+
+    assert result['tokens'] == 3
+    assert result['results'][3] == {'assets': {'inserted': 3}, 'industry': {'inserted': 0}}
+    assert result['results'][2] == {'industry': {'inserted': 0}}
+    assert result['errors'] == {2: {'assets': 'RuntimeError: token revoked'}}
+
+
+def test_add_tokens_keeps_existing_due_times():
+    sched, _ = _scheduler(jitter=0.1)
+    now = 1_000_000.0
+    sched.mark_synced('assets', 1, now + 3000, now)
+    before = sched.due_at('assets', 1)
+
+    sched.add_tokens([1, 2], now)
+
+    assert sched.due_at('assets', 1) == before
+    assert now <= sched.due_at('assets', 2) <= now + 360
+    assert now <= sched.due_at('industry', 2) <= now + 30
+
+
+def test_load_token_ids_reads_tokens_table(sqlite_engine):
+    from backend.app.scheduler import load_token_ids
+
+    eng = sqlite_engine()
+    assert load_token_ids(eng) == []
+    with eng.begin() as conn:
+        conn.execute(text('CREATE TABLE esi_tokens (id INTEGER PRIMARY KEY)'))
+        conn.execute(text('INSERT INTO esi_tokens (id) VALUES (4), (5)'))
+    assert sorted(load_token_ids(eng)) == [4, 5]
+
+
+def test_industry_task_records_next_due_from_expires(monkeypatch, sqlite_engine):
+    from backend.app import tasks
+    from backend.app.services.cache import CachedResponse
+
+    sched, _ = _scheduler()
+    monkeypatch.setattr(tasks, 'scheduler', sched)
+    monkeypatch.setattr(tasks, 'engine', sqlite_engine())
+    expires = time.time() + 240
+    resp = CachedResponse([], {'Expires': formatdate(expires, usegmt=True), 'ETag': '"j"'}, 'hit')
+    monkeypatch.setattr(tasks, 'fetch_industry_jobs_response', lambda token_id: resp)
+
+    assert not tasks.task_sync_industry(9)['unchanged']
+    result = tasks.task_sync_industry(9)
+
+    assert result['unchanged']
+    assert abs(result['next_due'] - expires) < 1
+    assert sched.due_at('industry', 9) == result['next_due']
+
+
+def test_enqueue_routes_use_interactive_lane(monkeypatch):
+    from backend.app.main import app
+    from backend.app.routes import sync
+
+    sched, queues = _scheduler()
+    monkeypatch.setattr(sync, 'scheduler', sched)
+    client = TestClient(app)
+
+    r = client.post('/sync/enqueue/assets/11')
+    assert r.status_code == 200
+    assert r.json()['job_id'] == 'sync-assets-11' and not r.json()['duplicate']
+    assert client.post('/sync/enqueue/assets/11').json()['duplicate']
+    assert 'sync-assets-11' in queues['interactive'].jobs
+
+
+def test_sde_import_route_uses_cpu_queue_once(monkeypatch):
+    from backend.app.main import app
+    from backend.app.routes import sync
+
+    queue = FakeQueue('cpu')
+    monkeypatch.setattr(sync, 'cpu_queue', queue)
+    client = TestClient(app)
+
+    r = client.post('/sync/enqueue/sde-import', params={'force': True}).json()
+    assert r == {'status': 'queued', 'job_id': 'import-sde', 'duplicate': False}
+    job = queue.jobs['import-sde']
+    assert job.func.endswith('tasks.task_import_sde') and job.args == (True,)
+    # one import at a time
+    assert client.post('/sync/enqueue/sde-import').json()['duplicate']
+    job.status = 'finished'
+    assert not client.post('/sync/enqueue/sde-import').json()['duplicate']
@@ -0,0 +1,135 @@
+from sqlalchemy import create_engine, event, text
+
+
+def _engine_with_types():
+    eng = create_engine('sqlite://')
+    with eng.begin() as conn:
+        conn.execute(text("CREATE TABLE sde_types_norm (type_id bigint PRIMARY KEY, name text, group_id integer, market_group_id integer, volume numeric, portion_size integer, base_price numeric, data text)"))
+        conn.execute(text("INSERT INTO sde_types_norm (type_id, name, group_id, volume, base_price) VALUES (34, 'Tritanium', 18, 0.01, 2.0), (587, 'Rifter', 25, 27289, 15000)"))
+    return eng
+
+
+def _count_queries(eng):
+    statements = []
+    event.listen(eng, 'before_cursor_execute', lambda *a: statements.append(a[2]))
+    return statements
+
+
+def test_type_dictionary_loads_once():
+    from backend.app.sde import TypeDictionary
+
+    eng = _engine_with_types()
+    types = TypeDictionary(bind=eng)
+    statements = _count_queries(eng)
+
+    assert types.names([34, 587]) == {34: 'Tritanium', 587: 'Rifter'}
+    assert types.names([34]) == {34: 'Tritanium'}
+    assert len(statements) == 1
+    assert types.get(587)[1] == 25
+
+
+def test_type_dictionary_batches_unknown_ids():
+    from backend.app.sde import TypeDictionary
+
+    eng = _engine_with_types()
+    types = TypeDictionary(bind=eng)
+    types.get_many([34])
+    with eng.begin() as conn:
+        conn.execute(text("INSERT INTO sde_types_norm (type_id, name) VALUES (35, 'Pyerite')"))
+    statements = _count_queries(eng)
+
+    assert types.names([34, 35, 999999]) == {34: 'Tritanium', 35: 'Pyerite', 999999: None}
+    assert types.names([35, 999999]) == {35: 'Pyerite', 999999: None}
+    assert len(statements) == 1
+
+
+def test_type_dictionary_without_sde_table():
+    from backend.app.sde import TypeDictionary
+
+    types = TypeDictionary(bind=create_engine('sqlite://'))
+    assert types.names([34, None]) == {34: None}
+
+
+def test_snapshot_roundtrip(tmp_path):
+    from backend.app.sde_snapshot import write_snapshot, SdeSnapshot
+
+    rows = [(t, f'Type {t}', t % 7, t * 0.5, None) for t in range(1, 3000, 3)]
+    rows.append((350916020, 'Rare Skin', None, None, 12.5))
+    path = str(tmp_path / 'snap.bin')
+    assert write_snapshot(rows, path) == len(rows)
+
+    snap = SdeSnapshot(path)
+    assert len(snap) == len(rows)
+    assert snap.get(4) == ('Type 4', 4, 2.0, None)
+    assert snap.get(350916020) == ('Rare Skin', None, None, 12.5)
+    assert snap.name(2) is None
+    assert 5 not in snap
+    assert list(snap.type_ids[:3]) == [1, 4, 7]
+    snap.close()
+
+
+def test_type_dictionary_prefers_snapshot(tmp_path):
+    from backend.app.sde import TypeDictionary
+    from backend.app.sde_snapshot import write_snapshot
+
+    path = str(tmp_path / 'snap.bin')
+    write_snapshot([(34, 'Tritanium', 18, 0.01, 2.0)], path)
+    eng = create_engine('sqlite://')
+    statements = _count_queries(eng)
+    types = TypeDictionary(bind=eng, snapshot_path=path)
+
+    assert types.names([34]) == {34: 'Tritanium'}
+    assert statements == []
+
+
+def test_open_snapshot_missing_file(tmp_path):
+    from backend.app.sde_snapshot import open_snapshot
+
+    assert open_snapshot(str(tmp_path / 'nope.bin')) is None
+
+
+def test_version_watch_resets_registered_loaders(tmp_path):
+    from backend.app.sde import SdeVersionWatch, TypeDictionary
+    from backend.app.sde_snapshot import write_snapshot
+    from backend.app.services.api_cache import MemoryVersions
+
+    path = str(tmp_path / 'snap.bin')
+    write_snapshot([(34, 'Tritanium', 18, 0.01, 2.0)], path)
+    eng = _engine_with_types()
+    versions = MemoryVersions()
+    watch = SdeVersionWatch(versions, interval=0)
+    types, by_table = TypeDictionary(bind=eng, snapshot_path=path), TypeDictionary(bind=eng)
+    watch.register(types.reset)
+    watch.register(by_table.reset)
+
+    watch.check()
+    assert types.names([34]) == {34: 'Tritanium'}
+    assert by_table.names([34]) == {34: 'Tritanium'}
+
+    # an import rewrites the table and the snapshot, then bumps the version
+    write_snapshot([(34, 'Tritanium II', 18, 0.01, 2.0)], path)
+    with eng.begin() as conn:
+        conn.execute(text("UPDATE sde_types_norm SET name = 'Tritanium II' WHERE type_id = 34"))
+    watch.check()
+    assert types.names([34]) == {34: 'Tritanium'}
+    versions.bump('sde')
+    assert watch.check() == 1
+    assert types.names([34]) == {34: 'Tritanium II'}
+    assert by_table.names([34]) == {34: 'Tritanium II'}
+
+
+def test_version_watch_reads_at_most_once_per_interval():
+    from backend.app.sde import SdeVersionWatch
+    from backend.app.services.api_cache import MemoryVersions
+
+    versions = MemoryVersions()
+    watch = SdeVersionWatch(versions, interval=3600)
+    resets = []
+    watch.register(lambda: resets.append(1))
+
+    assert watch.check() == 0
+    versions.bump('sde')
+    assert watch.check() == 0 and resets == []
+    # a cached route that read the new version passes it straight on
+    watch.observe(1)
+    assert watch.version == 1 and resets == [1]
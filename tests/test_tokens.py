@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import sessionmaker
+
+
+def _setup(monkeypatch, sqlite_engine, expires_in):
+    from backend.app.services import tokens
+    from backend.app.models import Base, EsiToken
+    from backend.app.crypto import encrypt
+
+    eng = sqlite_engine()
+    Base.metadata.create_all(bind=eng)
+    Session = sessionmaker(bind=eng)
+    db = Session()
+    t = EsiToken(character_id=90000001, access_token_enc=encrypt('old-access'), refresh_token_enc=encrypt('refresh-1'),
+                 expires_at=datetime.utcnow() + timedelta(seconds=expires_in))
+    db.add(t)
+    db.commit()
+    token_id = t.id
+    db.close()
+
+    calls = []
+
+    def fake_sso(refresh):
+        calls.append(refresh)
+        return {'access_token': f'new-access-{len(calls)}', 'refresh_token': 'refresh-2', 'expires_in': 1200}
+
+    monkeypatch.setattr(tokens, 'SessionLocal', Session)
+    monkeypatch.setattr(tokens, '_sso_refresh', fake_sso)
+    provider = tokens.TokenProvider()
+    return provider, token_id, calls
+
+
+def test_valid_token_served_from_memory(monkeypatch, sqlite_engine):
+    provider, token_id, calls = _setup(monkeypatch, sqlite_engine, expires_in=1200)
+    try:
+        assert provider.get(token_id) == ('old-access', 90000001)
+        assert provider.get(token_id) == ('old-access', 90000001)
+    finally:
+        provider.stop()
+    assert provider.stats['loads'] == 1
+    assert provider.stats['hits'] == 1
+    assert calls == []
+
+
+def test_expired_token_refreshed_once(monkeypatch, sqlite_engine):
+    provider, token_id, calls = _setup(monkeypatch, sqlite_engine, expires_in=-10)
+    try:
+        assert provider.get(token_id) == ('new-access-1', 90000001)
+        assert provider.get(token_id) == ('new-access-1', 90000001)
+    finally:
+        provider.stop()
+    assert calls == ['refresh-1']
+
+
+def test_refresh_due_picks_up_expiring_tokens(monkeypatch, sqlite_engine):
+    provider, token_id, calls = _setup(monkeypatch, sqlite_engine, expires_in=60)
+    try:
+        # inside the refresh margin but not expired: get() refreshes proactively
+        provider.get(token_id)
+        assert calls == ['refresh-1']
+        from backend.app.services import tokens
+        from backend.app.models import EsiToken
+        db = tokens.SessionLocal()
+        db.query(EsiToken).filter(EsiToken.id == token_id).update({'expires_at': datetime.utcnow() + timedelta(seconds=30)})
+        db.commit()
+        db.close()
+        provider._load(token_id)
+        assert provider.refresh_due() == [token_id]
+    finally:
+        provider.stop()
+    assert len(calls) == 2
+    assert provider.get(token_id)[0] == 'new-access-2'
+
+
+def test_refresh_skips_sso_when_another_process_already_did(monkeypatch, sqlite_engine):
+    provider, token_id, calls = _setup(monkeypatch, sqlite_engine, expires_in=1200)
+    try:
+        entry = provider.refresh(token_id)
+    finally:
+        provider.stop()
+    assert calls == []
+    assert entry['access'] == 'old-access'
+
+
+def test_refresh_unknown_token(monkeypatch, sqlite_engine):
+    from backend.app.services.tokens import TokenError
+
+    provider, _, _ = _setup(monkeypatch, sqlite_engine, expires_in=1200)
+    try:
+        provider.refresh(424242, force=True)
+        assert False, 'expected TokenError'
+    except TokenError as e:
+        assert e.status_code == 404
+    finally:
+        provider.stop()
@@ -0,0 +1,72 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from backend.app.engines import valuation
+from backend.app.sde import TypeDictionary
+
+
+def _types_engine(sqlite_engine):
+    eng = sqlite_engine()
+    with eng.begin() as conn:
+        conn.execute(text("CREATE TABLE sde_types_norm (type_id INTEGER PRIMARY KEY, name TEXT, group_id INTEGER, volume REAL, base_price REAL)"))
+        conn.execute(text("INSERT INTO sde_types_norm VALUES (34, 'Tritanium', 18, 0.01, 2.0), (35, 'Pyerite', 18, 0.01, 8.0)"))
+    return eng
+
+
+def test_value_by_location_prefers_market_then_base_price(monkeypatch, sqlite_engine):
+    eng = _types_engine(sqlite_engine)
+    monkeypatch.setattr(valuation, 'sde_types', TypeDictionary(bind=eng))
+    prices = valuation.PriceTable.from_market([
+        {'type_id': 34, 'average_price': 5.0, 'adjusted_price': 4.0},
+        {'type_id': 36, 'adjusted_price': 100.0},
+    ])
+    v = valuation.value_by_location(
+        type_ids=[34, 35, 36, 99, 34],
+        location_ids=[1, 1, 2, 2, 2],
+        quantities=[10, 2, 1, 7, 4],
+        prices=prices,
+    )
+    assert v['location_id'].tolist() == [1, 2]
+    assert v['value'].tolist() == [10 * 5.0 + 2 * 8.0, 100.0 + 4 * 5.0]
+    assert v['items'].tolist() == [2, 3]
+    assert v['unpriced'].tolist() == [0, 1]
+
+
+def test_refresh_character_valuation_and_net_worth(monkeypatch, sqlite_engine):
+    from backend.app import tasks
+
+    # separate engine: with StaticPool, SDE lookups would roll back the valuation transaction
+    monkeypatch.setattr(valuation, 'sde_types', TypeDictionary(bind=_types_engine(sqlite_engine)))
+    eng = _types_engine(sqlite_engine)
+    with eng.connect() as conn:
+        assert valuation.net_worth(conn) == 0.0
+    with eng.begin() as conn:
+        tasks._ensure_assets_table(conn, 'sqlite')
+        conn.execute(text("INSERT INTO esi_assets (character_id, item_id, type_id, location_id, quantity) VALUES (1, 1, 34, 60003760, 100), (1, 2, 35, 60008494, 10), (2, 3, 34, 60003760, 1)"))
+        first = valuation.refresh_character_valuation(conn, 1)
+        valuation.refresh_character_valuation(conn, 2)
+        conn.execute(text("DELETE FROM esi_assets WHERE item_id = 2"))
+        second = valuation.refresh_character_valuation(conn, 1)
+
+    assert first == {'character_id': 1, 'locations': 2, 'value': 280.0, 'unpriced': 0}
+    assert second['locations'] == 1
+    with eng.connect() as conn:
+        assert valuation.net_worth(conn, 1) == 200.0
+        assert valuation.net_worth(conn) == 202.0
+
+
+def test_overview_reads_materialized_net_worth(monkeypatch, sqlite_engine):
+    from backend.app.main import app
+    from backend.app.routes import dashboard
+    from backend.app.services.api_cache import ApiCache
+
+    eng = _types_engine(sqlite_engine)
+    with eng.begin() as conn:
+        valuation._ensure_valuations_table(conn, 'sqlite')
+        conn.execute(text("INSERT INTO asset_valuations (character_id, location_id, items, quantity, value, unpriced) VALUES (1, 1, 1, 1, 1500.5, 0), (2, 1, 1, 1, 10, 0)"))
+    monkeypatch.setattr(dashboard, 'engine', eng)
+    monkeypatch.setattr(dashboard, 'api_cache', ApiCache())
+
+    client = TestClient(app)
+    assert client.get('/dashboard/overview', params={'character_id': 1}).json()['net_worth'] == 1500.5
+    assert client.get('/dashboard/overview').json()['net_worth'] == 1510.5
@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import signal
+
+
+def _idle(queues, name):
+    # stands in for an rq.Worker: warm shutdown on SIGTERM
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    while True:
+        time.sleep(0.02)
+
+
+def _wait(pred, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not pred() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return pred()
+
+
+def test_plan_pools_splits_esi_and_cpu():
+    from backend.worker import plan_pools, ESI_QUEUES, CPU_QUEUES
+
+    assert plan_pools(8) == {'esi': (ESI_QUEUES, 6), 'cpu': (CPU_QUEUES, 2)}
+    assert plan_pools(8, cpu_processes=3)['esi'][1] == 5
+    # both pools always have a process
+    assert plan_pools(1) == {'esi': (ESI_QUEUES, 1), 'cpu': (CPU_QUEUES, 1)}
+    assert plan_pools(4, cpu_processes=10)['esi'][1] == 1
+
+
+def test_supervisor_respawns_dead_workers_and_stops():
+    from backend.worker import Supervisor
+
+    sup = Supervisor({'esi': (['a'], 2), 'cpu': (['b'], 1)}, target=_idle)
+    sup.start()
+    try:
+        assert _wait(lambda: sup.alive() == 3)
+        victim, _ = sup.procs[('esi', 1)]
+        os.kill(victim.pid, signal.SIGKILL)
+        assert _wait(lambda: not victim.is_alive())
+
+        # a crash right after start waits out MIN_UPTIME before it is replaced
+        assert sup.reap() == 0
+        assert sup.reap(now=time.monotonic() + 60) == 1
+        assert sup.procs[('esi', 1)][0].pid != victim.pid
+        assert _wait(lambda: sup.alive() == 3)
+    finally:
+        sup.stop(timeout=5)
+    assert sup.alive() == 0
+    assert sup.stats['respawned'] == 1
+
+
+def test_restart_replaces_every_worker():
+    from backend.worker import Supervisor
+
+    sup = Supervisor({'esi': (['a'], 2)}, target=_idle)
+    sup.start()
+    try:
+        assert _wait(lambda: sup.alive() == 2)
+        time.sleep(0.1)
+        old = {p.pid for p, _ in sup.procs.values()}
+        sup.restart()
+        assert _wait(lambda: sup.alive() == 0)
+        assert sup.reap() == 2
+        assert _wait(lambda: sup.alive() == 2)
+        assert old.isdisjoint(p.pid for p, _ in sup.procs.values())
+    finally:
+        sup.stop(timeout=5)
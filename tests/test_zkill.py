@@ -0,0 +1,167 @@
+import asyncio
+import json
+import time
+
+from backend.app.services import zkill
+
+NOW = time.time()
+
+
+def _km(kid, age_s, region, ship, value=1e6, system=None):
+    return {'killID': kid, 'zkb': {'totalValue': value},
+            'killmail': {'killmail_id': kid, 'killmail_time': NOW - age_s, 'solar_system_id': system,
+                         'region_id': region, 'victim': {'ship_type_id': ship}}}
+
+
+def test_normalize_redisq_package():
+    k = zkill.normalize({'killID': 5, 'zkb': {'totalValue': 12.5},
+                         'killmail': {'killmail_time': '2024-01-01T00:00:00Z', 'solar_system_id': 30000142,
+                                      'victim': {'ship_type_id': 587}}})
+    assert k == {'killmail_id': 5, 'time': 1704067200.0, 'solar_system_id': 30000142, 'region_id': None,
+                 'type_id': 587, 'value': 12.5}
+
+
+def test_rolling_window_counts_and_expiry():
+    agg = zkill.KillAggregator(bucket_seconds=600, window_hours=2)
+    assert agg.size == 12
+    for kid, age, ship in [(1, 60, 587), (2, 120, 587), (3, 4000, 587), (4, 4000, 670), (5, 9000, 670)]:
+        agg.add(zkill.normalize(_km(kid, age, 10000002, ship)), now=NOW)
+    agg.add(zkill.normalize(_km(1, 60, 10000002, 587)), now=NOW)
+    assert agg.stats == {'added': 4, 'duplicates': 1, 'expired': 1, 'unlocated': 0}
+
+    assert agg.top_types(10000002, hours=0.5, now=NOW) == [{'type_id': 587, 'kills': 2, 'value': 2e6}]
+    top = agg.top_types(10000002, hours=2, now=NOW)
+    assert [(t['type_id'], t['kills']) for t in top] == [(587, 3), (670, 1)]
+    assert agg.totals(10000003, hours=2, now=NOW) == {'kills': 0, 'value': 0}
+    # two hours later everything has rolled out of the window
+    assert agg.top_types(10000002, hours=2, now=NOW + 7200 + 600) == []
+
+
+def test_ingester_maps_systems_and_reads_file(tmp_path):
+    path = tmp_path / 'kills.ndjson'
+    path.write_text(''.join(json.dumps(_km(i, 30, None, 587, system=30000142)) + '\n' for i in range(3)))
+    agg = zkill.KillAggregator()
+    ingester = zkill.ZKillIngester(zkill.FileSource(str(path)), agg, system_regions={30000142: 10000002})
+
+    async def go():
+        first = await ingester.step()
+        with open(path, 'a') as f:
+            f.write(json.dumps(_km(9, 30, 10000043, 670)) + '\n')
+        return first, await ingester.step(), await ingester.step()
+
+    assert asyncio.run(go()) == (3, 1, 0)
+    assert agg.totals(10000002, 1)['kills'] == 3
+    assert agg.totals(10000043, 1)['kills'] == 1
+
+
+def test_recent_losses_answers_from_memory(monkeypatch):
+    agg = zkill.KillAggregator()
+    monkeypatch.setattr(zkill, 'kill_stats', agg)
+    source = zkill.FakeSource([_km(i, 0, 10000002, 587 if i % 3 else 670, value=100) for i in range(1, 10)], batch=4)
+    ingester = zkill.ZKillIngester(source, agg, system_regions={})
+
+    async def go():
+        while await ingester.step():
+            pass
+        return await zkill.recent_losses(10000002, hours=1, limit=1)
+
+    out = asyncio.run(go())
+    assert out['kills'] == 9 and out['value'] == 900
+    assert out['top_types'] == [{'type_id': 587, 'kills': 6, 'value': 600.0}]
+
+
+class FakeRedis:
+    """The slice of redis.Redis the shared aggregator uses (strings and hashes, no expiry)."""
+
+    def __init__(self):
+        self.strings, self.hashes, self.expiry = {}, {}, {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.strings:
+            return None
+        self.strings[key] = value
+        return True
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    def execute(self):
+        out = []
+        for name, args in self.calls:
+            h = self.redis.hashes.setdefault(args[0], {})
+            if name in ('hincrby', 'hincrbyfloat'):
+                num = int if name == 'hincrby' else float
+                h[args[1].encode()] = str(num(h.get(args[1].encode(), 0)) + args[2]).encode()
+                out.append(None)
+            elif name == 'expireat':
+                self.redis.expiry[args[0]] = args[1]
+                out.append(True)
+            elif name == 'hgetall':
+                out.append(dict(h))
+        self.calls = []
+        return out
+
+
+def test_shared_aggregator_is_read_by_every_process():
+    redis = FakeRedis()
+    ingesting = zkill.RedisKillAggregator(redis=redis, bucket_seconds=600, window_hours=2)
+    api = zkill.RedisKillAggregator(redis=redis, bucket_seconds=600, window_hours=2)
+    for kid, age, ship in [(1, 60, 587), (2, 120, 587), (3, 4000, 670), (4, 9000, 670)]:
+        ingesting.add(zkill.normalize(_km(kid, age, 10000002, ship)), now=NOW)
+    # another process seeing the same killmail doesn't count it twice
+    assert not api.add(zkill.normalize(_km(1, 60, 10000002, 587)), now=NOW)
+    assert ingesting.stats == {'added': 3, 'duplicates': 0, 'expired': 1, 'unlocated': 0}
+
+    top = api.top_types(10000002, hours=2, now=NOW)
+    assert top == [{'type_id': 587, 'kills': 2, 'value': 2e6}, {'type_id': 670, 'kills': 1, 'value': 1e6}]
+    assert api.totals(10000003, hours=2, now=NOW) == {'kills': 0, 'value': 0}
+    # each bucket expires once it has left the window
+    bucket = int((NOW - 60) // 600)
+    assert redis.expiry[f'zkill:{bucket}:10000002'] == (bucket + 13) * 600
+
+
+def test_malformed_lines_and_packages_are_skipped(tmp_path):
+    path = tmp_path / 'kills.ndjson'
+    lines = [json.dumps(_km(1, 30, 10000002, 587)), '{"truncated": ', json.dumps(_km(2, 30, 10000002, 587)),
+             json.dumps({'killID': 3, 'killmail': {'killmail_time': 'not a time'}}), json.dumps(_km(4, 30, 10000002, 670))]
+    path.write_text(''.join(line + '\n' for line in lines))
+    agg = zkill.KillAggregator()
+    source = zkill.FileSource(str(path))
+    ingester = zkill.ZKillIngester(source, agg, system_regions={})
+
+    assert asyncio.run(ingester.step()) == 4
+    assert source.stats['malformed'] == 1 and ingester.stats['malformed'] == 1
+    assert agg.totals(10000002, 1)['kills'] == 3
+
+
+def test_recent_losses_reads_the_shared_aggregator_off_the_event_loop(monkeypatch):
+    import threading
+
+    redis = FakeRedis()
+    agg = zkill.RedisKillAggregator(redis=redis)
+    agg.add(zkill.normalize(_km(1, 60, 10000002, 587)))
+    threads = set()
+    pipeline = redis.pipeline
+
+    def recording(transaction=True):
+        threads.add(threading.get_ident())
+        return pipeline(transaction)
+
+    redis.pipeline = recording
+    monkeypatch.setattr(zkill, 'kill_stats', agg)
+
+    async def go():
+        return threading.get_ident(), await zkill.recent_losses(10000002, hours=1)
+
+    loop_thread, out = asyncio.run(go())
+    assert out['kills'] == 1
+    assert threads and loop_thread not in threads